@@ -1,26 +1,27 @@
 # -*- coding: utf-8 -*-
 """
 All the functions used by the scripts correction1 are stored in this python file. 
+The functions of the analysis pass their messages to log (keyword, default print), a function with the signature of print.
 File created on december 2018 by Leonardo Chiappisi
 """
 import numpy as np
 #import pandas as pd
 import os
+import re
 import sys
-from math import log
-from scipy import interpolate, integrate
-from scipy.stats import linregress
-import matplotlib.pyplot as plt
-import scipy
-if scipy.__version__<'1.8':
-    print('must have scipy version 1.8 or greater to estimate error on CP and DH')
+import time
+import math
+import dsc_cache
+import dsc_read
+from concurrent.futures import ThreadPoolExecutor
+import scipy #the scipy subpackages are imported by the functions using them, to keep the import of DSC1 fast.
 
-encodings = [ 'utf-8', 'utf-16', 'latin1', 'cp1252']
+EC_SCALE_HEATING = 0.73 #factor of the empty cell subtracted from heating runs corrected only for the empty cell, as in the previous versions.
 
 
 
 
-def read_files(version, date, sample, header_heating, header_cooling):
+def read_files(version, date, sample, header_heating, header_cooling, log=print):
     ''' Function which imports all needed data: heating and cooling cycles as well as correction files: 
     Buffer-buffer thermograms and empty cell corrections. The name of the files are stored in the sample dictionary. 
     '''
@@ -57,36 +58,36 @@ def read_files(version, date, sample, header_heating, header_cooling):
 
 
     
-    print(15*'*', 'DATA INPUT', 15*'*')
-    print(s, '\n')
+    log(15*'*', 'DATA INPUT', 15*'*')
+    log(s, '\n')
     
-    print(15*'*', 'DATA Correction', 15*'*')
+    log(15*'*', 'DATA Correction', 15*'*')
     if len(files['B_heating']) > 0 and len(files['EC_heating']) > 0:
-        print('Heating curves will be corrected by empty cell and buffer-buffer experiments. \n')
+        log('Heating curves will be corrected by empty cell and buffer-buffer experiments. \n')
         sh += '# Heating curves were corrected by empty cell {} and buffer-buffer experiments {}. \n'.format(files['EC_heating'], files['B_heating'])
     if len(files['B_heating']) > 0 and len(files['EC_heating']) == 0:
-        print('Heating curves will be corrected by buffer-buffer experiments')
+        log('Heating curves will be corrected by buffer-buffer experiments')
         sh += '# Heating curves were corrected by buffer-buffer experiments {}'.format(files['B_heating'])
     if len(files['B_heating']) == 0 and len(files['EC_heating']) > 0:
-        print('Heating curves will be corrected by empty cell experiments. \n')
+        log('Heating curves will be corrected by empty cell experiments. \n')
         sh += '# Heating curves were corrected by empty cell {} experiments \n'.format(files['EC_heating'])
     if len(files['B_heating']) == 0 and len(files['EC_heating']) == 0:
-        print('Heating curves will not be corrected with reference measurements. \n')
+        log('Heating curves will not be corrected with reference measurements. \n')
         sh += '# Heating curves were not corrected with reference measurements. \n'
     if len(files['B_cooling']) > 0 and len(files['EC_cooling']) > 0:
-        print('Cooling curves will be corrected by empty cell and buffer-buffer experiments')
+        log('Cooling curves will be corrected by empty cell and buffer-buffer experiments')
         sc += '# Cooling curves were corrected by empty cell {} and buffer-buffer experiments {}. \n'.format(files['EC_cooling'], files['B_cooling'])
     if len(files['B_cooling']) > 0 and len(files['EC_cooling']) == 0:
-        print('Cooling curves will be corrected by buffer-buffer experiments')
+        log('Cooling curves will be corrected by buffer-buffer experiments')
         sc += '# Cooling curves were corrected by buffer-buffer experiments {}. \n'.format(files['B_cooling'])
     if len(files['B_cooling']) == 0 and len(files['EC_cooling']) > 0:
-        print('Cooling curves will be corrected by empty cell experiments')
+        log('Cooling curves will be corrected by empty cell experiments')
         sc += '# Cooling curves were corrected by empty cell {} experiments. \n'.format(files['EC_cooling'])
     if len(files['B_cooling']) == 0 and len(files['EC_cooling']) == 0:
-        print('Cooling curves will not be corrected with reference measurements')
+        log('Cooling curves will not be corrected with reference measurements')
         sc += '# Cooling curves were not corrected with reference measurements. \n'
     
-    print('\n')
+    log('\n')
     
     for key in files:
         if 'S_heating' in key:
@@ -100,17 +101,17 @@ def read_files(version, date, sample, header_heating, header_cooling):
 
 
 
-def read_params(input_data, header_heating, header_cooling):
+def read_params(input_data, header_heating, header_cooling, log=print):
     '''Function which reads the parameter input firles and extracts all relevant informations, i.e., sample mass, mw, temperature
     region of interests, regions where the baseline will be evaluated, etc.    
     '''    
-    print(15*'*', 'Input Parameters', 15*'*')
+    log(15*'*', 'Input Parameters', 15*'*')
     params = {}
     for item in input_data:
         if 'runs' not in item:
             params[item] = input_data[item]
             s = 'Input parameter {} read correctly as {}'.format(item, params[item])
-            print(s)
+            log(s)
             
  
     #### Checks if datafile and folder exist.
@@ -164,213 +165,351 @@ def extract_data(files, params, header_heating, header_cooling, *args, **kwargs)
     
     All file definitions are given in the readme file.
     Availabe data formats are: Setaram3, Setaram4, 3cols, Setaram3temptime
+    Messages are passed to log (keyword, default print).
     '''
-    print(15*'*', 'Reading data files', 15*'*')
+    log = kwargs.get('log', print)
+    log(15*'*', 'Reading data files', 15*'*')
     data = {} #Creation of empty dictionary, where the datasets will be stored, indexed by their filename. 
     dataraw = {} #Creation of empty dictionary, where the datasets will be stored, indexed by their filename. 
     data_uncut = {} #Creation of empty dictionary, where the normalized, binned data will be stored, indexed by their filename. 
-    for key in files: 
-        for j in files[key]: #the two for loops run over all files defined in the file_input definition file. 
-            if j:  #this if sentence is made to avoid trying to read empty key values. 
-                if params['Dataformat'] == 'Setaram3':
-                    for code in encodings:
-                        try:
-                            with open(os.path.join(params['Folder'], str(j)), 'r', errors='replace', encoding=code) as inp:
-                                hl = 1 #length of the header of the file to be read. 
-                                line = inp.readline()
-                                while 'Furnace' not in line.split():
-                                    line = inp.readline()
-                                    hl += 1
-                                    if hl > 500:
-                                        raise Exception('Cannot import datafile {} correctly. Ensure the encoding is set correctly. Current encoding is {}.'.format(j, code))
-                            tmp = np.genfromtxt(os.path.join(params['Folder'], str(j)), skip_header=hl+1, skip_footer=2, unpack=True, usecols=(0,1,2), encoding=code) #imports all data stored in files
-                            print('File {} opened with {} encoding.'.format(str(j), code))
-                            break
-                        except:
-                            None
-#                            print('Tried to open the file {} with {} encoding. Failed.'.format(str(j), code))
-                            
-                elif params['Dataformat'] == 'Setaram3temptime':
-                    for code in encodings:
-                        try:
-                            with open(os.path.join(params['Folder'], str(j)), 'r', errors='replace', encoding=code) as inp:
-                                hl = 1 #length of the header of the file to be read. 
-                                line = inp.readline()
-                                while 'Furnace' not in line.split():
-                                    line = inp.readline()
-                                    hl += 1
-                                    if hl > 500:
-                                        raise Exception('Cannot import datafile {} correctly. Ensure the encoding is set correctly. Current encoding is {}.'.format(j, code))
-                            tmp = np.genfromtxt(os.path.join(params['Folder'], str(j)), skip_header=hl+1, skip_footer=2, unpack=True, usecols=(1,0,2), encoding=code) #imports all data stored in files
-                            print('File {} opened with {} encoding.'.format(str(j), code))
-                            break
-                        except:
-                            None
-#                            print('Tried to open the file {} with {} encoding. Failed.'.format(str(j), code))
-                
-                elif params['Dataformat'] == 'Setaram4':
-                    for code in encodings:
-                        try:
-                            with open(os.path.join(params['Folder'], str(j)), 'r', errors='replace', encoding=code) as inp:
-                                hl = 1 #length of the header of the file to be read. 
-                                line = inp.readline()
-                                while 'Furnace' not in line.split():
-                                    line = inp.readline()
-                                    hl += 1
-                                    if hl > 500:
-                                        raise Exception('Cannot import datafile {} correctly. Ensure the encoding is set correctly. Current encoding is {}.'.format(j, code))
-                            tmp = np.genfromtxt(os.path.join(params['Folder'], str(j)), skip_header=hl+1, skip_footer=2, unpack=True, usecols=(1,2,3), encoding=code) #imports all data stored in files
-                            print('File {} opened with {} encoding.'.format(str(j), code))
-                            break
-                        except:
-                            None
-#                            print('Tried to open the file {} with {} encoding. Failed.'.format(str(j), code))
-                    
-                elif params['Dataformat'] == '3cols':
-                    for code in encodings:
-                        try:
-                            # print('Trying to load {} with encoder {}.'.format(str(j), code))
-                            hl = 1 #length of the header of the file to be read. 
-                            tmp = np.genfromtxt(os.path.join(params['Folder'], str(j)), skip_header=hl, skip_footer=2, unpack=True, usecols=(0,1,2), encoding=code) #imports all data stored in files
-                            print('File {} opened with {} encoding.'.format(str(j), code))
-                            print(tmp)
-                            break
-                        except:
-                            None
-                            
-                elif params['Dataformat'] == '3cols_variable_header':
-                    for code in encodings:
-                        print('Trying to load {} with encoder {}.'.format(str(j), code))
-                        try:
-                            
-                            hl = int(params['Header_length']) #length of the header of the file to be read. 
-                            tmp = np.genfromtxt(os.path.join(params['Folder'], str(j)), skip_header=hl, skip_footer=2, unpack=True, usecols=(0,1,2), encoding=code) #imports all data stored in files
-                            print('File {} opened with {} encoding.'.format(str(j), code))
-                            break
-                        except:
-                            None
-                            
-                elif params['Dataformat'] == '3cols_variable_header_temp_power_time':
-                    for code in encodings:
-                        try:
-                            hl = int(params['Header_length']) #length of the header of the file to be read. 
-                            tmp = np.genfromtxt(os.path.join(params['Folder'], str(j)), skip_header=hl, skip_footer=2, unpack=True, usecols=(2,0,1), encoding=code) #imports all data stored in files
-                            print('File {} opened with {} encoding.'.format(str(j), code))
-                            break
-                        except:
-                            None
-                            
-                elif params['Dataformat'] == '4cols_variable_header':
-                    for code in encodings:
-                        try:
-                            hl = int(params['Header_length']) #length of the header of the file to be read. 
-                            tmp = np.genfromtxt(os.path.join(params['Folder'], str(j)), skip_header=hl, skip_footer=2, unpack=True, usecols=(1,2,3), encoding=code) #imports all data stored in files
-                            print('File {} opened with {} encoding.'.format(str(j), code))
-                            break
-                        except:
-                            None
-#                            print('Tried to open the file {} with {} encoding. Failed.'.format(str(j), code))                    
-                
-                elif params['Dataformat'] == 'TA_temp_power_time':
-                    for code in encodings:
-                        try:
-                            hl = 1 #length of the header of the file to be read.
-                            tmp = np.genfromtxt(os.path.join(params['Folder'], str(j)), skip_header=hl, skip_footer=2, unpack=True, usecols=(2,0,1), encoding=code) #imports all data stored in files
-                            print('File {} opened with {} encoding.'.format(str(j), code))
-                            break
-                        except:
-                            None
-                            # print('Tried to open the file {} with {} encoding. Failed.'.format(str(j), code))
-                    # print(tmp)
-                    # try:        
-                        # tmp[2,:] /= 1000 #conversion from uWatt into mW 
-                    # except UnboundLocalError:
-                        # sys.exit('Error loading the input files.')
-
-                try:
-                    _ = tmp.shape
-                except UnboundLocalError:
-                    sys.exit('Error loading the input files. Try to change the dataformat in the dsc_input file.')
-                    
-                if 'heating' in key:
-                    mask = ((float(params['ROI_h'][0]) < tmp[1,:]) & (float(params['ROI_h'][1]) > tmp[1,:])) #defines a mask with the points where the temperature is in the region of interest. 
-                    if any(mask): None
-                    else: raise Exception('The selected region of interest in the heating curve is not compatible with the range of temperature of the data, going from {} to {} degC'.format(np.min(tmp[1,:]), np.max(tmp[1,:])))
-                elif 'cooling' in key:
-                    mask = ((float(params['ROI_c'][0]) < tmp[1,:]) & (float(params['ROI_c'][1]) > tmp[1,:])) #defines a mask with the points where the temperature is in the region of interest. 
-                    if any(mask): None
-                    else: raise Exception('The selected region of interest in the cooling curve is not compatible with the range of temperature of the data, going from {} to {} degC'.format(np.min(tmp[1,:]), np.max(tmp[1,:])))
-                tmp2 = tmp[:,mask].copy() #creates the data array with only the relevant data points. Whatever is outside the region of interest, is not used any longer.                 
-                tmp_uncut = tmp.copy()
-
-                # print(tmp2)
-                
-                if params['Input'] != params['Output']: #renormalized from exo-up to exo-down convention, or viceversa. 
-                    tmp2[2,:] *= -1
-                    tmp_uncut[2,:] *= -1
-                
-                if params['unit_time'] == 'min': #Converts time from minutes to seconds
-                    tmp2[0,:] *= 60
-                    tmp_uncut[0,:] *= 60
+    if dsc_cache.cache_mode(params) == 'clear': #cached raw data files are deleted and read again. 
+        dsc_cache.clear(dsc_cache.cache_dir(params), log)
+    runs = [(key, j) for key in files for j in files[key] if j]  #all files defined in the file_input definition file. Empty key values are skipped.
+    workers = int(kwargs.get('workers', params.get('Read_workers', 1 if lean(params) else 4))) #threads reading the files, optional key Read_workers. In the lean mode the files are read one at a time by default, so that a single file is parsed at once.
+    times = kwargs.get('times') #optional dictionary filled with the reading time of each file, used by dsc_profile.
+    def timed_read(key, j, log=log):
+        t0 = time.perf_counter()
+        if key.startswith('EC_') or key.startswith('B_'): #reference runs are shared by the samples using them, see dsc_cache.load_reference.
+            result = dsc_cache.load_reference(os.path.join(params['Folder'], str(j)), key, params, lambda: read_run(key, j, params, log), log)
+        else:
+            result = read_run(key, j, params, log)
+        if times is not None: times[j] = time.perf_counter() - t0
+        return result
+    jobs = None
+    if workers > 1 and len(runs) > 1: #files are read, cut and binned in parallel. Messages are printed in the order of the files.
+        logs = [[] for run in runs]
+        with ThreadPoolExecutor(max_workers=min(workers, len(runs))) as pool:
+            jobs = [pool.submit(timed_read, key, j, logs[n].append) for n, (key, j) in enumerate(runs)]
+        
+    for n, (key, j) in enumerate(runs):
+        if jobs is None:
+            data_set, tmp2, data_set_uncut, code = timed_read(key, j)
+        else:
+            for message in logs[n]: log(message)
+            data_set, tmp2, data_set_uncut, code = jobs[n].result()
+        data[j] = data_set
+        dataraw[j] = tmp2
+        data_uncut[j] = data_set_uncut
+        
+        log('Datafile {} read correctly'.format(j))
+
+        if 'S_heating' in key:
+            for file in files[key]:
+                header_heating[file] += '# Dafile read in format {} with encoding {} \n'.format(params['Dataformat'], code)
+        if 'S_cooling' in key:
+            for file in files[key]:
+                header_cooling[file] += '# Dafile read in format {} with encoding {} \n'.format(params['Dataformat'], code)
                 
-                if params['unit_power'] == 'uW': #Converts the heatflow from uW into mW
-                    tmp2[2,:] /= 1000
-                    tmp_uncut[2,:] /= 1000
-                    
-                if params['unit_power'] == 'W': #Converts the heatflow from W into mW
-                    tmp2[2,:] *= 1000
-                    tmp_uncut[2,:] *= 1000
+    log('\n')
+    return data, dataraw, data_uncut #a dictionary containing all data, already cut, binned, and with the heatrate calculated. 
 
-                if 'cooling' in key:
 
-                    tmp_uncut = tmp_uncut[:,tmp_uncut[1,:]<np.nanmax(tmp_uncut[1,:])-5.0] #discarding the first five degrees of the curve
-                    tmp2 = np.flip(tmp2, axis=1)
-                    tmp_uncut = np.flip(tmp_uncut, axis=1)
-                else:
-                    tmp_uncut = tmp_uncut[:,tmp_uncut[1,:]>np.nanmin(tmp_uncut[1,:])+5.0] #discarding the first five degrees of the curve
-                
-                
-                
-                
-                data_set = binning(tmp2, params)  #the data are binned according to the size defined by bins. No binning is performed if binsize is 1 or less. 
-                data_set_uncut = binning(tmp_uncut, params)  #the data are binned according to the size defined by bins. No binning is performed if binsize is 1 or less. 
-                
+def read_run(key, j, params, log=print):
+    ''' Reads the datafile j of the files group key (e.g. S_heating), cuts it to the region of interest, converts the units and bins it. 
+    Returns the binned data, the cut data before binning (dataraw), the binned data on the full temperature range and the encoding of the file.
+    Messages are passed to log. If the optional key Stream is set, the file is read in chunks by read_run_stream.'''
+    chunk_lines = stream_lines(params)
+    if chunk_lines:
+        return read_run_stream(key, j, params, chunk_lines, log)
+    try:
+        tmp, code = dsc_cache.load(os.path.join(params['Folder'], str(j)), params, log, dsc_read.load_chunked if lean(params) else dsc_read.load) #imports all data stored in files, or maps them from the cache
+        log('File {} opened with {} encoding.'.format(str(j), code))
+    except (KeyError, ValueError) as e: #the dataformat is not known or the file is not compatible with it.
+        log(str(e))
+        sys.exit('Error loading the input files. Try to change the dataformat in the dsc_input file.')
+        
+    if 'heating' in key:
+        mask = ((float(params['ROI_h'][0]) < tmp[1,:]) & (float(params['ROI_h'][1]) > tmp[1,:])) #defines a mask with the points where the temperature is in the region of interest. 
+        if np.any(mask): None
+        else: raise Exception('The selected region of interest in the heating curve is not compatible with the range of temperature of the data, going from {} to {} degC'.format(np.min(tmp[1,:]), np.max(tmp[1,:])))
+    elif 'cooling' in key:
+        mask = ((float(params['ROI_c'][0]) < tmp[1,:]) & (float(params['ROI_c'][1]) > tmp[1,:])) #defines a mask with the points where the temperature is in the region of interest. 
+        if np.any(mask): None
+        else: raise Exception('The selected region of interest in the cooling curve is not compatible with the range of temperature of the data, going from {} to {} degC'.format(np.min(tmp[1,:]), np.max(tmp[1,:])))
+    if lean(params):
+        return read_run_lean(key, tmp, mask, code, params)
+    tmp2 = tmp[:,mask].copy() #creates the data array with only the relevant data points. Whatever is outside the region of interest, is not used any longer.                 
+    tmp_uncut = tmp.copy()
+    
+    tmp2 = convert_units(tmp2, params)
+    tmp_uncut = convert_units(tmp_uncut, params)
+    
+    if 'cooling' in key:
+        tmp_uncut = tmp_uncut[:,tmp_uncut[1,:]<np.nanmax(tmp_uncut[1,:])-5.0] #discarding the first five degrees of the curve
+        tmp2 = np.flip(tmp2, axis=1)
+        tmp_uncut = np.flip(tmp_uncut, axis=1)
+    else:
+        tmp_uncut = tmp_uncut[:,tmp_uncut[1,:]>np.nanmin(tmp_uncut[1,:])+5.0] #discarding the first five degrees of the curve
+    
+    data_set = binning(tmp2, params)  #the data are binned according to the size defined by bins. No binning is performed if binsize is 1 or less. 
+    data_set_uncut = binning(tmp_uncut, params)  #the data are binned according to the size defined by bins. No binning is performed if binsize is 1 or less. 
+    data_set_uncut = data_set_uncut[:,~np.isnan(data_set_uncut).any(axis=0)]
+    
+    if params['Input'] != params['Output']: #raw data are kept in the input convention. 
+        tmp2[2,:] *= -1
 
-            data_set_uncut = data_set_uncut[:,~np.isnan(data_set_uncut).any(axis=0)]
-            data[j] = data_set
-            dataraw[j] = tmp2
-            data_uncut[j] = data_set_uncut
-            
-            # for j in files[key]:
-            if params['Input'] != params['Output']: #renormalized from exo-up to exo-down convention, or viceversa. 
-                dataraw[j][2,:] *= -1
-            
-            
-            
-            print('Datafile {} read correctly'.format(j))
-
-            if 'S_heating' in key:
-                for file in files[key]:
-                    header_heating[file] += '# Dafile read in format {} with encoding {} \n'.format(params['Dataformat'], code)
-            if 'S_cooling' in key:
-                for file in files[key]:
-                    header_cooling[file] += '# Dafile read in format {} with encoding {} \n'.format(params['Dataformat'], code)
-                
-    print('\n')
-    return data, dataraw, data_uncut #a dictionary containing all data, already cut, binned, and with the heatrate calculated. 
+    return data_set, tmp2, data_set_uncut, code
+
+
+def lean(params):
+    ''' True if the sample is analysed in the lean mode (optional key Lean): the files are parsed in chunks, the data are cut with views instead of copies, 
+    runs which are not corrected are not copied, and the raw data are kept only for the plot of the raw data.'''
+    return str(params.get('Lean', False)).lower() in ('true', 'yes', '1')
+
+
+def keep_raw(params):
+    ''' True if the plot of the raw data is requested (optional key Plots), so that the cut raw data must be kept.'''
+    plots = params.get('Plots', True)
+    if isinstance(plots, str):
+        plots = [plots]
+    return plots is True or bool(plots) and 'raw' in plots
+
+
+def span(mask):
+    ''' Index selecting the points of mask: a slice, which gives a view, if the points are contiguous, else the mask itself.'''
+    index = np.flatnonzero(mask)
+    if len(index) and index[-1] - index[0] + 1 == len(index):
+        return slice(index[0], index[-1] + 1)
+    return mask
+
+
+def read_run_lean(key, tmp, mask, code, params):
+    ''' Lean version of the end of read_run, with the same results: the file (read in chunks by dsc_read.load_chunked) is converted without copy, 
+    the cut data (mask) and the uncut data are views of it, and the raw data are replaced by the binned data (as in read_run_stream) if the raw plot is not requested.'''
+    full = convert_units(tmp if tmp.flags.writeable else np.array(tmp), params) #the array read from the file is converted in place, an array mapped from the cache is copied once.
+    tmp2 = full[:, span(mask)]
+    if 'cooling' in key:
+        tmp_uncut = full[:, span(full[1,:] < np.nanmax(full[1,:]) - 5.0)] #discarding the first five degrees of the curve
+        tmp2 = np.flip(tmp2, axis=1)
+        tmp_uncut = np.flip(tmp_uncut, axis=1)
+    else:
+        tmp_uncut = full[:, span(full[1,:] > np.nanmin(full[1,:]) + 5.0)]
+    data_set = binning(tmp2, params)
+    data_set_uncut = binning(tmp_uncut, params)
+    data_set_uncut = data_set_uncut[:,~np.isnan(data_set_uncut).any(axis=0)]
+    tmp2 = tmp2 if keep_raw(params) else data_set[:3,:].copy()
+    if params['Input'] != params['Output']: #raw data are kept in the input convention. 
+        tmp2[2,:] *= -1
+    return data_set, tmp2, data_set_uncut, code
+
+
+def convert_units(tmp, params):
+    ''' Converts in place the array tmp (time, temperature, heatflow) to the exo convention of the output, seconds and mW.'''
+    if params['Input'] != params['Output']: #renormalized from exo-up to exo-down convention, or viceversa. 
+        tmp[2,:] *= -1
+    
+    if params['unit_time'] == 'min': #Converts time from minutes to seconds
+        tmp[0,:] *= 60
+    
+    if params['unit_power'] == 'uW': #Converts the heatflow from uW into mW
+        tmp[2,:] /= 1000
+        
+    if params['unit_power'] == 'W': #Converts the heatflow from W into mW
+        tmp[2,:] *= 1000
+    return tmp
+
+
+def stream_lines(params):
+    ''' Returns the number of data lines per chunk if the files are read in chunks (optional key Stream: True, or the number of lines per chunk), otherwise 0.'''
+    mode = params.get('Stream', False)
+    if mode is True:
+        return dsc_read.CHUNK_LINES
+    if not mode or isinstance(mode, str):
+        return 0
+    return int(mode)
+
+
+def read_run_stream(key, j, params, chunk_lines, log=print):
+    ''' Same as read_run, but the datafile is read in chunks of chunk_lines lines: the region of interest, the units and the binning are applied
+    to each chunk and only the binned data are kept, so that the memory needed does not depend on the length of the file. 
+    The file is read twice, the first pass finds the temperature range (needed to discard the first five degrees of the uncut data) 
+    and the number of points to be binned. The data are not stored in the cache and dataraw contains the binned data, in the input convention.'''
+    path = os.path.join(params['Folder'], str(j))
+    heating = 'heating' in key
+    roi = params['ROI_h'] if heating else params['ROI_c']
+    try:
+        code = dsc_read.detect_encoding(path)
+        try:
+            scan = scan_temperature(path, params, code, chunk_lines, roi)
+        except UnicodeDecodeError: #the encoding detected from the first bytes does not fit the rest of the file.
+            code = dsc_read.probe_file(path)
+            scan = scan_temperature(path, params, code, chunk_lines, roi)
+        log('File {} opened with {} encoding, read in chunks of {} lines.'.format(str(j), code, chunk_lines))
+    except (KeyError, ValueError) as e: #the dataformat is not known or the file is not compatible with it.
+        log(str(e))
+        sys.exit('Error loading the input files. Try to change the dataformat in the dsc_input file.')
+    tmin, tmax, n_roi, n_top, n_valid = scan
+    if n_roi == 0:
+        raise Exception('The selected region of interest in the {} curve is not compatible with the range of temperature of the data, going from {} to {} degC'.format('heating' if heating else 'cooling', tmin, tmax))
+    
+    width = max(int(params['bins']), 1)
+    #cooling curves are flipped before binning: the bins are formed from the end of the data, the first (n % width) points are dropped.
+    cut = bin_stream(width, 0 if heating else n_roi % width, reverse=not heating, step=bin_step(params))
+    uncut = bin_stream(width, 0 if heating else (n_valid - n_top) % width, reverse=not heating, step=bin_step(params))
+    for tmp in dsc_read.read_chunks(path, params, code, chunk_lines):
+        tmp = convert_units(tmp, params)
+        add_to_bins(cut, tmp[:, (float(roi[0]) < tmp[1,:]) & (float(roi[1]) > tmp[1,:])])
+        if heating:
+            add_to_bins(uncut, tmp[:, tmp[1,:] > tmin + 5.0]) #discarding the first five degrees of the curve
+        else:
+            add_to_bins(uncut, tmp[:, tmp[1,:] < tmax - 5.0])
+    
+    data_binned, stdev = binned_stream(cut)
+    data_set = binned_set(data_binned, stdev, params)
+    data_set_uncut = binned_set(*binned_stream(uncut), params)
+    data_set_uncut = data_set_uncut[:,~np.isnan(data_set_uncut).any(axis=0)]
+    
+    tmp2 = data_binned.copy()
+    if params['Input'] != params['Output']: #raw data are kept in the input convention. 
+        tmp2[2,:] *= -1
+    return data_set, tmp2, data_set_uncut, code
+
+
+def scan_temperature(path, params, code, chunk_lines, roi):
+    ''' First pass of read_run_stream over the datafile path: reads only the temperature and returns its minimum and maximum, the number of points
+    in the region of interest roi, the number of points within five degrees of the maximum and the number of valid temperatures.'''
+    tmin, tmax, n_roi, n_valid = np.inf, -np.inf, 0, 0
+    top = np.empty(0) #temperatures within five degrees of the maximum found so far.
+    for T in dsc_read.read_chunks(path, params, code, chunk_lines, columns=(1,)):
+        T = T[0, ~np.isnan(T[0])]
+        if T.size == 0:
+            continue
+        tmin, tmax = min(tmin, np.min(T)), max(tmax, np.max(T))
+        n_roi += np.count_nonzero((float(roi[0]) < T) & (float(roi[1]) > T))
+        n_valid += T.size
+        top = np.concatenate([top[top >= tmax - 5.0], T[T >= tmax - 5.0]])
+    return tmin, tmax, n_roi, len(top), n_valid
+
+
+def bin_sum(blocks):
+    ''' Sums the blocks (rows, bins, width) along their last axis. Bins of less than 8 points are summed as width additions of whole columns,
+    in the order numpy uses for such short sums, much faster than a reduction along many short rows and with the same result.'''
+    width = blocks.shape[-1]
+    if width >= 8: #numpy sums longer rows pairwise, kept as is.
+        return np.add.reduce(blocks, axis=-1)
+    total = blocks[...,0].copy()
+    for k in range(1, width):
+        total += blocks[...,k]
+    return total
+
+
+def bin_points(data, width):
+    ''' Averages the points of data in bins of width points, the exceeding points at the end are dropped. 
+    Returns the binned data and the standard deviation of the heatflow in each bin.'''
+    n = (len(data[0,:]) // width) * width
+    rows = data[:,:n]
+    if rows.strides[1] != rows.itemsize: #the rows must be contiguous, so that each bin is summed as a row of the original data. Views with contiguous rows are not copied.
+        rows = np.ascontiguousarray(rows)
+    blocks = rows.reshape(len(data[:,0]), -1, width) #all rows binned at once: (rows, bins, width).
+    mean = bin_sum(blocks)/width
+    dev = blocks[2] - mean[2][:,None] #standard deviation of binned points, computed as np.std but reusing the mean of the heatflow.
+    dev *= dev
+    return mean, np.sqrt(bin_sum(dev)/width)
+
+
+def bin_step(params):
+    ''' Returns the temperature step of the bins (optional key Bin_step), or 0 if the bins are defined by a number of points.'''
+    step = params.get('Bin_step', 0)
+    if isinstance(step, str) or not step:
+        return 0.0
+    return float(step)
+
+
+def temperature_cells(data, step):
+    ''' Sorts the points of data in temperature cells of width step: the point with temperature T belongs to the cell floor(T/step).
+    Returns the index of the cells containing points, the number of points, the mean of each row and the sum of the squared deviations of the heatflow in each cell.'''
+    data = data[:, ~np.isnan(data[1,:])]
+    cells, index, count = np.unique(np.floor(data[1,:]/step).astype(np.int64), return_inverse=True, return_counts=True)
+    mean = np.vstack([np.bincount(index, weights=row, minlength=len(cells)) for row in data])/count
+    m2 = np.bincount(index, weights=(data[2,:] - mean[2,index])**2, minlength=len(cells))
+    return cells, count, mean, m2
+
+
+def combine_cells(parts):
+    ''' Combines the temperature cells of several parts of a file (see temperature_cells). Returns the binned data (one bin per cell, in increasing temperature)
+    and the standard deviation of the heatflow in each bin.'''
+    if len(parts) == 1:
+        cells, count, mean, m2 = parts[0]
+    else: #parallel combination of means and squared deviations of the cells found in several parts.
+        cells, index = np.unique(np.concatenate([p[0] for p in parts]), return_inverse=True)
+        n = np.concatenate([p[1] for p in parts])
+        means = np.concatenate([p[2] for p in parts], axis=1)
+        count = np.bincount(index, weights=n, minlength=len(cells))
+        mean = np.vstack([np.bincount(index, weights=n*row, minlength=len(cells)) for row in means])/count
+        m2 = np.bincount(index, weights=np.concatenate([p[3] for p in parts]) + n*(means[2,:] - mean[2,index])**2, minlength=len(cells))
+    return mean, np.sqrt(m2/count)
+
+
+def bin_stream(width, skip=0, reverse=False, step=0.0):
+    ''' Creates the dictionary used by add_to_bins to bin data arriving in chunks. The first skip points are discarded. 
+    With reverse, the binned data are returned in the reversed order, as if the data were flipped before binning.
+    With step larger than 0, the points are binned in temperature cells of width step instead.'''
+    return {'width': width, 'skip': skip, 'reverse': reverse, 'step': step, 'rest': np.empty((3,0)), 'binned': [], 'stdev': [], 'cells': []}
+
+
+def add_to_bins(stream, chunk):
+    ''' Bins the points of chunk together with the points left over from the previous chunk. The points which do not fill a bin are kept for the next one.'''
+    if stream['step'] > 0: #the cells of the chunks are combined at the end, by binned_stream.
+        stream['cells'].append(temperature_cells(chunk, stream['step']))
+        return None
+    if stream['skip'] > 0:
+        drop = min(stream['skip'], len(chunk[0,:]))
+        chunk = chunk[:, drop:]
+        stream['skip'] -= drop
+    data = np.concatenate([stream['rest'], chunk], axis=1)
+    width = stream['width']
+    n = (len(data[0,:]) // width) * width
+    if n > 0:
+        if stream['reverse']:
+            data_binned, stdev = bin_points(np.flip(data[:,:n], axis=1), width)
+        else:
+            data_binned, stdev = bin_points(data[:,:n], width)
+        stream['binned'].append(data_binned)
+        stream['stdev'].append(stdev)
+    stream['rest'] = data[:, n:].copy()
+
+
+def binned_stream(stream):
+    ''' Returns the binned data and the standard deviations collected by add_to_bins. Points left over are dropped.'''
+    if stream['step'] > 0 and stream['cells']:
+        return combine_cells(stream['cells'])
+    binned, stdev = stream['binned'], stream['stdev']
+    if stream['reverse']:
+        binned, stdev = binned[::-1], stdev[::-1]
+    if not binned:
+        return np.empty((3,0)), np.empty(0)
+    return np.concatenate(binned, axis=1), np.concatenate(stdev)
 
 
 def binning(data, params):
     ''' Function which bins the data array. width points are averaged and an array of length original length//width is retuned.
     No binning is performed when the binsize is smaller or equal to 1. Heatrate is also calculated if the time-temperature data are available. 
-    Before binning, if the original file is not a multiple of width, the exceeding points are dropped. '''
+    Before binning, if the original file is not a multiple of width, the exceeding points are dropped. 
+    If the optional key Bin_step is given, the points are instead averaged in temperature cells of Bin_step degrees (see temperature_cells), 
+    so that runs measured with different sampling rates are binned on the same temperature grid.'''
     width = int(params['bins'])
-    if int(params['bins']) > 1:
-        data_binned = np.vstack(([data[i,:(data[i,:].size // width) * width].reshape(-1, width).mean(axis=1) for i in range(len(data[:,0]))]))
-        stdev = np.std(data[2,:(data[2,:].size // width) * width].reshape(-1, width), axis=1) #standard deviation of binned points. 
+    if bin_step(params) > 0:
+        data_binned, stdev = combine_cells([temperature_cells(data, bin_step(params))])
+    elif int(params['bins']) > 1:
+        data_binned, stdev = bin_points(data, width)
     else:
         data_binned = data
         stdev = np.empty(len(data_binned[0,:]))
+    return binned_set(data_binned, stdev, params)
+
+
+def binned_set(data_binned, stdev, params):
+    ''' Builds the binned data set: time, temperature, heatflow, standard deviation of the heatflow and heatrate. The first bin is dropped.'''
     if params['Dataformat'] != '2cols':
     #if params['Dataformat'][0] == 'Setaram3' or params['Dataformat'][0] == 'Setaram4' or params['Dataformat'][0] == '3cols':
         hrate = np.diff(data_binned[1,:])/np.diff(data_binned[0,:]) 
@@ -379,12 +518,12 @@ def binning(data, params):
     return np.concatenate([np.delete(data_binned, 0, axis=1), np.append([stdev[:-1]], [hrate], axis=0)], axis=0) 
 
 
-def check_data(data, files, params, header_heating, header_cooling):
+def check_data(data, files, params, header_heating, header_cooling, log=print):
     ''' Functions to check that the information in the data files and those provided in the input files are consistent.
     Eg. temperature increases in the heating scans, temperature range and ROI are consistent, etc. TODO
     It should also check wether all files are present in the rawdata folder. '''
     
-    print(15*'*', 'File Check', 15*'*')
+    log(15*'*', 'File Check', 15*'*')
     W_counter = 0 #counts warnings
     D_counter = 0 #counts number of rejected files
     
@@ -395,7 +534,7 @@ def check_data(data, files, params, header_heating, header_cooling):
 #veryfies that the heating files are really a heating file. If not, program stops.             
             if 'heating' in key:
                 if (data[i][1,1] > data[i][1,-1]): 
-                    print(data[i][1,1], data[i][1,-1])
+                    log(data[i][1,1], data[i][1,-1])
                     raise Exception('Error: {} is not a heating file!'.format(i))
 #Verification for a constant heatrate and if it is consistent with the one provided in parameter file. 
                 hr, hrstd = data[i][4,:].mean()*60, data[i][4,:].std()*60
@@ -404,13 +543,13 @@ def check_data(data, files, params, header_heating, header_cooling):
                 
                 if hrstd/hr > 0.02:
                     W_counter += 1
-                    print('Warning {}: the heatrate is not constant and varies by {:.2g}% for file {}.'.format(W_counter, hrstd/hr*100, i))
+                    log('Warning {}: the heatrate is not constant and varies by {:.2g}% for file {}.'.format(W_counter, hrstd/hr*100, i))
                 if not (0.95 <= (float(params['Scanrate_h'])/hr) <= 1.05): #veryfies consistency with input parameter file
-                    print('Warning {}: the determined heatrate of file {} is {:.2g} K/min \
+                    log('Warning {}: the determined heatrate of file {} is {:.2g} K/min \
 and is not consistent with the one provided in the input parameter file of {:.2g} K/min.'.format(W_counter, i, hr, float(params['Scanrate_h'])))
                     W_counter += 1
                 else:
-                    print('Heat rate of {:.2g} K/min in file {} consistent with parameter input file.'.format(hr, i))
+                    log('Heat rate of {:.2g} K/min in file {} consistent with parameter input file.'.format(hr, i))
 #veryfies that the buffer and empty cell measurements are identical, i.e., do not differ by more than 5%. 
                     
 #veryfies that the cooling files are really a heating file. If not, program stops.                
@@ -425,37 +564,37 @@ and is not consistent with the one provided in the input parameter file of {:.2g
 
                 if hrstd/hr > 0.02:
                     W_counter += 1
-                    print('Warning {}: the heatrate is not constant and varies by {:.2g}% for file {}.'.format(W_counter, hrstd/hr*100, i))
+                    log('Warning {}: the heatrate is not constant and varies by {:.2g}% for file {}.'.format(W_counter, hrstd/hr*100, i))
                 if not (0.95 <= (-float(params['Scanrate_c'])/hr) <= 1.05): #veryfies consistency with input parameter file
-                    print('Warning {}: the determined heatrate of file {} is {:.2g} K/min \
+                    log('Warning {}: the determined heatrate of file {} is {:.2g} K/min \
 and is not consistent with the one provided in the input parameter file of {:.2g} K/min.'.format(W_counter, i, hr, float(params['Scanrate_c'])))
                     W_counter += 1
                 else:
-                    print('Heat rate of {:.2g} K/min in file {} consistent with parameter input file.'.format(hr, i))
+                    log('Heat rate of {:.2g} K/min in file {} consistent with parameter input file.'.format(hr, i))
 
 #Eliminates all the files which do not cover the region of interest. 
-    print('\n')
+    log('\n')
     for key in files:  
         for i in files[key]:           
             minT, maxT = np.min(data[i][1,:]), np.max(data[i][1,:])
             if 'cooling' in key:
                 if minT-1.0 > float(params['ROI_c'][0]) or maxT+1.0 < float(params['ROI_c'][1]):
                     D_counter += 1
-                    print('Error: temperature range of file {} does not cover the region of interest!'.format(i))
-                    print('Requested range is {} -- {}. File covers range {} -- {}.'.format(float(params['ROI_c'][0]), float(params['ROI_c'][1]), minT, maxT))
-                    print('File {} will be ignored in all successive calculations.'.format(i))
+                    log('Error: temperature range of file {} does not cover the region of interest!'.format(i))
+                    log('Requested range is {} -- {}. File covers range {} -- {}.'.format(float(params['ROI_c'][0]), float(params['ROI_c'][1]), minT, maxT))
+                    log('File {} will be ignored in all successive calculations.'.format(i))
                     del data[i]
                     files[key].remove(i)
             if 'heating' in key:
                 if minT-1.0 > float(params['ROI_h'][0]) or maxT+1.0 < float(params['ROI_h'][1]):
                     D_counter += 1
-                    print('Error: temperature range of file {} does not cover the region of interest!'.format(i))
-                    print('Requested range is {} -- {}. File covers range {} -- {}.'.format(float(params['ROI_h'][0]), float(params['ROI_h'][1]), minT, maxT))
-                    print('File {} will be ignored in all successive calculations.'.format(i))
+                    log('Error: temperature range of file {} does not cover the region of interest!'.format(i))
+                    log('Requested range is {} -- {}. File covers range {} -- {}.'.format(float(params['ROI_h'][0]), float(params['ROI_h'][1]), minT, maxT))
+                    log('File {} will be ignored in all successive calculations.'.format(i))
                     del data[i]
                     files[key].remove(i)
 
-    print('\n')
+    log('\n')
 #Checks weather the heating files have all the same length.
     len_h =  list(filter(None, [[np.shape(data[i])[1] for i in files[key]] for key in files if 'heating' in key])) #creates a list with the lengths of the heating runs
     len_h_flatten = [item for sublist in len_h for item in sublist]
@@ -463,12 +602,12 @@ and is not consistent with the one provided in the input parameter file of {:.2g
     if len(len_h_flatten) > 0:
         diff_h = (max(len_h_flatten) - min(len_h_flatten))/max(len_h_flatten)
         if diff_h == 0.0:
-            print('All heating runs have the same length.')
+            log('All heating runs have the same length.')
         elif  1e-5 < diff_h < 0.01:
-            print('All heating runs have the same length within 1%.')
+            log('All heating runs have the same length within 1%.')
         elif diff_h < 0.05:
             W_counter += 1
-            print('Warning {}: Length of heating runs differs by more than {}%.'.format(W_counter, diff_h*100))
+            log('Warning {}: Length of heating runs differs by more than {}%.'.format(W_counter, diff_h*100))
         else:
             raise Exception('Heating run lengths differ by more than 5% to be threated at the same time. Evaluate if analysing them separately.') 
 
@@ -478,12 +617,12 @@ and is not consistent with the one provided in the input parameter file of {:.2g
     if len(len_c_flatten) > 0:
         diff_c = (max(len_c_flatten) - min(len_c_flatten))/max(len_c_flatten)
         if diff_c == 0.0:
-            print('All cooling runs have the same length.')
+            log('All cooling runs have the same length.')
         elif  1e-5 < diff_c < 0.01:
-            print('All cooling runs have the same length within 1%.')
+            log('All cooling runs have the same length within 1%.')
         elif diff_c < 0.05:
             W_counter += 1
-            print('Warning {}: Length of cooling runs differs by more than {:.1g}%.'.format(W_counter, diff_c*100))
+            log('Warning {}: Length of cooling runs differs by more than {:.1g}%.'.format(W_counter, diff_c*100))
         else:
             raise Exception('Cooling run lengths differ by more than 5% to be threated at the same time. Evaluate if analysing them separately.') 
 
@@ -507,20 +646,20 @@ and is not consistent with the one provided in the input parameter file of {:.2g
         header_cooling[key] += '# Peak is located between {} and {} degC. \n'.format(params['ROP_c'][0], params['ROP_c'][1])
         
     if W_counter == 0 and D_counter == 0:
-        print('Check performed sucessfully. No errors encountered!')    
+        log('Check performed sucessfully. No errors encountered!')    
     else:
-        print('\n', 5*'*', '{} Warnings have arisen during file check!'.format(W_counter), 5*'*')
-        print(5*'*', '{} Files will be ignored in the calculations!'.format(D_counter), 5*'*')
+        log('\n', 5*'*', '{} Warnings have arisen during file check!'.format(W_counter), 5*'*')
+        log(5*'*', '{} Files will be ignored in the calculations!'.format(D_counter), 5*'*')
     
     
     return None
     
     
-def average_refs(data, files):
+def average_refs(data, files, log=print):
     ''' Function which averages the reference measurements of buffer and empty cell. 
     If the size of the reference measurements do not match, the longest only is considered.'''
-    print()
-    print(15*'*', 'Reference averaging', 15*'*')    
+    log()
+    log(15*'*', 'Reference averaging', 15*'*')    
     refs = {'EC_heating': [], 
             'EC_cooling': [], 
             'B_heating': [], 
@@ -528,244 +667,457 @@ def average_refs(data, files):
     if files['EC_heating']: #verifies if EC heatings were measured. 
         len_ref = list(filter(None, [np.shape(data[i])[1] for i in files['EC_heating']]))
         if all(x==len_ref[0] for x in len_ref):
-            print('All empty cell heating files are averaged.')
+            log('All empty cell heating files are averaged.')
             refs['EC_heating'] = np.average(np.stack([np.asarray(data[i]) for i in files['EC_heating']]), axis=0)
         else:
             for i in files['EC_heating']:
                 if np.shape(data[i])[1] == max(len_ref):
-                    print('Longest Empty cell heating file, {}, is considered for successive corrections.'.format(i))
+                    log('Longest Empty cell heating file, {}, is considered for successive corrections.'.format(i))
                     refs['EC_heating'] = data[i]
                     
     if files['EC_cooling']: #verifies if EC heatings were measured. 
         len_ref = list(filter(None, [np.shape(data[i])[1] for i in files['EC_cooling']]))
         if all(x==len_ref[0] for x in len_ref):
-            print('All empty cell cooling files are averaged.')
+            log('All empty cell cooling files are averaged.')
             refs['EC_cooling'] = np.average(np.stack([np.asarray(data[i]) for i in files['EC_cooling']]), axis=0)
         else:
             for i in files['EC_cooling']:
                 if np.shape(data[i])[1] == max(len_ref):
-                    print('Longest empty cell cooling file, {}, is considered for successive corrections.'.format(i))
+                    log('Longest empty cell cooling file, {}, is considered for successive corrections.'.format(i))
                     refs['EC_cooling'] = data[i]
 
     
     if files['B_heating']: #verifies if Buffer heatings were measured. 
         len_ref = list(filter(None, [np.shape(data[i])[1] for i in files['B_heating']]))
         if all(x==len_ref[0] for x in len_ref):
-            print('All buffer heating files are averaged.')
+            log('All buffer heating files are averaged.')
             refs['B_heating'] = np.average(np.stack([np.asarray(data[i]) for i in files['B_heating']]), axis=0)
         else:
             for i in files['B_heating']:
                 if np.shape(data[i])[1] == max(len_ref):
-                    print('Longest Buffer heating file, {}, is considered for successive corrections.'.format(i))
+                    log('Longest Buffer heating file, {}, is considered for successive corrections.'.format(i))
                     refs['B_heating'] = data[i]
     
     if files['B_cooling']: #verifies if Buffer coolings were measured. 
         len_ref = list(filter(None, [np.shape(data[i])[1] for i in files['B_cooling']]))
         if all(x==len_ref[0] for x in len_ref):
-            print('All buffer cooling files are averaged.')
+            log('All buffer cooling files are averaged.')
             refs['B_cooling'] = np.array(np.average(np.stack([np.asarray(data[i]) for i in files['B_cooling']]), axis=0))
         else:
             for i in files['B_cooling']:
                 if np.shape(data[i])[1] == max(len_ref):
-                    print('Longest Buffer cooling file, {}, is considered for successive corrections.'.format(i))
+                    log('Longest Buffer cooling file, {}, is considered for successive corrections.'.format(i))
                     refs['B_cooling'] = data[i]
     
     for key in refs: refs[key] = np.array(refs[key])   #converts also the empty strings into numpy arrays
     return refs
 
 
-def correction(data, refs, files, params):
+def reference_curves(EC, B):
+    ''' Interpolants of the heatflow of the empty cell EC and of the buffer B, corrected for the empty cell if measured, as a function of temperature.
+    Missing references are empty arrays and give None. The interpolants are shared by all samples with the same references.'''
+    from scipy import interpolate
+    def build():
+        tck_EC, tck_B = None, None
+        if np.shape(EC)[0]:
+            tck_EC = interpolate.interp1d(EC[1,:], EC[2,:], fill_value='extrapolate')
+        if np.shape(B)[0]:
+            Buffer_corrected = B
+            if tck_EC is not None:
+                EC_interpol = tck_EC(B[1,:])  #linear interpolation of the heatflow as a function of the temperature of the buffer run.
+                Buffer_corrected = np.array((B[0,:], B[1,:], B[2,:]-EC_interpol))
+            tck_B = interpolate.interp1d(Buffer_corrected[1,:], Buffer_corrected[2,:], fill_value='extrapolate')
+        return tck_EC, tck_B
+    return dsc_cache.shared(('curves', dsc_cache.array_key(EC, B)), build)
+
+
+def correct_runs(data, runs, tck_EC=None, tck_B=None, ec_scale=1.0, sf=0.0, out=None):
+    ''' Subtracts from the heatflow of the sample runs the empty cell (times ec_scale) and the buffer (times sf), interpolated at the temperatures of the runs.
+    All runs are copied in one array and the references are interpolated on all their temperatures in one call.
+    Returns a dictionary with the corrected runs (time, temperature, heatflow, stdev and heatrate), views of the common array.
+    If out is given (a dictionary run -> array of the shape of the run, see dsc_thermogram.Run), each run is corrected in its array instead.'''
+    if not runs:
+        return {}
+    if out is not None:
+        for i in runs:
+            out[i][...] = data[i]
+            if tck_EC is not None:
+                out[i][2,:] -= tck_EC(out[i][1,:])*ec_scale
+            if tck_B is not None:
+                out[i][2,:] -= tck_B(out[i][1,:])*sf
+        return {i: out[i] for i in runs}
+    corrected = np.concatenate([data[i] for i in runs], axis=1).astype(float, copy=False)
+    if tck_EC is not None:
+        corrected[2,:] -= tck_EC(corrected[1,:])*ec_scale
+    if tck_B is not None:
+        corrected[2,:] -= tck_B(corrected[1,:])*sf
+    return dict(zip(runs, np.split(corrected, np.cumsum([np.shape(data[i])[1] for i in runs])[:-1], axis=1)))
+
+
+def correction(data, refs, files, params, out=None, log=print):
     ''' Function which corrects the sample runs for the empty cells and the buffer buffer titrations. 
-    If no reference files are provided, this function will simple return the sample raw data.'''
-    print(15*'*', 'Sample data correction', 15*'*')  
+    If no reference files are provided, this function will simple return the sample raw data.
+    The interpolants of the references are built by reference_curves, heating and cooling runs are corrected by correct_runs
+    (in the arrays of out, if given).'''
+    log(15*'*', 'Sample data correction', 15*'*')  
     data_c = {}
 
-    if np.shape(refs['EC_cooling'])[0]:
-        tck_EC = interpolate.interp1d(refs['EC_cooling'][1,:], refs['EC_cooling'][2,:], fill_value='extrapolate')
-        if np.shape(refs['B_cooling'])[0] and float(params['mass_bb']) > 0.0:
-            print('Correcting the Buffer cooling run for the Empty cell cooling run')
-            EC_interpol = tck_EC(refs['B_cooling'][1,:])  #linear interpolation of the heatflow as a function of the temperature of the buffer run.
-            Buffer_corrected = np.array((refs['B_cooling'][0,:], refs['B_cooling'][1,:], refs['B_cooling'][2,:]-EC_interpol))
-            tck_B = interpolate.interp1d(Buffer_corrected[1,:], Buffer_corrected[2,:], fill_value='extrapolate')
-            for i in files['S_cooling']:
-                print('Correcting file {} for EC and Buffer measurement'.format(i))
-                B_interpol = tck_B(data[i][1,:])  #linear interpolation of the heatflow of the buffer as a function of the temperature of the sample run. 
-                EC_interpol = tck_EC(data[i][1,:])  #linear interpolation of the heatflow of the EC as a function of the temperature of the sample run. 
-                sf_c = (float(params['mass_s'][0])*(1.-float(params['s_wt'])) - float(params['mass_r']))/float(params['mass_bb'][0])  #scaling factor used for correcting cooling sample run. 
-                data_corrected = data[i][2,:] - EC_interpol - B_interpol * sf_c  #corrects the data for the empty and for the buffer signal, calculated from the buffer-buffer experiment and reweighted for the buffer difference in sample and reference cell. 
-                data_c[i] = np.array([data[i][0,:], data[i][1,:], data_corrected, data[i][3,:], data[i][4,:]])
-        else:  #if empty cell was measured but not the buffer/buffer. 
-            for i in files['S_cooling']:
-                   print('Correcting file {} for EC measurement'.format(i))
-                   EC_interpol = tck_EC(data[i][1,:])
-                   data_corrected = data[i][2,:] - EC_interpol #corrects the sample data for the empty cell measurement. 
-                   data_c[i] = np.array([data[i][0,:], data[i][1,:], data_corrected, data[i][3,:], data[i][4,:]])
-    else: #if the empty cell was not measured
-        if np.shape(refs['B_cooling'])[0] and float(params['mass_bb']) > 0.0: #if buffer was measured
-            tck_B = interpolate.interp1d(refs['B_cooling'][1,:], refs['B_cooling'][2,:], fill_value='extrapolate')
-            for i in files['S_cooling']:
-                print('Correcting file {} for Buffer measurement'.format(i))
-                B_interpol = tck_B(data[i][1,:])  #linear interpolation of the heatflow of the buffer as a function of the temperature of the sample run.       
-                sf_c = (float(params['mass_s'][0])*(1.-float(params['s_wt'])) - float(params['mass_r']))/float(params['mass_bb'])
-                data_corrected = data[i][2,:] - B_interpol * sf_c  #corrects the data for the empty and for the buffer signal, calculated from the buffer-buffer experiment and reweighted for the buffer difference in sample and reference cell. 
-                data_c[i] = np.array([data[i][0,:], data[i][1,:], data_corrected, data[i][3,:], data[i][4,:]])
-        else: #if no empty cell nor buffer were measured. 
-            for i in files['S_cooling']:
-                print('File {} was not corrected for buffer or emty cell measurement'.format(i))
-                data_c[i] = np.array([data[i][0,:], data[i][1,:], data[i][2,:], data[i][3,:], data[i][4,:]])
-                
-    
-    if np.shape(refs['EC_heating'])[0]:
-        tck_EC = interpolate.interp1d(refs['EC_heating'][1,:], refs['EC_heating'][2,:], fill_value='extrapolate')
-        if np.shape(refs['B_heating'])[0] and float(params['mass_bb']) > 0.0:
-            print('Correcting the Buffer heating run for the Empty cell heating run')
-            EC_interpol = tck_EC(refs['B_heating'][1,:])  #linear interpolation of the heatflow as a function of the temperature of the buffer run.
-            Buffer_corrected = np.array((refs['B_heating'][0,:], refs['B_heating'][1,:], refs['B_heating'][2,:]-EC_interpol))
-            print('Buffer heating run was corrected for the Empty cell heating run')
-            tck_B = interpolate.interp1d(Buffer_corrected[1,:], Buffer_corrected[2,:], fill_value='extrapolate')
-            for i in files['S_heating']:
-                print('Correcting file {} for EC and Buffer measurement'.format(i))
-                B_interpol = tck_B(data[i][1,:])  #linear interpolation of the heatflow of the buffer as a function of the temperature of the sample run. 
-                EC_interpol = tck_EC(data[i][1,:])  #linear interpolation of the heatflow of the EC as a function of the temperature of the sample run. 
-                sf_h = (float(params['mass_s'])*(1-float(params['s_wt'][0])) - float(params['mass_r']))/float(params['mass_bb']) #scaling factor used for correcting heating sample run. 
-                data_corrected = data[i][2,:] - EC_interpol - B_interpol *sf_h  #corrects the data for the empty and for the buffer signal, calculated from the buffer-buffer experiment and reweighted for the buffer difference in sample and reference cell. 
-                data_c[i] = np.array([data[i][0,:], data[i][1,:], data_corrected, data[i][3,:], data[i][4,:]])
-        else:  #if empty cell was measured but not the buffer/buffer. 
-            for i in files['S_heating']:
-                   print('Correcting file {} for EC measurement'.format(i))
-                   EC_interpol = tck_EC(data[i][1,:])
-                   data_corrected = data[i][2,:] - EC_interpol*0.73 #corrects the sample data for the empty cell measurement. 
-                   data_c[i] = np.array([data[i][0,:], data[i][1,:], data_corrected, data[i][3,:], data[i][4,:]])
-    else: #if the empty cell was not measured
-        if np.shape(refs['B_heating'])[0] and float(params['mass_bb']) > 0.0: #if buffer was measured
-            tck_B = interpolate.interp1d(refs['B_heating'][1,:], refs['B_heating'][2,:], fill_value='extrapolate')
-            for i in files['S_heating']:
-                print('Correcting file {} for Buffer measurement'.format(i))
-                B_interpol = tck_B(data[i][1,:])  #linear interpolation of the heatflow of the buffer as a function of the temperature of the sample run.       
-                sf_h = (float(params['mass_s'])*(1.-float(params['s_wt'])) - float(params['mass_r']))/float(params['mass_bb']) #scaling factor used for correcting heating sample run. 
-                data_corrected = data[i][2,:] - B_interpol * sf_h  #corrects the data for the empty and for the buffer signal, calculated from the buffer-buffer experiment and reweighted for the buffer difference in sample and reference cell. 
-                data_c[i] = np.array([data[i][0,:], data[i][1,:], data_corrected, data[i][3,:], data[i][4,:]])
-        else: #if no empty cell nor buffer were measured. 
-            for i in files['S_heating']:
-                print('File {} was not corrected for buffer or emty cell measurement'.format(i))
-                data_c[i] = np.array([data[i][0,:], data[i][1,:], data[i][2,:], data[i][3,:], data[i][4,:]])      
+    for direction in ('cooling', 'heating'):
+        EC, B = refs['EC_' + direction], refs['B_' + direction]
+        use_EC = np.shape(EC)[0] > 0
+        use_buffer = np.shape(B)[0] > 0 and float(params['mass_bb']) > 0.0 #the buffer is used only if the buffer-buffer mass difference is given.
+        tck_EC, tck_B = reference_curves(EC, B if use_buffer else np.array([]))
+        sf = 0.0
+        if use_buffer: #scaling factor of the buffer signal, reweighted for the buffer difference in sample and reference cell.
+            sf = (float(params['mass_s'])*(1.-float(params['s_wt'])) - float(params['mass_r']))/float(params['mass_bb'])
+        ec_scale = EC_SCALE_HEATING if direction == 'heating' and not use_buffer else 1.0
+
+        if use_EC and use_buffer:
+            log('Correcting the Buffer {} run for the Empty cell {} run'.format(direction, direction))
+        for i in files['S_' + direction]:
+            if use_EC and use_buffer: log('Correcting file {} for EC and Buffer measurement'.format(i))
+            elif use_EC: log('Correcting file {} for EC measurement'.format(i))
+            elif use_buffer: log('Correcting file {} for Buffer measurement'.format(i))
+            else: log('File {} was not corrected for buffer or emty cell measurement'.format(i))
+        if lean(params) and tck_EC is None and tck_B is None and out is None: #runs which are not corrected are not copied.
+            data_c.update({i: data[i] for i in files['S_' + direction]})
+        else:
+            data_c.update(correct_runs(data, files['S_' + direction], tck_EC, tck_B, ec_scale, sf, out))
 
     return data_c
 
 
 
-def normalize_sampleruns(files, data, params):
+def normalize_sampleruns(files, data, params, out=None, log=print):
     ''' Normalizes the samples for the sample mass, or eventually molar mass'''
-    print('\n', 15*'*', 'Data normalization', 15*'*')
-    data_norm = dict()
+    return normalize_runs(files, [data], params, None if out is None else [out], log)[0]
+
+
+def normalize_runs(files, datasets, params, out=None, log=print):
+    ''' Normalizes the sample runs of each data set of the list datasets (e.g. the cut and the uncut data) in one pass over the runs.
+    Each run is divided by its mean heating rate and by the mass (or moles) of sample. Returns the list of the normalized data sets.
+    If out is given (one dictionary run -> array (points, 2) per data set), the normalized runs are written in these arrays.'''
+    log('\n', 15*'*', 'Data normalization', 15*'*')
+    normalized = [dict() for data in datasets]
     sample_norm = params['mass_s']*params['s_wt']/1000*1000   #Normalization factor given by the sample mass in grams and from mW to W
     if 'Mw' in params:
         sample_norm /= float(params['Mw'])  #if Mw is provided, the data will be normalized by the moles of compound. 
     
-    for i in files['S_heating']:
-        hr = np.average(data[i][4,:])
-        if 'Mw' in params:
-            print('File {} is normalized by a heating rate of {:.2g} K/s, equivalent to {:.2f} K/min, and by {:.2e} moles of sample.'.format(i, hr, hr*60, sample_norm/1000))
-        else:
-            print('File {} is normalized by a heating rate of {:.2g} K/s, equivalent to {:.2f} K/min, and by {:.2e} grams of sample.'.format(i, hr, hr*60, sample_norm/1000))
-        #print(i, np.average(data[i][4,:])*60)
-        data_norm[i] = np.column_stack((data[i][1,:], data[i][2,:]/(hr*sample_norm)))
-    
-    for i in files['S_cooling']:
-        hr = -np.average(data[i][4,:])
-        if 'Mw' in params:
-            print('File {} is normalized by a heating rate of {:.2g} K/s, equivalent to {:.2f} K/min, and by {:.2e} moles of sample.'.format(i, hr, hr*60, sample_norm/1000))
+    for key, sign in (('S_heating', 1), ('S_cooling', -1)):
+        for i in files[key]:
+            for n, data in enumerate(datasets):
+                hr = sign*np.average(data[i][4,:])
+                if n == 0:
+                    if 'Mw' in params:
+                        log('File {} is normalized by a heating rate of {:.2g} K/s, equivalent to {:.2f} K/min, and by {:.2e} moles of sample.'.format(i, hr, hr*60, sample_norm/1000))
+                    else:
+                        log('File {} is normalized by a heating rate of {:.2g} K/s, equivalent to {:.2f} K/min, and by {:.2e} grams of sample.'.format(i, hr, hr*60, sample_norm/1000))
+                if out is None:
+                    normalized[n][i] = np.column_stack((data[i][1,:], data[i][2,:]/(hr*sample_norm)))
+                else:
+                    normalized[n][i] = out[n][i]
+                    out[n][i][:,0] = data[i][1,:]
+                    np.divide(data[i][2,:], hr*sample_norm, out=out[n][i][:,1])
+    return normalized
+
+def base(pre_s, pre_i, post_s, post_i, alpha, T):
+    '''Calculates the baseline according to the linear interpolation of the region before the peak and after the peak'''
+    return pre_i + pre_s*T - alpha*((pre_i-post_i) + (pre_s-post_s)*T)
+
+
+def err_base(pre_s, pre_i, post_s, post_i, alpha, T):
+    '''Calculates the standard deviation of the baseline according to the linear interpolation of the region before the peak and after the peak'''
+    return ((pre_i*(1-alpha))**2 + (pre_s*(T-alpha*T))**2 + (post_i*alpha)**2 +(post_s*alpha*T)**2)**0.5
+
+
+def linregress_rows(x, y, mask):
+    '''Linear regression of y against x for each row of the 2D arrays, using only the points where mask is True. 
+    Same estimates as scipy.stats.linregress: returns slope, intercept and their standard errors, one value per row.'''
+    n = mask.sum(axis=1)
+    xmean = np.where(mask, x, 0.0).sum(axis=1)/n
+    ymean = np.where(mask, y, 0.0).sum(axis=1)/n
+    dx = np.where(mask, x - xmean[:,None], 0.0)
+    dy = np.where(mask, y - ymean[:,None], 0.0)
+    ssxm, ssym, ssxym = (dx*dx).sum(axis=1)/n, (dy*dy).sum(axis=1)/n, (dx*dy).sum(axis=1)/n
+    r = np.clip(ssxym/np.sqrt(ssxm*ssym), -1.0, 1.0)
+    slope = ssxym/ssxm
+    intercept = ymean - slope*xmean
+    slope_err = np.sqrt((1 - r**2)*ssym/ssxm/(n-2))
+    intercept_err = slope_err*np.sqrt(ssxm + xmean**2)
+    return slope, intercept, slope_err, intercept_err
+
+
+def batch_baseline(T, Cp, ROP, tol=1e-9, maxiter=100):
+    '''Baseline of several runs of equal length at once. T and Cp are 2D arrays with one run per row, the temperature must increase along each row. 
+    The linear fits before and after the peak region ROP, the first baseline (linear interpolation between the baseline regions) and the iterative
+    sigmoidal baseline are calculated for all runs together. Each run stops iterating when converged, as in the calculation file by file.
+    Returns a list with one dictionary per run.'''
+    fits, newbase, H, alpha, DH, itermax, residual = baseline_rows(T, Cp, ROP, tol, maxiter)
+    return [{'fits': tuple(f[n] for f in fits), 'base': newbase[n], 'H': H[n], 'alpha': alpha[n], 'DH': DH[n], 'iterations': itermax[n], 'residual': residual[n]}
+            for n in range(len(DH))]
+
+
+def baseline_rows(T, Cp, ROP, tol=1e-9, maxiter=100):
+    '''Calculation of batch_baseline, returning arrays with one row (or value) per run: the linear fits (pre_s, pre_i, pre_s_err, pre_i_err, 
+    post_s, post_i, post_s_err, post_i_err), the baseline, H, alpha, the last variation of H[-1], the number of iterations and the residual.
+    The limits of the peak region ROP are two temperatures, or two arrays with the limits of each run.'''
+    runs, N = np.shape(T)
+    rows = np.arange(runs)
+    low, high = np.reshape(np.asarray(ROP[0], dtype=float), (-1, 1)), np.reshape(np.asarray(ROP[1], dtype=float), (-1, 1))
+    pre, post = low > T, high < T
+    pre_s, pre_i, pre_s_err, pre_i_err = linregress_rows(T, Cp, pre)
+    post_s, post_i, post_s_err, post_i_err = linregress_rows(T, Cp, post)
+    dT = np.diff(T, axis=1) #temperature steps, computed once for all iterations
+    def cumulative(y, d):
+        '''Cumulative integral of the rows of y, the same operations as scipy.integrate.cumulative_trapezoid with initial=0.'''
+        H = np.zeros_like(y)
+        trapezoids = y[:,1:] + y[:,:-1]
+        np.multiply(d, trapezoids, out=trapezoids)
+        np.divide(trapezoids, 2.0, out=trapezoids)
+        np.cumsum(trapezoids, axis=1, out=H[:,1:])
+        return H
+
+    #first baseline: straight line between the last point before and the first point after the peak, data points elsewhere.
+    ia, ib = N - 1 - np.argmax(pre[:,::-1], axis=1), np.argmax(post, axis=1)
+    Ta, Ca, Tb, Cb = T[rows,ia][:,None], Cp[rows,ia][:,None], T[rows,ib][:,None], Cp[rows,ib][:,None]
+    base1 = np.where(pre | post, Cp, (Cb - Ca)/(Tb - Ta)*(T - Ta) + Ca)
+    H = cumulative(Cp-base1, dT)
+
+    #the baseline is line_pre - alpha*step (see base): both terms do not change during the iterations.
+    line_pre = pre_i[:,None] + pre_s[:,None]*T
+    step = (pre_i-post_i)[:,None] + (pre_s-post_s)[:,None]*T
+    newbase, alpha = np.empty_like(T), np.empty_like(T)
+    DH, residual, itermax = np.zeros(runs), np.full(runs, np.inf), np.zeros(runs, dtype=int)
+    active = rows
+    k = 0
+    while k < maxiter and len(active):
+        k += 1
+        sel = slice(None) if len(active) == runs else active #views as long as all runs iterate
+        a = H[sel]/H[sel,-1:]
+        nb = line_pre[sel] - a*step[sel]
+        nH = cumulative(Cp[sel]-nb, dT[sel])
+        dH = H[sel,-1] - nH[:,-1]
+        change = nH/nH[:,-1:]
+        np.subtract(change, a, out=change)
+        res = np.maximum(np.abs(dH/nH[:,-1]), np.max(np.abs(change, out=change), axis=1))
+        if len(active) == runs: #no copy needed
+            alpha, newbase, H = a, nb, nH
         else:
-            print('File {} is normalized by a heating rate of {:.2g} K/s, equivalent to {:.2f} K/min, and by {:.2e} grams of sample.'.format(i, hr, hr*60, sample_norm/1000))
-        #print(i, np.average(data[i][4,:])*60)
-        data_norm[i] = np.column_stack((data[i][1,:], data[i][2,:]/(hr*sample_norm)))
-    return data_norm
+            alpha[sel], newbase[sel], H[sel] = a, nb, nH
+        DH[sel], residual[sel], itermax[sel] = dH, res, k
+        active = active[res >= tol]
+    return (pre_s, pre_i, pre_s_err, pre_i_err, post_s, post_i, post_s_err, post_i_err), newbase, H, alpha, DH, itermax, residual
+
+
+def monte_carlo(T, Cp, ROP, replicates, level=0.95, seed=0, tol=1e-9, maxiter=100, block=50000):
+    '''Resampling estimate of the uncertainty of DH, peak position and Delta Cp of one run (T increasing).
+    The residuals of the linear fits before and after the peak region are drawn with replacement and added to Cp, replicates times.
+    The linear fits, the first baseline, the iterative baseline, DH, peak position and Delta Cp of all replicates are calculated together
+    by baseline_rows, in blocks of about block points. Returns a dictionary with the values of the replicates, their standard deviations 
+    and the confidence intervals at level (central interval of the replicates).'''
+    rng = np.random.default_rng(seed)
+    pre, post = float(ROP[0]) > T, float(ROP[1]) < T
+    pre_s, pre_i = linregress_rows(T[None,:], Cp[None,:], pre[None,:])[:2]
+    post_s, post_i = linregress_rows(T[None,:], Cp[None,:], post[None,:])[:2]
+    residuals = np.concatenate((Cp[pre] - (pre_s*T[pre] + pre_i), Cp[post] - (post_s*T[post] + post_i))) #noise of the data around the baseline regions
+    DH, Tpeak, DCp = np.empty(replicates), np.empty(replicates), np.empty(replicates)
+    size = max(block // len(T), 32) #replicates per block: small blocks stay in the processor cache
+    for start in range(0, replicates, size):
+        n = min(size, replicates - start)
+        Cp_r = Cp + rng.choice(residuals, size=(n, len(T)))
+        fits, newbase, H, alpha, dH, itermax, residual = baseline_rows(np.broadcast_to(T, (n, len(T))), Cp_r, ROP, tol, maxiter)
+        peak = np.where(H[:,-1] > 0, np.argmax(Cp_r - newbase, axis=1), np.argmin(Cp_r - newbase, axis=1)) #maximum for positive DH, minimum for negative DH
+        DH[start:start+n] = H[:,-1]
+        Tpeak[start:start+n] = T[peak]
+        DCp[start:start+n] = (fits[5] - fits[1]) + (fits[4] - fits[0])*T[peak]
+    q = [(1 - level)/2, (1 + level)/2]
+    return {'DH': DH, 'T_peak': Tpeak, 'DCp': DCp, 'level': level, 'replicates': replicates,
+            'DH_std': np.std(DH), 'DH_ci': np.quantile(DH, q), 'T_peak_ci': np.quantile(Tpeak, q), 'DCp_std': np.std(DCp), 'DCp_ci': np.quantile(DCp, q)}
+
+
+def sweep_range(sweep):
+    '''Lower and upper limits of the peak regions of a sweep (optional key ROP_sweep_h or ROP_sweep_c: low_start, low_stop, high_start, high_stop, step).'''
+    start_l, stop_l, start_h, stop_h, step = [float(v) for v in sweep]
+    lows = np.linspace(start_l, stop_l, int(round((stop_l - start_l)/step)) + 1)
+    highs = np.linspace(start_h, stop_h, int(round((stop_h - start_h)/step)) + 1)
+    return lows, highs
 
-def baseline(data_norm, params, files, header_heating, header_cooling):
-    print('\n', 15*'*', 'Baseline substraction', 15*'*')
+
+def rop_sweep(T, Cp, lows, highs, DH=None, tol=1e-9, maxiter=100, block=200000):
+    '''DH of a normalized run (T increasing) for every peak region (low, high) of the arrays lows and highs. The linear fits, the iterative baseline 
+    and DH of all peak regions are calculated together by baseline_rows, in blocks of about block points. Peak regions with less than 3 points
+    before or after them are skipped (NaN). DH is the value of the analysis, used as reference of the robustness (default: the median of the map).
+    Returns a dictionary with the map DH[low, high], the convergence of each region and the robustness: spread (max - min) and standard
+    deviation of the map, relative to |DH|.'''
+    L, U = np.meshgrid(np.asarray(lows, dtype=float), np.asarray(highs, dtype=float), indexing='ij')
+    valid = (L < U) & (np.searchsorted(T, L, 'left') >= 3) & (len(T) - np.searchsorted(T, U, 'right') >= 3) #points before and after the region
+    low, high = L[valid], U[valid]
+    DH_map, converged = np.full(L.shape, np.nan), np.zeros(L.shape, dtype=bool)
+    values, ok = np.empty(len(low)), np.empty(len(low), dtype=bool)
+    size = max(block // len(T), 32) #peak regions per block
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, len(low), size):
+            n = min(size, len(low) - start)
+            fits, newbase, H, alpha, dH, itermax, residual = baseline_rows(np.broadcast_to(T, (n, len(T))), np.broadcast_to(Cp, (n, len(T))),
+                                                                           (low[start:start+n], high[start:start+n]), tol, maxiter)
+            values[start:start+n] = H[:,-1]
+            ok[start:start+n] = (tol <= 0) | (residual < tol)
+    DH_map[valid], converged[valid] = values, ok
+    finite = DH_map[np.isfinite(DH_map)]
+    if len(finite) == 0:
+        return {'lows': L[:,0], 'highs': U[0,:], 'DH': DH_map, 'converged': converged, 'regions': 0, 'DH_min': np.nan, 'DH_max': np.nan, 'spread': np.nan, 'std': np.nan}
+    reference = abs(DH) if DH is not None else abs(np.median(finite))
+    return {'lows': L[:,0], 'highs': U[0,:], 'DH': DH_map, 'converged': converged, 'regions': int(valid.sum()), 'DH_min': np.min(finite), 'DH_max': np.max(finite),
+            'spread': (np.max(finite) - np.min(finite))/reference, 'std': np.std(finite)/reference}
+
+
+def scipy_version():
+    ''' Returns the major and minor version of scipy as a tuple of integers.'''
+    return tuple(int(v) for v in re.findall(r'\d+', scipy.__version__)[:2])
+
+
+def baseline(data_norm, params, files, header_heating, header_cooling, results=None, sweeps=None, out=None, log=print):
+    ''' Iterative baseline of the sample runs. Returns a dictionary with the final data of each run (T, Cp-baseline, Cp, baseline, error_baseline, H).
+    If results is a dictionary, it is filled with DH, peak position and Delta Cp (with their errors) and the convergence of each run, see run_results.
+    If sweeps is a dictionary, it is filled with the DH map of the runs with the optional key ROP_sweep_h or ROP_sweep_c (see rop_sweep).
+    If out is given (a dictionary run -> array (points, 6)), the final data are written in these arrays.'''
+    from scipy import interpolate, integrate
+    log('\n', 15*'*', 'Baseline substraction', 15*'*')
+    if scipy_version() < (1, 8):
+        log('must have scipy version 1.8 or greater to estimate error on CP and DH')
     data_baseline = dict()
     
     def roundError(N,E):
         '''Function used to format the values of DH and its error according to the error'''
-        p=10**round(log(E,10)-0.5)
+        p=10**round(math.log(E,10)-0.5)
         return p*round(N/p),p*round(E/p)
 
     for key in header_heating:
         header_heating[key] += 50*'#' + '\n'
     for key in header_cooling:
         header_cooling[key] += 50*'#' + '\n'
-        
-    def base(pre_s, pre_i, post_s, post_i, alpha, T):
-        '''Calculates the baseline according to the linear interpolation of the region before the peak and after the peak'''
-        return pre_i + pre_s*T - alpha*((pre_i-post_i) + (pre_s-post_s)*T)
     
-    def err_base(pre_s, pre_i, post_s, post_i, alpha, T):
-        '''Calculates the standard deviation of the baseline according to the linear interpolation of the region before the peak and after the peak'''
-        return ((pre_i*(1-alpha))**2 + (pre_s*(T-alpha*T))**2 + (post_i*alpha)**2 +(post_s*alpha*T)**2)**0.5
-        
-    for i in files['S_heating']:
+    tol = float(params.get('Baseline_tol', 1e-9)) #convergence criterion of the iterative baseline. With 0, Baseline_maxiter iterations are always performed.
+    maxiter = max(int(params.get('Baseline_maxiter', 100)), 1) #maximum number of iterations of the baseline.
+    batch = params.get('Baseline_batch', True) #runs of equal length are treated together by batch_baseline.
+    replicates = int(params.get('Uncertainty_replicates', 0)) #Monte-Carlo replicates of each run (monte_carlo), 0 for the analytic errors only.
+    level = float(params.get('Uncertainty_level', 0.95)) #confidence level of the Monte-Carlo intervals
+    
+    def iterate(T, Cp, H, pre_s, pre_i, post_s, post_i):
+        '''Iterative calculation of the baseline, weighted by the degree of conversion alpha = H/H[-1] of the previous iteration.
+        Stops when the relative change of H[-1] and the largest change of alpha between two iterations are smaller than tol, or after maxiter iterations. 
+        Returns the baseline, H, the alpha used for the last baseline, the last variation of H[-1], the number of iterations and the final residual.'''
+        itermax = 0
+        while itermax < maxiter:
+            itermax += 1
+            alpha = H/H[-1]
+            newbase = base(pre_s, pre_i, post_s, post_i, alpha, T)
+            newH = integrate.cumulative_trapezoid(Cp-newbase, T, initial=0.0)
+            DH = H[-1] - newH[-1]
+            residual = max(abs(DH/newH[-1]), np.max(np.abs(newH/newH[-1] - alpha)))
+            H = newH
+            if residual < tol:
+                break
+        return newbase, H, alpha, DH, itermax, residual
+    
+    def fit_run(data, ROP):
+        '''Linear fits before and after the peak region ROP and iterative baseline of a single run.'''
+        from scipy.stats import linregress
         #liner fit of the regions before (pre) and after (post) the peak is performed. 
-        pre = data_norm[i][float(params['ROP_h'][0]) > data_norm[i][:,0], :]
-        post = data_norm[i][float(params['ROP_h'][1]) < data_norm[i][:,0], :]
-        
-        
-        pre_linreg = linregress(pre)
-        pre_s, pre_i, pre_s_err, pre_i_err = pre_linreg.slope, pre_linreg.intercept, pre_linreg.stderr, pre_linreg.intercept_stderr
-        post_linreg = linregress(post)
-        post_s, post_i,post_s_err, post_i_err = post_linreg.slope, post_linreg.intercept, post_linreg.stderr, post_linreg.intercept_stderr
-        # print('fit parameters of the linear slope after the heating peak are')
-        # print('intercept = {} +- {}'.format(post_i, post_i_err))
-        # print('slope= {} +- {}'.format(post_s, post_s_err))
+        pre = data[float(ROP[0]) > data[:,0], :]
+        post = data[float(ROP[1]) < data[:,0], :]
+        pre_linreg = linregress(pre[:,0], pre[:,1])
+        post_linreg = linregress(post[:,0], post[:,1])
+        fits = (pre_linreg.slope, pre_linreg.intercept, pre_linreg.stderr, pre_linreg.intercept_stderr,
+                post_linreg.slope, post_linreg.intercept, post_linreg.stderr, post_linreg.intercept_stderr)
         
         #first baseline is calculated as the spline connecting all the points before and the after the peak. 
-        tmp =  data_norm[i][np.logical_or(float(params['ROP_h'][0]) > data_norm[i][:,0], float(params['ROP_h'][1]) < data_norm[i][:,0]), :]
+        tmp =  data[np.logical_or(float(ROP[0]) > data[:,0], float(ROP[1]) < data[:,0]), :]
         tck = interpolate.interp1d(tmp[:,0], tmp[:,1])
-        base1 = tck(data_norm[i][:,0])
+        base1 = tck(data[:,0])
         #first integration using the spline as first baseline. H is the cumulative integral, the area under the curve will be given by H[-1]
-        H = integrate.cumulative_trapezoid(data_norm[i][:,1]-base1, data_norm[i][:,0], initial=0.0) 
-        #Standard deviation in the region before and after the peak, used to limit the loops for optimizing the baseline. 
-        B_pre = data_norm[i][float(params['ROP_h'][0]) > data_norm[i][:,0],:1]*pre_s + pre_i
-        B_post = data_norm[i][float(params['ROP_h'][1]) < data_norm[i][:,0],:1]*post_s + post_i
-
-         ### Evaluation of uncertainty in the DH from noise in the baseline regions###
-        Hst1 = data_norm[i][float(params['ROP_h'][0]) > data_norm[i][:,0]][:,1] - B_pre[:,0] #standard deviation before peak region
-        Hst2 = data_norm[i][float(params['ROP_h'][1]) < data_norm[i][:,0]][:,1] - B_post[:,0] #standard deviation after peak region
-        Hst = np.std(np.append(Hst1, Hst2)) #standard deviation of Cp calculated in baseline regions. 
-        Ns = len(data_norm[i][float(params['ROP_h'][0]) > data_norm[i][:,0],:1])  +  len(data_norm[i][float(params['ROP_h'][1]) < data_norm[i][:,0],:1]) #number of points in the two regions
-        delta = np.average(np.diff(data_norm[i][float(params['ROP_h'][1]) < data_norm[i][:,0]][:,0]))
-        errH = Hst*delta/2*np.sqrt(2.*(len(data_norm[i][:,0])-Ns))
-#        print('Error is', errH)
-
-
+        H = integrate.cumulative_trapezoid(data[:,1]-base1, data[:,0], initial=0.0) 
+        newbase, H, alpha, DH, itermax, residual = iterate(data[:,0], data[:,1], H, fits[0], fits[1], fits[4], fits[5])
+        return {'fits': fits, 'base': newbase, 'H': H, 'alpha': alpha, 'DH': DH, 'iterations': itermax, 'residual': residual}
+    
+    def fit_group(runs, ROP):
+        '''Baseline of all runs of a group (heating or cooling). If the runs have the same length and increasing temperatures, they are treated in one batch.'''
+        lengths = set(len(data_norm[i]) for i in runs)
+        if batch and len(runs) > 1 and len(lengths) == 1 and all(np.all(np.diff(data_norm[i][:,0]) > 0) for i in runs):
+            log('The baseline of the runs {} is calculated in one batch.'.format(runs))
+            group = batch_baseline(np.stack([data_norm[i][:,0] for i in runs]), np.stack([data_norm[i][:,1] for i in runs]), ROP, tol, maxiter)
+            return dict(zip(runs, group))
+        return {i: fit_run(data_norm[i], ROP) for i in runs}
+    
+    def run_results(direction, H, errH, Tpeak, DCp, DCp_err, itermax, residual, mc=None, sw=None):
+        '''Results of a run, in J/g (J/mol if Mw is given), as stored in results. The Monte-Carlo intervals and the sweep of the peak region are NaN if not calculated.'''
+        ci = {'{}_ci_{}'.format(name, bound): float(mc[name + '_ci'][k]) if mc else np.nan for name in ('DH', 'T_peak', 'DCp') for k, bound in enumerate(('low', 'high'))}
+        ci.update({'DH_sweep_' + name: float(sw[key]) if sw else np.nan for name, key in (('min', 'DH_min'), ('max', 'DH_max'), ('spread', 'spread'))})
+        return dict({'direction': direction, 'DH': float(H[-1]), 'DH_err': float(abs(errH)), 'DH_unit': 'J/mol' if 'Mw' in params else 'J/g',
+                     'T_peak': float(Tpeak), 'DCp': float(DCp), 'DCp_err': float(abs(DCp_err)), 'DCp_unit': 'J/K/mol' if 'Mw' in params else 'J/K/g',
+                     'iterations': int(itermax), 'residual': float(residual), 'converged': bool(tol <= 0 or residual < tol),
+                     'replicates': mc['replicates'] if mc else 0}, **ci)
 
+    def resample(i, ROP):
+        '''Monte-Carlo uncertainty of the run i (see monte_carlo), if requested with the key Uncertainty_replicates. Returns the result and the header line.'''
+        if replicates <= 0:
+            return None, ''
+        T, Cp = np.ascontiguousarray(data_norm[i][:,0]), np.ascontiguousarray(data_norm[i][:,1])
+        if not np.all(np.diff(T) > 0):
+            log('The Monte-Carlo uncertainty of file {} is not calculated: the temperature does not increase along the run.'.format(i))
+            return None, ''
+        mc = monte_carlo(T, Cp, ROP, replicates, level, int(params.get('Uncertainty_seed', 0)), tol, maxiter)
+        unit = 'mol' if 'Mw' in params else 'g'
+        s = 'Monte-Carlo estimate ({} replicates, {:.0f}% intervals): DH from {:.5g} to {:.5g} J/{}, peak position from {:.1f} to {:.1f} degC, Delta Cp from {:.2g} to {:.2g} J/K/{}.'.format(
+            replicates, 100*level, mc['DH_ci'][0], mc['DH_ci'][1], unit, mc['T_peak_ci'][0], mc['T_peak_ci'][1], mc['DCp_ci'][0], mc['DCp_ci'][1], unit)
+        log(s)
+        return mc, '# ' + s + ' \n'
 
+    def sweep(i, key, DH):
+        '''DH of the run i for all peak regions of the optional key (ROP_sweep_h or ROP_sweep_c), see rop_sweep. Returns the result and the header line.'''
+        if not params.get(key):
+            return None, ''
+        T, Cp = np.ascontiguousarray(data_norm[i][:,0]), np.ascontiguousarray(data_norm[i][:,1])
+        if not np.all(np.diff(T) > 0):
+            log('The peak regions of file {} are not swept: the temperature does not increase along the run.'.format(i))
+            return None, ''
+        lows, highs = sweep_range(params[key])
+        sw = rop_sweep(T, Cp, lows, highs, DH, tol, maxiter)
+        if sweeps is not None:
+            sweeps[i] = sw
+        unit = 'mol' if 'Mw' in params else 'g'
+        s = 'DH over {} peak regions (start {:.1f} to {:.1f} degC, end {:.1f} to {:.1f} degC): from {:.5g} to {:.5g} J/{}, relative spread {:.2g}.'.format(
+            sw['regions'], lows[0], lows[-1], highs[0], highs[-1], sw['DH_min'], sw['DH_max'], unit, sw['spread'])
+        log(s)
+        return sw, '# ' + s + ' \n'
 
-        DH = H[-1] #variation in area between sucessive loops. The first value is set to the total area. 
-        itermax = 0
-        newbase = base1
-        s = '\nBaseline substraction for file {}'.format(i)
-        print(s)
-        while itermax < 100:
-            itermax += 1
-            newbase = base(pre_s, pre_i, post_s, post_i, H/H[-1], data_norm[i][:,0])
-            err_baseline = err_base(pre_s_err, pre_i_err, post_s_err, post_i_err, H/H[-1], data_norm[i][:,0])
-            newH = integrate.cumulative_trapezoid(data_norm[i][:,1]-newbase, data_norm[i][:,0], initial=0.0)
-            
-            DH = H[-1] - newH[-1]
-            H = newH
-            
-            
-            errH = (integrate.cumulative_trapezoid(err_baseline**2, data_norm[i][:,0], initial=0.0)[-1])**0.5
+    def convergence(itermax, residual):
+        '''Line of the header reporting the convergence of the baseline.'''
+        if tol <= 0:
+            return '# Baseline calculated with {} iterations, final residual {:.2g}. \n'.format(itermax, residual)
+        if residual < tol:
+            return '# Baseline converged after {} iterations, final residual {:.2g}. \n'.format(itermax, residual)
+        log('Warning: the baseline did not converge within {} iterations, final residual {:.2g}.'.format(itermax, residual))
+        return '# Baseline did not converge within {} iterations, final residual {:.2g}. \n'.format(itermax, residual)
         
+    fits = fit_group(files['S_heating'], params['ROP_h'])
+    for i in files['S_heating']:
+        pre_s, pre_i, pre_s_err, pre_i_err, post_s, post_i, post_s_err, post_i_err = fits[i]['fits']
+        newbase, H, alpha, DH, itermax, residual = [fits[i][k] for k in ('base', 'H', 'alpha', 'DH', 'iterations', 'residual')]
+        s = '\nBaseline substraction for file {}'.format(i)
+        log(s)
+        err_baseline = err_base(pre_s_err, pre_i_err, post_s_err, post_i_err, alpha, data_norm[i][:,0])
+        errH = (integrate.cumulative_trapezoid(err_baseline**2, data_norm[i][:,0], initial=0.0)[-1])**0.5
 
         if 'Mw' in params:
-            print('Iteration number {}, enthalpy variation of {:3g} J/mol, final value of DH is {:.5g} +- {:.2g} kJ/mol'.format(itermax, abs(DH/H[-1]), H[-1]/1e3, abs(errH)/1e3))
+            log('Iteration number {}, enthalpy variation of {:3g} J/mol, final value of DH is {:.5g} +- {:.2g} kJ/mol'.format(itermax, abs(DH/H[-1]), H[-1]/1e3, abs(errH)/1e3))
             header_heating[i] += '# DH of the heating run is {:.5g} +- {:.2g} kJ/mol. \n'.format(*roundError(H[-1]/1e3, abs(errH/1e3)))
         else:
-            print('Iteration number {}, enthalpy variation of {:3g} J/g, final value of DH is {:.5g} +- {:.2g} J/g'.format(itermax, abs(DH/H[-1]), H[-1], abs(errH)))
+            log('Iteration number {}, enthalpy variation of {:3g} J/g, final value of DH is {:.5g} +- {:.2g} J/g'.format(itermax, abs(DH/H[-1]), H[-1], abs(errH)))
             header_heating[i] += '# DH of the heating run is {:.5g} +- {:.2g} J/g. \n'.format(H[-1], abs(errH))
+        header_heating[i] += convergence(itermax, residual)
             
-        j = np.column_stack([data_norm[i][:,0], data_norm[i][:,1]-newbase, data_norm[i][:,1], newbase, err_baseline, H])
+        j = np.stack([data_norm[i][:,0], data_norm[i][:,1]-newbase, data_norm[i][:,1], newbase, err_baseline, H], axis=1, out=None if out is None else out[i])
         data_baseline[i] = j
         
         ##error estimate on DH from the baseline uncertainty
@@ -773,18 +1125,20 @@ def baseline(data_norm, params, files, header_heating, header_cooling):
         
         
         #determination of maximum or minimum of temperature and Delta CP at Tmax (or Tmin)
+        Tpeak, DCp, DCp_err = np.nan, np.nan, np.nan
         if H[-1] > 0:
             Tmax = data_norm[i][np.argmax(data_norm[i][:,1]-newbase),0]
             header_heating[i] += '# Peak position is at {:.1f} degC. \n'.format(Tmax)
             DCp = (post_i - pre_i) + (post_s-pre_s)*Tmax
             DCp_err = (post_i_err - pre_i_err) + (post_s_err-pre_s_err)*Tmax
+            Tpeak = Tmax
             
-            print('Peak position is at {:.1f} degC'.format(Tmax))
+            log('Peak position is at {:.1f} degC'.format(Tmax))
             if 'Mw' in params:
-                print('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/mol.'.format(DCp, abs(DCp_err)))
+                log('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/mol.'.format(DCp, abs(DCp_err)))
                 header_heating[i] += '# Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/mol. \n'.format(DCp, abs(DCp_err))
             else:
-                print('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/g.'.format(DCp, abs(DCp_err)))
+                log('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/g.'.format(DCp, abs(DCp_err)))
                 header_heating[i] += '# Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/g. \n'.format(DCp, abs(DCp_err))
                 
         if H[-1] < 0:
@@ -792,75 +1146,43 @@ def baseline(data_norm, params, files, header_heating, header_cooling):
             header_heating[i] += '# Peak position is at {:.1f} degC'.format(Tmin)
             DCp = (post_i - pre_i) + (post_s-pre_s)*Tmin
             DCp_err = (post_i_err - pre_i_err) + (post_s_err-pre_s_err)*Tmin
-            print('Peak position is at {:.1f} degC'.format(Tmin))
+            Tpeak = Tmin
+            log('Peak position is at {:.1f} degC'.format(Tmin))
             if 'Mw' in params:
-                print('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/mol.'.format(DCp, abs(DCp_err)))
+                log('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/mol.'.format(DCp, abs(DCp_err)))
                 header_heating[i] += '# Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/mol. \n'.format(DCp, abs(DCp_err))
             else:
-                print('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/g.'.format(DCp, abs(DCp_err)))
+                log('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/g.'.format(DCp, abs(DCp_err)))
                 header_heating[i] += '# Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/g. \n'.format(DCp, abs(DCp_err))
-        header_heating[i] += 50*'#' + '\n'
+        mc, s = resample(i, params['ROP_h'])
+        sw, t = sweep(i, 'ROP_sweep_h', H[-1])
+        header_heating[i] += s + t + 50*'#' + '\n'
+        if results is not None:
+            results[i] = run_results('heating', H, errH, Tpeak, DCp, DCp_err, itermax, residual, mc, sw)
                 
+    fits = fit_group(files['S_cooling'], params['ROP_c'])
     for i in files['S_cooling']:
-        # data_norm[i] = data_norm[i][::-1,:]
-
-        #liner fit of the regions before (pre) and after (post) the peak is performed. 
-        pre = data_norm[i][float(params['ROP_c'][0]) > data_norm[i][:,0], :]
-        post = data_norm[i][float(params['ROP_c'][1]) < data_norm[i][:,0], :]
-        # print(pre, post)
-        pre_linreg = linregress(pre)
-        pre_s, pre_i, pre_s_err, pre_i_err = pre_linreg.slope, pre_linreg.intercept, pre_linreg.stderr, pre_linreg.intercept_stderr
-        post_linreg = linregress(post)
-        post_s, post_i,post_s_err, post_i_err = post_linreg.slope, post_linreg.intercept, post_linreg.stderr, post_linreg.intercept_stderr
-        
-        #first baseline is calculated as the spline connecting all the points before and the after the peak. 
-        tmp =  data_norm[i][np.logical_or(float(params['ROP_c'][0]) > data_norm[i][:,0], float(params['ROP_c'][1]) < data_norm[i][:,0]), :]
-        
-        tck = interpolate.interp1d(tmp[:,0], tmp[:,1])
-        base1 = tck(data_norm[i][:,0])
-        #first integration using the spline as first baseline. H is the cumulative integral, the area under the curve will be given by H[-1]
-        H = integrate.cumulative_trapezoid(data_norm[i][:,1]-base1, data_norm[i][:,0], initial=0.0) 
-        #Standard deviation in the region before and after the peak, used to limit the loops for optimizing the baseline. 
-        B_pre = data_norm[i][float(params['ROP_c'][0]) > data_norm[i][:,0],:1]*pre_s + pre_i
-        B_post = data_norm[i][float(params['ROP_c'][1]) < data_norm[i][:,0],:1]*post_s + post_i
-
- 
-        Hst1 = data_norm[i][float(params['ROP_c'][0]) > data_norm[i][:,0]][:,1] - B_pre[:,0] #standard deviation before peak region
-        Hst2 = data_norm[i][float(params['ROP_c'][1]) < data_norm[i][:,0]][:,1] - B_post[:,0] #standard deviation after peak region
-        Hst = np.std(np.append(Hst1, Hst2)) #standard deviation of Cp calculated in baseline regions. 
-        Ns = len(data_norm[i][float(params['ROP_c'][0]) > data_norm[i][:,0],:1])  +  len(data_norm[i][float(params['ROP_c'][1]) < data_norm[i][:,0],:1]) #number of points in the two regions
-        delta = np.average(np.diff(data_norm[i][float(params['ROP_c'][1]) < data_norm[i][:,0]][:,0]))
-        errH = Hst*delta/2*np.sqrt(2.*(len(data_norm[i][:,0])-Ns))
-        
-        
-        DH = H[-1] #variation in area between sucessive loops. The first value is set to the total area. 
-        itermax = 0
-        if 'Mw' in params:
-            s = '\nBaseline substraction for file {}:'.format(i)
-        else: 
-            s = '\nBaseline substraction for file {}:'.format(i)
-        print(s)
-        while  itermax < 100:
-            itermax += 1
-            newbase = base(pre_s, pre_i, post_s, post_i, H/H[-1], data_norm[i][:,0])
-            err_baseline = err_base(pre_s_err, pre_i_err, post_s_err, post_i_err, H/H[-1], data_norm[i][:,0])
-            newH = integrate.cumulative_trapezoid(data_norm[i][:,1]-newbase, data_norm[i][:,0], initial=0.0)
-            DH = H[-1] - newH[-1]
-            H = newH
-            errH = (integrate.cumulative_trapezoid(err_baseline**2, data_norm[i][:,0], initial=0.0)[-1])**0.5
+        pre_s, pre_i, pre_s_err, pre_i_err, post_s, post_i, post_s_err, post_i_err = fits[i]['fits']
+        newbase, H, alpha, DH, itermax, residual = [fits[i][k] for k in ('base', 'H', 'alpha', 'DH', 'iterations', 'residual')]
+        s = '\nBaseline substraction for file {}:'.format(i)
+        log(s)
+        err_baseline = err_base(pre_s_err, pre_i_err, post_s_err, post_i_err, alpha, data_norm[i][:,0])
+        errH = (integrate.cumulative_trapezoid(err_baseline**2, data_norm[i][:,0], initial=0.0)[-1])**0.5
             
         if 'Mw' in params:
-            print('Iteration number {}, enthalpy variation of {:.3g} J/mol, final value of DH is {:.5g} +- {:.2g} J/mol'.format(itermax, abs(DH/H[-1]), H[-1], abs(errH)))
+            log('Iteration number {}, enthalpy variation of {:.3g} J/mol, final value of DH is {:.5g} +- {:.2g} J/mol'.format(itermax, abs(DH/H[-1]), H[-1], abs(errH)))
             header_cooling[i] += '# DH of the cooling run is {:.5g} +- {:.2g} kJ/mol. \n'.format(*roundError(H[-1]/1e3, abs(errH/1e3)))
         else:
-            print('Iteration number {}, enthalpy variation of {:.3g} J/g, final value of DH is {:.5g} +- {:.2g} J/g'.format(itermax, abs(DH/H[-1]), H[-1], abs(errH)))
+            log('Iteration number {}, enthalpy variation of {:.3g} J/g, final value of DH is {:.5g} +- {:.2g} J/g'.format(itermax, abs(DH/H[-1]), H[-1], abs(errH)))
             header_cooling[i] += '# DH of the cooling run is {:.5g} +- {:.2g} J/g. \n'.format(H[-1], abs(errH))
+        header_cooling[i] += convergence(itermax, residual)
         
         
-        j = np.column_stack([data_norm[i][:,0], data_norm[i][:,1]-newbase, data_norm[i][:,1], newbase, err_baseline, H])
+        j = np.stack([data_norm[i][:,0], data_norm[i][:,1]-newbase, data_norm[i][:,1], newbase, err_baseline, H], axis=1, out=None if out is None else out[i])
         data_baseline[i] = j       
         
         #determination of maximum or minimum of temperature and Delta CP at Tmax (or Tmin)
+        Tpeak, DCp, DCp_err = np.nan, np.nan, np.nan
         if H[-1] < 0: #if process is endothermic
             # print(20*'/')
             # print(data_norm[i][:,1]-newbase)
@@ -872,13 +1194,14 @@ def baseline(data_norm, params, files, header_heating, header_cooling):
             header_cooling[i] += '# Peak position is at {:.1f} degC. \n'.format(Tmin)
             DCp = (post_i - pre_i) + (post_s-pre_s)*Tmin
             DCp_err = (post_i_err - pre_i_err) + (post_s_err-pre_s_err)*Tmin
-            print('Peak position is at {:.1f} degC'.format(Tmin))
+            Tpeak = Tmin
+            log('Peak position is at {:.1f} degC'.format(Tmin))
             
             if 'Mw' in params:
-                print('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/mol.'.format(DCp, abs(DCp_err)))
+                log('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/mol.'.format(DCp, abs(DCp_err)))
                 header_cooling[i] += '# Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/mol. \n'.format(DCp, abs(DCp_err))
             else:
-                print('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/g.'.format(DCp, abs(DCp_err)))
+                log('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/g.'.format(DCp, abs(DCp_err)))
                 header_cooling[i] += '# Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/g. \n'.format(DCp, abs(DCp_err))
                 
         if H[-1] > 0: #if process is exothermic
@@ -886,65 +1209,71 @@ def baseline(data_norm, params, files, header_heating, header_cooling):
             header_cooling[i] += '# Peak position is at {:.1f} degC'.format(Tmax)
             DCp = (post_i - pre_i) + (post_s-pre_s)*Tmax
             DCp_err = (post_i_err - pre_i_err) + (post_s_err-pre_s_err)*Tmax
-            print('Peak position is at {:.1f} degC'.format(Tmax))
+            Tpeak = Tmax
+            log('Peak position is at {:.1f} degC'.format(Tmax))
             if 'Mw' in params:
-                print('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/mol.'.format(DCp, abs(DCp_err)))
+                log('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/mol.'.format(DCp, abs(DCp_err)))
                 header_cooling[i] += '# Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/mol. \n'.format(DCp, abs(DCp_err))
             else:
-                print('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/g.'.format(DCp, abs(DCp_err)))
+                log('Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/g.'.format(DCp, abs(DCp_err)))
                 header_cooling[i] += '# Calculated Delta Cp at the peak position is {:.2g} +- {:.0g} J/K/g. \n'.format(DCp, abs(DCp_err))
                 
-        header_cooling[i] += 50*'#' + '\n'
+        mc, s = resample(i, params['ROP_c'])
+        sw, t = sweep(i, 'ROP_sweep_c', H[-1])
+        header_cooling[i] += s + t + 50*'#' + '\n'
+        if results is not None:
+            results[i] = run_results('cooling', H, errH, Tpeak, DCp, DCp_err, itermax, residual, mc, sw)
     
     return data_baseline
 
-def export_final_data(files, data, params, header_heating, header_cooling):
-    ''' Function which exports the final data-set.'''
-    print('\n', 15*'*', 'Exporting the treated data-set', 15*'*')
+def export_final_data(files, data, params, header_heating, header_cooling, log=print):
+    ''' Function which exports the final data-set. Header and data of each run are written in one pass.'''
+    log('\n', 15*'*', 'Exporting the treated data-set', 15*'*')
     
    
-    def export(file, data, params):
+    def export(file, data, params, header):
             filename = os.path.join(os.path.join(params['Folder'],'Output'), 'exp-' + str(file)) 
             if 'Mw' in params:
                 s = 'Temp/ [degC] \t CP-baseline / [J/K/mol] \t CP [J/K/mol] \t baseline [J/K/mol] \t error_baseline [J/K/mol] \t H [J/mol]'
             else:
                 s = 'Temp/ [degC] \t CP-baseline / [J/K/g] \t CP [J/K/g] \t baseline [J/K/g]  \t error_baseline [J/K/g] \t H [J/g]'
             
-            with open(filename, 'a') as f:
+            with open(filename, 'w') as f:
+                f.write(header)
                 np.savetxt(f, data[file], delimiter='\t', header=s)
-                print('File {} exported correctly'.format(filename))
+                log('File {} exported correctly'.format(filename))
         
-
-    
-    def write_header(header_heating, header_cooling, files, params):
-        for i in files['S_heating']:
-            filename = os.path.join(os.path.join(params['Folder'],'Output'), 'exp-' + str(i))
-            
-            with open(filename, 'w') as f:
-                f.write(header_heating[i])                
-                
-        for i in files['S_cooling']:
-            filename = os.path.join(os.path.join(params['Folder'],'Output'), 'exp-' + str(i))
-            with open(filename, 'w') as f:
-                f.write(header_cooling[i])  
-
-                
-        return None
-
-    write_header(header_heating, header_cooling, files, params)           
     for i in files['S_heating']:
-        export(i, data, params)
+        export(i, data, params, header_heating[i])
     for i in files['S_cooling']:
-        export(i, data, params)
+        export(i, data, params, header_cooling[i])
         
 
+
+def export_sweeps(files, sweeps, params, log=print):
+    ''' Exports the DH maps of the sweeps of the peak region (see rop_sweep) as sweep-<file>: one row per start of the peak region,
+    one column per end, NaN for the regions which were not calculated.'''
+    log('\n', 15*'*', 'Exporting the sweeps of the peak region', 15*'*')
+    unit = 'J/mol' if 'Mw' in params else 'J/g'
+    for i in list(files['S_heating']) + list(files['S_cooling']):
+        if i not in sweeps:
+            continue
+        sw = sweeps[i]
+        filename = os.path.join(os.path.join(params['Folder'],'Output'), 'sweep-' + str(i))
+        with open(filename, 'w') as f:
+            f.write('# DH [{}] of file {} for each peak region: one row per start (first column, degC), one column per end (first row, degC). \n'.format(unit, i))
+            f.write('# {} peak regions, DH from {:.5g} to {:.5g} {}, relative spread {:.3g}, relative standard deviation {:.3g}. \n'.format(
+                sw['regions'], sw['DH_min'], sw['DH_max'], unit, sw['spread'], sw['std']))
+            np.savetxt(f, np.column_stack([sw['lows'], sw['DH']]), delimiter='\t', header='\t'.join(['start \\ end'] + ['{:g}'.format(v) for v in sw['highs']]))
+        log('File {} exported correctly'.format(filename))
+
     
-def export_uncut_data(files, data, params, header_heating, header_cooling):
-    ''' Function which exports the final data-set.'''
-    print('\n', 15*'*', 'Exporting the uncut data-set', 15*'*')
+def export_uncut_data(files, data, params, header_heating, header_cooling, log=print):
+    ''' Function which exports the final data-set. Header and data of each run are written in one pass.'''
+    log('\n', 15*'*', 'Exporting the uncut data-set', 15*'*')
     
-    def export(file, data, params):
-            print(file)
+    def export(file, data, params, header):
+            log(file)
             filename = os.path.join(os.path.join(params['Folder'],'Output'), 'raw_norm-' + str(file)) 
             if 'Mw' in params:
                 s = 'Temp/ [degC]  \t CP [J/K/mol]'
@@ -952,45 +1281,25 @@ def export_uncut_data(files, data, params, header_heating, header_cooling):
                 s = 'Temp/ [degC] \t CP [J/K/g]'
             
             # print(np.shape(data[file]))
-            with open(filename, 'a') as f:
+            with open(filename, 'w') as f:
+                f.write(write_header(header))
                 np.savetxt(f, data, delimiter='\t', header=s)
-                print('yeppy')
+                log('yeppy')
         
             return None
     
-    def write_header(header_heating, header_cooling, files, params):
-        for i in files['S_heating']:
-            filename = os.path.join(os.path.join(params['Folder'],'Output'), 'raw_norm-' + str(i))
-            header = ''
-            for line in header_heating[i].splitlines():
-                if 'Peak is located' not in line:
-                    if 'degC were analyzed' not in line:
-                        header += line + '\n'
-            header += '##################################################\n'
-            
-            with open(filename, 'w') as f:
-                f.write(header)                
-                
-        for i in files['S_cooling']:
-            filename = os.path.join(os.path.join(params['Folder'],'Output'), 'raw_norm-' + str(i))
-            header = ''
-            for line in header_cooling[i].splitlines():
-                if 'Peak is located' not in line:
-                    if 'degC were analyzed' not in line:
-                        header += line + '\n'
-            header += '##################################################\n'
-            
-            with open(filename, 'w') as f:
-                f.write(header)  
-
-                
-        return None
+    def write_header(run_header):
+        header = ''
+        for line in run_header.splitlines():
+            if 'Peak is located' not in line:
+                if 'degC were analyzed' not in line:
+                    header += line + '\n'
+        header += '##################################################\n'
+        return header
 
-    write_header(header_heating, header_cooling, files, params)           
     for i in files['S_heating']:
         # print(i)
-        export(i, data[i], params)
+        export(i, data[i], params, header_heating[i])
     for i in files['S_cooling']:
         # print(i)
-        export(i, data[i], params)
-        
\ No newline at end of file
+        export(i, data[i], params, header_cooling[i])
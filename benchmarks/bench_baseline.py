@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the iterative baseline: fixed number of iterations (Baseline_tol = 0, as up to version 1.2.3) against the convergence-controlled iteration.
+Run from the main folder of pyDSC with:  python3 benchmarks/bench_baseline.py
+"""
+import contextlib
+import copy
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import DSC1 as dsc
+
+folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rawdata')
+sample = {'Folder': folder,
+          'Heating_runs': ['decanoic_acid_run4.txt'], 'Cooling_runs': ['decanoic_acid_run5.txt'],
+          'Empty_cell_heat_runs': [], 'Empty_cell_cool_runs': [], 'Buffer_heat_runs': [], 'Buffer_cool_runs': [],
+          'Dataformat': 'TA_temp_power_time', 'Header_length': 9, 'mass_s': 5.0, 'mass_r': 0.0, 'mass_bb': 0.0, 's_wt': 1.00,
+          'ROI_h': [20,50], 'ROI_c': [10, 30], 'ROP_h': [25, 35], 'ROP_c': [20, 25], 'Scanrate_h': 1.0, 'Scanrate_c': 1.0,
+          'bins': 10, 'Input': 'exo-up', 'Output': 'exo-down', 'Exo_in_plot': True, 'unit_time': 's', 'unit_temp': 'degC', 'unit_power': 'uW',
+          'Cache': False}
+
+
+def normalized_data(sample):
+    ''' Runs the pipeline up to the normalization of the sample runs.'''
+    header_heating, header_cooling = dict(), dict()
+    files = dsc.read_files('bench', 'bench', sample, header_heating, header_cooling)
+    params = dsc.read_params(sample, header_heating, header_cooling)
+    data, dataraw, data_uncut = dsc.extract_data(files, params, header_heating, header_cooling)
+    dsc.check_data(data, files, params, header_heating, header_cooling)
+    refs = dsc.average_refs(data, files)
+    data_c = dsc.correction(data, refs, files, params)
+    return files, params, dsc.normalize_sampleruns(files, data_c, params), header_heating, header_cooling
+
+
+def run_baseline(files, params, data_norm, headers, repeat=10):
+    ''' Returns the best time of repeat calls of the baseline and its result.'''
+    best = float('inf')
+    for _ in range(repeat):
+        header_heating, header_cooling = copy.deepcopy(headers[0]), copy.deepcopy(headers[1])
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            result = dsc.baseline(data_norm, params, files, header_heating, header_cooling)
+            best = min(best, time.perf_counter() - t0)
+    return best, result, header_heating, header_cooling
+
+
+if __name__ == '__main__':
+    with contextlib.redirect_stdout(io.StringIO()):
+        files, params, data_norm, header_heating, header_cooling = normalized_data(sample)
+    nruns = len(files['S_heating']) + len(files['S_cooling'])
+    t_fixed, fixed, _, _ = run_baseline(files, dict(params, Baseline_tol=0), data_norm, (header_heating, header_cooling))
+    t_conv, conv, hh, hc = run_baseline(files, params, data_norm, (header_heating, header_cooling))
+    print('Fixed 100 iterations:     {:8.2f} ms per run'.format(t_fixed/nruns*1e3))
+    print('Convergence (tol = 1e-9): {:8.2f} ms per run'.format(t_conv/nruns*1e3))
+    print('Time saved per run:       {:8.2f} ms (speed-up {:.1f})'.format((t_fixed-t_conv)/nruns*1e3, t_fixed/t_conv))
+    for file in fixed:
+        header = hh[file] if file in hh else hc[file]
+        iterations = [line for line in header.splitlines() if 'Baseline' in line][0]
+        print('{}: DH = {:.6g} (fixed) {:.6g} (convergence), relative difference {:.1e} {}'.format(file, fixed[file][-1,5], conv[file][-1,5],
+              abs(fixed[file][-1,5]/conv[file][-1,5]-1), iterations))
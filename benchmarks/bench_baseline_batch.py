@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the baseline of many runs of equal length: file by file (Baseline_batch = False) against batch_baseline.
+The heating run of decanoic acid is repeated with some noise to obtain the runs.
+Run from the main folder of pyDSC with:  python3 benchmarks/bench_baseline_batch.py [number of runs]
+"""
+import contextlib
+import io
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_baseline import normalized_data, run_baseline, sample
+
+
+def repeated_runs(files, data_norm, nruns, noise=1e-3):
+    ''' Returns files, data_norm and (empty) headers with nruns noisy copies of the first heating run.'''
+    run = data_norm[files['S_heating'][0]]
+    rng = np.random.default_rng(0)
+    names = ['run_{}'.format(k) for k in range(nruns)]
+    data = dict()
+    for name in names:
+        data[name] = run.copy()
+        data[name][:,1] += noise*rng.standard_normal(len(run))*np.abs(run[:,1]).max()
+    files = dict(files, S_heating=names, S_cooling=[])
+    return files, data, ({name: '' for name in names}, dict())
+
+
+if __name__ == '__main__':
+    nruns = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with contextlib.redirect_stdout(io.StringIO()):
+        files, params, data_norm, header_heating, header_cooling = normalized_data(sample)
+    files, data_norm, headers = repeated_runs(files, data_norm, nruns)
+    t_file, by_file, _, _ = run_baseline(files, dict(params, Baseline_batch=False), data_norm, headers, repeat=3)
+    t_batch, batch, _, _ = run_baseline(files, params, data_norm, headers, repeat=3)
+    print('{} runs of {} points'.format(nruns, len(data_norm['run_0'])))
+    print('File by file: {:8.2f} ms per run'.format(t_file/nruns*1e3))
+    print('Batch:        {:8.2f} ms per run (speed-up {:.1f})'.format(t_batch/nruns*1e3, t_file/t_batch))
+    diff = max(np.max(np.abs(by_file[f] - batch[f])/np.maximum(np.abs(by_file[f]), 1e-300)) for f in by_file)
+    print('Largest relative difference between the results: {:.1e}'.format(diff))
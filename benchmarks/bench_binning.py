@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the binning: loop over the rows with np.vstack (as up to version 1.2.3) against the vectorized bin_points, 
+and binning on a fixed temperature step (optional key Bin_step).
+Run from the main folder of pyDSC with:  python3 benchmarks/bench_binning.py [number of points]
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import DSC1 as dsc
+
+
+def bin_rows(data, width):
+    ''' Binning as done up to version 1.2.3, one row after the other.'''
+    data_binned = np.vstack(([data[i,:(data[i,:].size // width) * width].reshape(-1, width).mean(axis=1) for i in range(len(data[:,0]))]))
+    stdev = np.std(data[2,:(data[2,:].size // width) * width].reshape(-1, width), axis=1)
+    return data_binned, stdev
+
+
+if __name__ == '__main__':
+    N = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rng = np.random.default_rng(0)
+    time = np.arange(N, dtype=float)
+    data = np.vstack([time, 20 + time/60, rng.standard_normal(N)]) #1 K/min, one point per second
+    for width in (2, 5, 10, 100):
+        t_rows = min(timeit.repeat(lambda: bin_rows(data, width), number=5, repeat=3))/5
+        t_vec = min(timeit.repeat(lambda: dsc.bin_points(data, width), number=5, repeat=3))/5
+        same = all(np.array_equal(a, b) for a, b in zip(bin_rows(data, width), dsc.bin_points(data, width)))
+        print('bins = {:4d}: rows {:7.2f} ms, vectorized {:7.2f} ms, identical: {}'.format(width, t_rows*1e3, t_vec*1e3, same))
+    for step in (0.05, 0.5):
+        t_step = min(timeit.repeat(lambda: dsc.combine_cells([dsc.temperature_cells(data, step)]), number=5, repeat=3))/5
+        print('Bin_step = {}: {:7.2f} ms, {} bins'.format(step, t_step*1e3, len(dsc.combine_cells([dsc.temperature_cells(data, step)])[1])))
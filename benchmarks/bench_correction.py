@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the correction of many sample runs for the empty cell and the buffer: file by file, as in the previous versions
+(one interp1d per reference and per sample, called for each run), against DSC1.correction, which interpolates the references
+on the temperatures of all runs in one call. The results of both must be identical.
+Run from the main folder of pyDSC with:  python3 benchmarks/bench_correction.py [number of runs] [points per run]
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import DSC1 as dsc
+
+
+def binned_run(T0, T1, n, rng, cooling=False):
+    ''' A binned run (time, temperature, heatflow, stdev, heatrate) of n points from T0 to T1.'''
+    T = np.linspace(T1, T0, n) if cooling else np.linspace(T0, T1, n)
+    return np.array([np.arange(n)*6.0, T, 0.1*T + rng.standard_normal(n), rng.random(n), np.full(n, -0.0167 if cooling else 0.0167)])
+
+
+def correction_by_file(data, refs, files, params):
+    ''' Correction of the runs file by file, with the interpolants built for each sample, as DSC1.correction did before version 2026.10.18.'''
+    from scipy import interpolate
+    data_c = {}
+    for direction in ('cooling', 'heating'):
+        EC, B = refs['EC_' + direction], refs['B_' + direction]
+        use_buffer = np.shape(B)[0] and float(params['mass_bb']) > 0.0
+        sf = (float(params['mass_s'])*(1.-float(params['s_wt'])) - float(params['mass_r']))/float(params['mass_bb']) if use_buffer else 0.0
+        tck_EC = interpolate.interp1d(EC[1,:], EC[2,:], fill_value='extrapolate') if np.shape(EC)[0] else None
+        tck_B = None
+        if use_buffer:
+            Buffer = np.array((B[0,:], B[1,:], B[2,:]-tck_EC(B[1,:]))) if tck_EC is not None else B
+            tck_B = interpolate.interp1d(Buffer[1,:], Buffer[2,:], fill_value='extrapolate')
+        for i in files['S_' + direction]:
+            corrected = data[i][2,:]
+            if tck_EC is not None:
+                corrected = corrected - tck_EC(data[i][1,:])*(dsc.EC_SCALE_HEATING if direction == 'heating' and not use_buffer else 1.0)
+            if tck_B is not None:
+                corrected = corrected - tck_B(data[i][1,:])*sf
+            data_c[i] = np.array([data[i][0,:], data[i][1,:], corrected, data[i][3,:], data[i][4,:]])
+    return data_c
+
+
+def timed(function, *args, repeat=3):
+    ''' Best time of repeat calls and the result of the last one.'''
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+if __name__ == '__main__':
+    nruns = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    npoints = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rng = np.random.default_rng(0)
+    data = {}
+    files = {'S_heating': ['h{}'.format(k) for k in range(nruns)], 'S_cooling': ['c{}'.format(k) for k in range(nruns)]}
+    for k in range(nruns):
+        data['h{}'.format(k)] = binned_run(20 + 0.01*k, 80, npoints, rng)
+        data['c{}'.format(k)] = binned_run(20, 80 - 0.01*k, npoints, rng, cooling=True)
+    refs = {'EC_heating': binned_run(10, 90, npoints, rng), 'B_heating': binned_run(10, 90, npoints, rng),
+            'EC_cooling': binned_run(10, 90, npoints, rng, cooling=True)[:,::-1], 'B_cooling': binned_run(10, 90, npoints, rng, cooling=True)[:,::-1]}
+    params = {'mass_s': 500.0, 's_wt': 0.015, 'mass_r': 0.0, 'mass_bb': 2.0}
+
+    print('{} heating and {} cooling runs of {} points, corrected for empty cell and buffer'.format(nruns, nruns, npoints))
+    t_file, by_file = timed(correction_by_file, data, refs, files, params)
+    t_new, new = timed(dsc.correction, data, refs, files, params)
+    same = by_file.keys() == new.keys() and all(np.array_equal(by_file[i], new[i]) for i in new)
+    print('File by file:  {:8.2f} ms'.format(t_file*1e3))
+    print('Vectorized:    {:8.2f} ms (speed-up {:.1f})'.format(t_new*1e3, t_file/t_new))
+    print('Identical results: {}'.format(same))
+    identical = same
+    for name, reference in (('empty cell only', {'EC_heating': refs['EC_heating'], 'EC_cooling': refs['EC_cooling'], 'B_heating': np.array([]), 'B_cooling': np.array([])}),
+                            ('no references', {key: np.array([]) for key in refs})):
+        t_file, by_file = timed(correction_by_file, data, reference, files, params)
+        t_new, new = timed(dsc.correction, data, reference, files, params)
+        same = all(np.array_equal(by_file[i], new[i]) for i in new)
+        identical = identical and same
+        print('{:16s} file by file {:8.2f} ms, vectorized {:8.2f} ms, identical: {}'.format(name, t_file*1e3, t_new*1e3, same))
+    if not identical:
+        sys.exit(1)
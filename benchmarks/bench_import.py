@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the import time of the pyDSC modules, measured with python -X importtime in a fresh interpreter.
+The heavy packages (matplotlib, scipy.stats, scipy.interpolate, scipy.integrate) are only imported by the stages using them:
+the script lists the slowest imports and fails (exit status 1) if one of the modules imports a package it should not.
+Run from the main folder of pyDSC with:  python3 benchmarks/bench_import.py
+"""
+import os
+import subprocess
+import sys
+
+folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+#module -> packages which must not be imported with it
+LAZY = {'dsc_read': ('scipy', 'matplotlib'),
+        'dsc_cache': ('scipy', 'matplotlib'),
+        'DSC1': ('matplotlib', 'scipy.stats', 'scipy.interpolate', 'scipy.integrate'),
+        'dsc_batch': ('DSC1', 'matplotlib', 'scipy'),
+        'dsc_follow': ('matplotlib', 'scipy.stats', 'scipy.interpolate', 'scipy.integrate')}
+
+
+def import_times(module):
+    ''' Imports module in a new interpreter. Returns the total import time in ms and a dictionary module -> cumulative import time in ms.'''
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)], cwd=folder, capture_output=True, text=True, check=True).stderr
+    times = dict()
+    for line in out.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)/1000
+    return times.get(module, 0.0), times
+
+
+if __name__ == '__main__':
+    failed = False
+    for module, forbidden in LAZY.items():
+        total, times = import_times(module)
+        slowest = sorted(((t, m) for m, t in times.items() if '.' not in m and m != module), reverse=True)[:3]
+        print('{:12s} {:8.1f} ms   slowest: {}'.format(module, total, ', '.join('{} {:.0f} ms'.format(m, t) for t, m in slowest)))
+        loaded = [m for m in forbidden if m in times]
+        if loaded:
+            failed = True
+            print('    {} imports {}, which should be imported only when needed.'.format(module, ', '.join(loaded)))
+    sys.exit(1 if failed else 0)
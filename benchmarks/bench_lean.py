@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Peak memory of the analysis of a sample with and without the lean mode (optional key Lean), on synthetic scans (see synthetic.py)
+with heating and cooling runs and empty cell measurements. Each mode is run in a new process, the peak resident memory (RSS)
+of the process and the peak of the memory allocated by numpy during the analysis (tracemalloc) are reported,
+and the exported files of both modes are compared.
+Run from the main folder of pyDSC with:  python3 benchmarks/bench_lean.py [points per scan]
+"""
+import contextlib
+import filecmp
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def analyse(sample, lean):
+    ''' Analyses the sample with dsc_batch.process_sample. Returns the peak memory and the time.'''
+    import dsc_batch
+    sample = dict(sample, Lean=lean, Plots=False)
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        dsc_batch.process_sample('lean' if lean else 'default', sample, '', '')
+    elapsed = time.perf_counter() - t0
+    traced = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'traced_mb': traced/1024**2, 'rss_mb': rss/1024, 'rss_increase_mb': (rss - rss0)/1024, 'seconds': elapsed}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        with open(sys.argv[2]) as f:
+            print(json.dumps(analyse(json.load(f), sys.argv[3] == 'lean')))
+        sys.exit(0)
+    import synthetic
+    n = int(float(sys.argv[1])) if len(sys.argv) > 1 else 1000000
+    root = tempfile.mkdtemp(prefix='pydsc_lean_')
+    try:
+        sample = synthetic.sample(os.path.join(root, 'default'), n=n, runs=2, cooling=True, empty_cell=True, bins=10, noise=1e-3)
+        shutil.copytree(os.path.join(root, 'default'), os.path.join(root, 'lean'))
+        results = {}
+        for mode in ('default', 'lean'):
+            definition = os.path.join(root, mode + '.json')
+            with open(definition, 'w') as f:
+                json.dump(dict(sample, Folder=os.path.join(root, mode)), f)
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', definition, mode], capture_output=True, text=True, check=True)
+            results[mode] = json.loads(out.stdout.splitlines()[-1])
+        print('2 heating and 2 cooling scans of {} points, with empty cell runs'.format(n))
+        for mode in results:
+            r = results[mode]
+            print('{:8s} numpy peak {:8.1f} MB, RSS increase {:8.1f} MB, {:6.2f} s'.format(mode, r['traced_mb'], r['rss_increase_mb'], r['seconds']))
+        print('Lean/default: numpy peak {:.2f}, RSS increase {:.2f}'.format(results['lean']['traced_mb']/results['default']['traced_mb'],
+              results['lean']['rss_increase_mb']/max(results['default']['rss_increase_mb'], 1e-9)))
+        outputs = [os.path.join(root, mode, 'Output') for mode in results]
+        names = sorted(f for f in os.listdir(outputs[0]) if f.startswith('exp-') or f.startswith('raw_norm-'))
+        match, mismatch, errors = filecmp.cmpfiles(outputs[0], outputs[1], names, shallow=False)
+        print('Identical exported files: {} of {}'.format(len(match), len(names)))
+        if mismatch or errors:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Scaling benchmark of the whole analysis on synthetic scans (see synthetic.py), for each data format and scan length.
+Every stage of the analysis, from extract_data to export_final_data and optionally the plots, is timed separately,
+and the DH and peak position found by pyDSC are compared with the known values of the synthetic scans.
+One JSON line per configuration is printed (or appended to the file given with --out), so that the results of different releases can be compared.
+Run from the main folder of pyDSC with, e.g.:
+
+    python3 benchmarks/bench_pipeline.py --points 1000 10000 100000 --runs 3 --formats TA_temp_power_time Setaram4 --out results.jsonl
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import scipy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import DSC1 as dsc
+import dsc_read
+import synthetic
+
+
+def pydsc_version():
+    ''' Version of pyDSC, read from the main script.'''
+    for script in glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pyDSC_v*.py')):
+        with open(script, encoding='utf-8') as f:
+            found = re.search(r"^version = '(.+)'", f.read(), re.M)
+        if found:
+            return found.group(1)
+    return 'unknown'
+
+
+def run_pipeline(sample, plots=False):
+    ''' Runs the analysis of the sample as dsc_batch.process_sample does. Returns the time of each stage (s), the final data and the headers.'''
+    times = dict()
+    header_heating, header_cooling = dict(), dict()
+    def stage(name, function, *args):
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function(*args)
+        times[name] = times.get(name, 0.0) + time.perf_counter() - t0
+        return result
+
+    files = stage('read_files', dsc.read_files, 'benchmark', '', sample, header_heating, header_cooling)
+    params = stage('read_params', dsc.read_params, sample, header_heating, header_cooling)
+    os.makedirs(os.path.join(params['Folder'], 'Output'), exist_ok=True)
+    data, dataraw, data_uncut = stage('extract_data', dsc.extract_data, files, params, header_heating, header_cooling)
+    stage('check_data', dsc.check_data, data, files, params, header_heating, header_cooling)
+    refs = stage('average_refs', dsc.average_refs, data, files)
+    data_c = stage('correction', dsc.correction, data, refs, files, params)
+    data_norm = stage('normalize_sampleruns', dsc.normalize_sampleruns, files, data_c, params)
+    data_uncut_norm = stage('normalize_sampleruns', dsc.normalize_sampleruns, files, data_uncut, params)
+    stage('export_uncut_data', dsc.export_uncut_data, files, data_uncut_norm, params, header_heating, header_cooling)
+    data_final = stage('baseline', dsc.baseline, data_norm, params, files, header_heating, header_cooling)
+    stage('export_final_data', dsc.export_final_data, files, data_final, params, header_heating, header_cooling)
+    if plots:
+        import matplotlib
+        matplotlib.use('Agg')
+        import dsc_plot as plot
+        stage('plot_raw_data', plot.plot_raw_data, files, dataraw, params, 'benchmark')
+        stage('plot_corrected_data', plot.plot_corrected_data, files, data_c, params, 'benchmark')
+        stage('plot_uncut_data', plot.plot_uncut_data, files, data_uncut_norm, params, 'benchmark')
+        stage('plot_baseline_data', plot.plot_baseline_data, files, data_final, params, 'benchmark')
+        stage('plot_final_data', plot.plot_final_data, files, data_final, params, 'benchmark')
+        stage('plot_alpha', plot.plot_alpha, files, data_final, params, 'benchmark')
+    return times, files, data_final, header_heating, header_cooling
+
+
+def accuracy(sample, files, data_final, header_heating, header_cooling):
+    ''' Largest relative error on DH and largest error on the peak position (degC) of the runs. On cooling the expected DH is negative.'''
+    dh_error, tmax_error = 0.0, 0.0
+    for key, headers, sign in (('S_heating', header_heating, 1), ('S_cooling', header_cooling, -1)):
+        for i in files[key]:
+            dh_error = max(dh_error, abs(data_final[i][-1,5]/(sign*sample['Expected_DH']) - 1))
+            peak = re.search(r'Peak position is at (\S+) degC', headers[i])
+            tmax_error = max(tmax_error, abs(float(peak.group(1)) - sample['Expected_Tmax']) if peak else float('nan'))
+    return dh_error, tmax_error
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scaling benchmark of pyDSC on synthetic scans.')
+    parser.add_argument('--formats', nargs='+', default=list(dsc_read.FORMATS), choices=list(dsc_read.FORMATS), help='data formats (default all)')
+    parser.add_argument('--points', nargs='+', type=float, default=[1e3, 1e4, 1e5], help='number of points of each scan, e.g. 1e3 1e7')
+    parser.add_argument('--runs', type=int, default=2, help='number of heating (and cooling) runs')
+    parser.add_argument('--cooling', action='store_true', help='also generate cooling runs')
+    parser.add_argument('--empty-cell', action='store_true', help='add an empty cell measurement')
+    parser.add_argument('--noise', type=float, default=1e-3, help='noise, relative to the height of the peak')
+    parser.add_argument('--shape', default='gauss', choices=synthetic.SHAPES, help='shape of the peak')
+    parser.add_argument('--bins', type=int, default=10, help='bins used by pyDSC')
+    parser.add_argument('--plots', action='store_true', help='also time the plots')
+    parser.add_argument('--out', help='file to which the JSON lines are appended (default: printed)')
+    args = parser.parse_args()
+
+    environment = {'pydsc': pydsc_version(), 'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+                   'machine': platform.machine(), 'cpus': os.cpu_count()}
+    folder = tempfile.mkdtemp(prefix='pydsc_bench_')
+    try:
+        #warm up: the first analysis also imports the scipy subpackages, which is not part of the timing.
+        run_pipeline(synthetic.sample(os.path.join(folder, 'warmup'), n=1000, fmt=args.formats[0]), args.plots)
+        for fmt in args.formats:
+            for n in [int(n) for n in args.points]:
+                sample = synthetic.sample(os.path.join(folder, fmt), n=n, runs=args.runs, fmt=fmt, cooling=args.cooling, empty_cell=args.empty_cell,
+                                          bins=args.bins, shape=args.shape, noise=args.noise)
+                times, files, data_final, header_heating, header_cooling = run_pipeline(sample, args.plots)
+                dh_error, tmax_error = accuracy(sample, files, data_final, header_heating, header_cooling)
+                nfiles = sum(len(files[key]) for key in files)
+                result = dict(environment, format=fmt, points=n, runs=args.runs, cooling=args.cooling, empty_cell=args.empty_cell, noise=args.noise,
+                              shape=args.shape, bins=args.bins, stages={k: round(v, 6) for k, v in times.items()}, total=round(sum(times.values()), 6),
+                              points_per_second=round(n*nfiles/sum(times.values())), dh_relative_error=dh_error, tmax_error=tmax_error)
+                line = json.dumps(result)
+                if args.out:
+                    with open(args.out, 'a') as f:
+                        f.write(line + '\n')
+                    print('{:40s} {:9d} points: {:8.3f} s, {:10.0f} points/s, DH error {:.1e}, Tmax error {:.2f} degC'.format(
+                          fmt, n, result['total'], result['points_per_second'], dh_error, tmax_error))
+                else:
+                    print(line)
+                shutil.rmtree(os.path.join(folder, fmt))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
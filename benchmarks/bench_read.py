@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the raw data reader: np.genfromtxt (as used up to version 1.2.3) against dsc_read.read_file.
+Run from the main folder of pyDSC with:  python3 benchmarks/bench_read.py
+"""
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dsc_read
+
+folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rawdata')
+files = {'decanoic_acid_run4.txt': ('TA_temp_power_time', 'utf-8'),
+         'decanoic_acid_run5.txt': ('TA_temp_power_time', 'utf-8'),
+         'PDMAEMA_1.5wt.dat': ('TA_temp_power_time', 'utf-8'),
+         'PBS_in_D2O.dat': ('TA_temp_power_time', 'utf-8'),
+         'Rlm45aCDY2Z1_h1.txt': ('TA_temp_power_time', 'latin1'),
+         'P85_4': ('Setaram3temptime', 'latin1'),
+         'P85_5': ('Setaram3temptime', 'latin1')}
+
+
+def genfromtxt(path, params, code):
+    ''' Reading as done in extract_data of pyDSC 1.2.3'''
+    fmt, usecols = dsc_read.FORMATS[params['Dataformat']]
+    if fmt == 'Furnace':
+        with open(path, 'r', errors='replace', encoding=code) as inp:
+            hl = 1
+            line = inp.readline()
+            while 'Furnace' not in line.split():
+                line = inp.readline()
+                hl += 1
+        hl += 1
+    else:
+        hl = fmt
+    return np.genfromtxt(path, skip_header=hl, skip_footer=2, unpack=True, usecols=usecols, encoding=code)
+
+
+def timeit(func, *args, repeat=5):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+if __name__ == '__main__':
+    print('{:<25s} {:>8s} {:>14s} {:>14s} {:>8s}  {}'.format('File', 'Lines', 'genfromtxt/ms', 'dsc_read/ms', 'Speed-up', 'Identical'))
+    for file, (fmt, code) in files.items():
+        path = os.path.join(folder, file)
+        params = {'Dataformat': fmt}
+        t_old, old = timeit(genfromtxt, path, params, code)
+        t_new, new = timeit(dsc_read.read_file, path, params, code)
+        print('{:<25s} {:>8d} {:>14.1f} {:>14.1f} {:>8.1f}  {}'.format(file, new.shape[1], t_old*1e3, t_new*1e3, t_old/t_new, np.array_equal(old, new, equal_nan=True)))
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the chunked reading (optional key Stream): time and peak memory of read_run on a long file, with and without chunks.
+The long file is created in a temporary folder by repeating the data lines of decanoic_acid_run4.txt.
+Run from the main folder of pyDSC with:  python3 benchmarks/bench_stream.py [number of repetitions]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import DSC1 as dsc
+
+folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rawdata')
+params = {'Dataformat': 'TA_temp_power_time', 'Header_length': 9, 'ROI_h': [20, 50], 'bins': 10, 'Input': 'exo-up', 'Output': 'exo-down',
+          'unit_time': 's', 'unit_temp': 'degC', 'unit_power': 'uW', 'Cache': False}
+
+
+def long_file(path, repeat):
+    ''' Writes a raw data file containing repeat times the data lines of decanoic_acid_run4.txt.'''
+    with open(os.path.join(folder, 'decanoic_acid_run4.txt'), 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    data = [line for line in lines[1:-2] if line.strip()]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(lines[0])
+        for _ in range(repeat):
+            f.writelines(data)
+        f.writelines(lines[-2:])
+
+
+def measure(params, name):
+    ''' Returns the time, the peak of the memory allocated and the result of read_run. The memory is measured in a second call, tracemalloc slows down the reading.'''
+    t0 = time.perf_counter()
+    result = dsc.read_run('S_heating', name, params, log=lambda s: None)
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    dsc.read_run('S_heating', name, params, log=lambda s: None)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with tempfile.TemporaryDirectory() as tmp:
+        name = 'long_run.txt'
+        long_file(os.path.join(tmp, name), repeat)
+        print('File of {:.1f} MB'.format(os.path.getsize(os.path.join(tmp, name))/1024**2))
+        t_full, m_full, full = measure(dict(params, Folder=tmp), name)
+        print('Whole file:          {:7.2f} s, peak memory {:8.1f} MB'.format(t_full, m_full/1024**2))
+        for chunk_lines in (10000, 100000):
+            t, m, stream = measure(dict(params, Folder=tmp, Stream=chunk_lines), name)
+            same = np.array_equal(full[0], stream[0], equal_nan=True) and np.array_equal(full[2], stream[2], equal_nan=True)
+            print('Chunks of {:6d} lines: {:5.2f} s, peak memory {:8.1f} MB, same binned data: {}'.format(chunk_lines, t, m/1024**2, same))
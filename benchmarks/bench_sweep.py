@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the sweep of the peak region (DSC1.rop_sweep, optional keys ROP_sweep_h and ROP_sweep_c) on a synthetic run:
+a gaussian peak on a linear baseline with a step of Cp, with gaussian noise. The DH map of all peak regions calculated in one batched pass
+is timed against a loop calculating the baseline of one peak region at a time, and both maps are compared.
+Run from the main folder of pyDSC with:  python3 benchmarks/bench_sweep.py [step in degC] [points]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import DSC1 as dsc
+from bench_uncertainty import synthetic_run
+
+SWEEP = (30.0, 40.0, 60.0, 70.0) #start from, start to, end from, end to
+
+
+def loop(T, Cp, lows, highs):
+    ''' The map of rop_sweep, with the baseline of one peak region calculated at a time.'''
+    DH = np.full((len(lows), len(highs)), np.nan)
+    for a, low in enumerate(lows):
+        for b, high in enumerate(highs):
+            DH[a, b] = dsc.baseline_rows(T[None,:], Cp[None,:], (low, high))[2][0,-1]
+    return DH
+
+
+if __name__ == '__main__':
+    step = float(sys.argv[1]) if len(sys.argv) > 1 else 0.25
+    points = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    rng = np.random.default_rng(0)
+    T = np.linspace(20.0, 80.0, points)
+    Cp = synthetic_run(T, rng)
+    lows, highs = dsc.sweep_range(SWEEP + (step,))
+
+    t0 = time.perf_counter()
+    sweep = dsc.rop_sweep(T, Cp, lows, highs)
+    t_batch = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    DH = loop(T, Cp, lows, highs)
+    t_loop = time.perf_counter() - t0
+    print('{} peak regions of a run of {} points'.format(sweep['regions'], points))
+    print('Batched:          {:8.3f} s'.format(t_batch))
+    print('One at a time:    {:8.3f} s, speed-up {:.1f}'.format(t_loop, t_loop/t_batch))
+    print('Largest difference between the maps: {:.2g} J/g'.format(np.nanmax(np.abs(sweep['DH'] - DH))))
+    print('DH from {:.4f} to {:.4f} J/g, relative spread {:.3g}, relative standard deviation {:.3g}'.format(sweep['DH_min'], sweep['DH_max'], sweep['spread'], sweep['std']))
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the Monte-Carlo uncertainty of DH (DSC1.monte_carlo, optional key Uncertainty_replicates) on a synthetic run:
+a gaussian peak on a linear baseline with a step of Cp, with gaussian noise. The replicates calculated in one batched pass are timed against
+a loop calculating the baseline of one replicate at a time, and the spread of DH given by the replicates of one measurement is compared
+with the spread of DH of many independent measurements of the same synthetic curve.
+Run from the main folder of pyDSC with:  python3 benchmarks/bench_uncertainty.py [replicates] [points]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import DSC1 as dsc
+
+ROP = (35.0, 65.0)
+
+
+def synthetic_run(T, rng, noise=0.02):
+    ''' Cp of a transition at 50 degC (DH = 10 J/g, width 4 degC) with a Delta Cp of 0.2 J/K/g, plus gaussian noise.'''
+    alpha = 0.5*(1 + np.tanh((T - 50.0)/4.0))
+    peak = 10.0*np.exp(-((T - 50.0)/4.0)**2)/(4.0*np.sqrt(np.pi))
+    return 1.0 + 0.005*T + 0.2*alpha + peak + noise*rng.standard_normal(len(T))
+
+
+def loop(T, Cp, replicates, rng):
+    ''' The replicates of monte_carlo, with the baseline of one replicate calculated at a time.'''
+    pre, post = ROP[0] > T, ROP[1] < T
+    fit_pre = np.polyfit(T[pre], Cp[pre], 1)
+    fit_post = np.polyfit(T[post], Cp[post], 1)
+    residuals = np.concatenate((Cp[pre] - np.polyval(fit_pre, T[pre]), Cp[post] - np.polyval(fit_post, T[post])))
+    DH = np.empty(replicates)
+    for k in range(replicates):
+        H = dsc.baseline_rows(T[None,:], (Cp + rng.choice(residuals, len(T)))[None,:], ROP)[2]
+        DH[k] = H[0,-1]
+    return DH
+
+
+if __name__ == '__main__':
+    replicates = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    points = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    rng = np.random.default_rng(0)
+    T = np.linspace(20.0, 80.0, points)
+    Cp = synthetic_run(T, rng)
+
+    t0 = time.perf_counter()
+    mc = dsc.monte_carlo(T, Cp, ROP, replicates)
+    t_batch = time.perf_counter() - t0
+    n_loop = min(replicates, 500)
+    t0 = time.perf_counter()
+    loop(T, Cp, n_loop, rng)
+    t_loop = (time.perf_counter() - t0)*replicates/n_loop
+    print('{} replicates of a run of {} points'.format(replicates, points))
+    print('Batched:          {:8.2f} s'.format(t_batch))
+    print('One at a time:    {:8.2f} s (extrapolated from {} replicates), speed-up {:.1f}'.format(t_loop, n_loop, t_loop/t_batch))
+
+    #independent measurements of the same curve: their spread of DH is the uncertainty the replicates should estimate.
+    measurements = np.array([synthetic_run(T, rng) for _ in range(2000)])
+    H = dsc.baseline_rows(np.broadcast_to(T, measurements.shape), measurements, ROP)[2]
+    DH = dsc.baseline_rows(T[None,:], Cp[None,:], ROP)[2][0,-1]
+    print('DH = {:.4f} J/g, replicates: std {:.4f}, {:.0f}% interval [{:.4f}, {:.4f}]'.format(DH, mc['DH_std'], 100*mc['level'], *mc['DH_ci']))
+    print('Independent measurements: std of DH {:.4f}'.format(np.std(H[:,-1])))
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Generator of synthetic DSC scans with a known DH and peak position, written in any of the data formats of dsc_read.
+The specific heat of the sample is a straight line, a transition peak of area DH (J/g) centered at Tmax and a step DCp of the baseline
+which follows the degree of conversion, i.e. exactly the sigmoidal baseline used by pyDSC. The heat flow is the specific heat multiplied
+by the scan rate and the mass of sample, plus gaussian noise and, optionally, the signal of the empty cell.
+Used by bench_pipeline.py, can also be imported to create test data:
+
+    import synthetic
+    sample = synthetic.sample('/tmp/synthetic', n=100000, runs=3, fmt='Setaram4')
+"""
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dsc_read
+
+SHAPES = ('gauss', 'skewed')
+
+
+def peak(T, Tmax, DH, width, shape='gauss'):
+    ''' Excess specific heat of the transition (J/K/g): a peak of area DH with maximum at Tmax.
+    gauss: gaussian of standard deviation width; skewed: two half gaussians, of standard deviation width below Tmax and 2*width above.'''
+    if shape == 'gauss':
+        return DH/(width*np.sqrt(2*np.pi))*np.exp(-(T-Tmax)**2/(2*width**2))
+    if shape == 'skewed':
+        w = np.where(T < Tmax, width, 2*width)
+        return 2*DH/(np.sqrt(2*np.pi)*3*width)*np.exp(-(T-Tmax)**2/(2*w**2))
+    raise ValueError('Unknown peak shape {}. Available shapes are: {}'.format(shape, ', '.join(SHAPES)))
+
+
+def conversion(T, Tmax, width, shape='gauss'):
+    ''' Degree of conversion of the transition, the integral of peak normalized to 1.'''
+    from scipy.special import erf
+    if shape == 'gauss':
+        return 0.5*(1 + erf((T-Tmax)/(width*np.sqrt(2))))
+    if shape == 'skewed':
+        return np.where(T < Tmax, 1/3*(1 + erf((T-Tmax)/(width*np.sqrt(2)))), 1/3 + 2/3*erf((T-Tmax)/(2*width*np.sqrt(2))))
+    raise ValueError('Unknown peak shape {}. Available shapes are: {}'.format(shape, ', '.join(SHAPES)))
+
+
+def scan(n, T0=20.0, T1=80.0, rate=1.0, Tmax=50.0, DH=20.0, width=2.0, shape='gauss', cp=(2.0, 0.004), DCp=0.1,
+         mass=10.0, noise=0.0, cooling=False, empty_cell=0.0, seed=0):
+    ''' Returns time (s), temperature (degC) and heat flow (mW) of a scan of n points from T0 to T1 (from T1 to T0 if cooling) at rate K/min.
+    cp gives intercept and slope of the specific heat (J/K/g) before the transition, mass the mass of sample in mg.
+    noise is the standard deviation of the heat flow in units of the height of the peak, empty_cell the heat flow (mW) of the empty cell at T0.
+    On cooling, the transition is exothermic.'''
+    rng = np.random.default_rng(seed)
+    time = np.linspace(0, (T1-T0)/rate*60, n)
+    T = T1 - rate/60*time if cooling else T0 + rate/60*time
+    sign = -1 if cooling else 1
+    Cp = cp[0] + cp[1]*T + DCp*conversion(T, Tmax, width, shape) + sign*peak(T, Tmax, DH, width, shape)
+    power = rate/60*mass*Cp
+    power += noise*rate/60*mass*np.max(peak(T, Tmax, DH, width, shape))*rng.standard_normal(n)
+    power += empty_cell*(1 + 0.002*(T-T0))
+    return time, T, power
+
+
+def write(path, fmt, time, T, power, header_length=5):
+    ''' Writes the scan in the file path with the data format fmt of dsc_read: columns, header and footer.'''
+    rule, usecols = dsc_read.FORMATS[fmt]
+    columns = np.repeat(np.arange(len(T), dtype=float)[:,None], max(usecols)+1, axis=1) #columns which are not read contain an index.
+    columns[:, usecols[0]], columns[:, usecols[1]], columns[:, usecols[2]] = time, T, power
+    if rule == 'Furnace':
+        header = ['Synthetic DSC scan, format {}'.format(fmt), 'Sample: synthetic', 'Index Time Furnace HeatFlow', '# s degC mW']
+    elif rule == 'Header_length':
+        header = ['Synthetic DSC scan, format {}'.format(fmt)] + ['Header line {}'.format(k) for k in range(1, header_length)]
+    else:
+        header = ['Synthetic DSC scan, format {}'.format(fmt)] + ['Header line {}'.format(k) for k in range(1, rule)]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(header) + '\n')
+        np.savetxt(f, columns, fmt='%.8g', delimiter='\t')
+        f.write('End of data\nSynthetic\n')
+
+
+def sample(folder, n=10000, runs=1, fmt='TA_temp_power_time', cooling=False, empty_cell=False, bins=10,
+           T0=20.0, T1=80.0, rate=1.0, Tmax=50.0, DH=20.0, width=2.0, shape='gauss', noise=0.0, seed=0):
+    ''' Writes runs heating (and cooling) scans of n points in folder and returns the sample definition, as in dsc_input, to analyse them.
+    With empty_cell, an empty cell run is written and its signal is added to the sample runs.'''
+    os.makedirs(folder, exist_ok=True)
+    name = '{}_{}_{}'.format(fmt, n, shape)
+    definition = {'Folder': folder, 'Heating_runs': [], 'Cooling_runs': [],
+                  'Empty_cell_heat_runs': [], 'Empty_cell_cool_runs': [], 'Buffer_heat_runs': [], 'Buffer_cool_runs': [],
+                  'Dataformat': fmt, 'Header_length': 5, 'mass_s': 10.0, 'mass_r': 0.0, 'mass_bb': 0.0, 's_wt': 1.0,
+                  'ROI_h': [T0+2, T1-2], 'ROI_c': [T0+2, T1-2], 'ROP_h': [Tmax-5*width, Tmax+10*width], 'ROP_c': [Tmax-5*width, Tmax+10*width],
+                  'Scanrate_h': rate, 'Scanrate_c': rate, 'bins': bins, 'Input': 'exo-down', 'Output': 'exo-down', 'Exo_in_plot': True,
+                  'unit_time': 's', 'unit_temp': 'degC', 'unit_power': 'mW', 'Cache': False,
+                  'Expected_DH': DH, 'Expected_Tmax': Tmax} #known values of the synthetic scans, not used by pyDSC
+    ec = 0.5 if empty_cell else 0.0
+    groups = [('Heating_runs', False, 'h')] + ([('Cooling_runs', True, 'c')] if cooling else [])
+    for key, cool, tag in groups:
+        for k in range(runs):
+            filename = '{}_{}{}.txt'.format(name, tag, k)
+            write(os.path.join(folder, filename), fmt, *scan(n, T0, T1, rate, Tmax, DH, width, shape, noise=noise, cooling=cool,
+                                                                empty_cell=ec, seed=seed+k+(1000 if cool else 0)))
+            definition[key].append(filename)
+        if empty_cell:
+            filename = '{}_ec_{}.txt'.format(name, tag)
+            time = np.linspace(0, (T1-T0)/rate*60, n)
+            T = T1 - rate/60*time if cool else T0 + rate/60*time
+            write(os.path.join(folder, filename), fmt, time, T, ec*(1 + 0.002*(T-T0)))
+            definition['Empty_cell_cool_runs' if cool else 'Empty_cell_heat_runs'].append(filename)
+    return definition
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Batch execution of pyDSC: every sample defined in dsc_input is treated by process_sample, which runs the full analysis
+(reading, check, correction, normalization, baseline, export and plots).
+With more than one worker, the samples are distributed over a pool of processes. The console output of each sample is collected
+and printed in one block when the sample is finished, so that the logs of different samples are not mixed.
+A sample which fails is reported at the end of the batch, the other samples are treated normally.
+Samples writing the same files (e.g. two definitions of the same raw data files in one folder) are never analysed at the same time.
+The plots can be made right after the analysis of each sample ('inline'), in a separate pool of processes while the analysis moves on
+to the next sample ('parallel'), after all samples are analysed ('end'), or skipped ('none'). The optional key Plots of a sample selects its plots.
+With profile = True, every stage is timed by dsc_profile, the profile of each sample is written in its Output folder and summarized at the end.
+DH, peak position and Delta Cp of all runs are collected in one results table, written at the end of the batch by dsc_export.write_results.
+With incremental = True, the samples which did not change since their last analysis are skipped, see dsc_build.
+"""
+import contextlib
+import io
+import os
+import traceback
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import dsc_build
+import dsc_export
+import dsc_profile
+
+#plots made for each sample: name used in the key Plots -> function of dsc_plot
+PLOTS = {'raw': 'plot_raw_data',
+         'corrected': 'plot_corrected_data',
+         'uncut': 'plot_uncut_data',
+         'baseline': 'plot_baseline_data',
+         'final': 'plot_final_data',
+         'alpha': 'plot_alpha'}
+PLOT_MODES = ('inline', 'parallel', 'end', 'none')
+
+
+def plot_selection(sample_input):
+    ''' Returns the names of the plots to be made for the sample (optional key Plots: True for all plots, False for none, or a list of names).'''
+    selection = sample_input.get('Plots', True)
+    if selection is True:
+        return list(PLOTS)
+    if not selection:
+        return []
+    if isinstance(selection, str):
+        selection = [selection]
+    unknown = [name for name in selection if name not in PLOTS]
+    if unknown:
+        raise Exception('Unknown plots {}. Available plots are: {}'.format(unknown, ', '.join(PLOTS)))
+    return list(selection)
+
+
+def make_plot(name, args, log=print):
+    ''' Makes the plot name with the arguments args of the function of dsc_plot. Messages are passed to log.'''
+    import dsc_plot as plot
+    getattr(plot, PLOTS[name])(*args, log=log)
+
+
+def process_sample(sample, sample_input, version, date, defer=False, profile=False, keep=None, log=print):
+    ''' Runs the complete analysis of one sample, as defined in the dictionary sample_input.
+    If defer is True, the plots are not made but returned as a list of (name, arguments) to be passed to make_plot.
+    If profile is True, each stage is profiled by dsc_profile and the profile is written in the Output folder.
+    If keep is a dictionary, the arrays of the runs are allocated by dsc_thermogram and written in place by the stages; keep is filled with
+    the parameters, the headers, the results and the runs (used by dsc_thermogram).
+    The messages of the analysis are passed to log (a function with the signature of print), down to every stage.
+    Returns the deferred plots, the profile records (empty if profile is False) and the results of the runs (one dictionary per run).'''
+    import DSC1 as dsc
+    selection = plot_selection(sample_input)
+    plots = []
+    records = []
+    def call(name, function, *args):
+        if profile:
+            return dsc_profile.record(records, sample, name, function, *args, log=log)
+        return function(*args, log=log)
+    def plot(name, *args):
+        if name not in selection:
+            return None
+        if defer:
+            plots.append((name, args))
+        else:
+            call('plot_' + name, make_plot, name, args)
+
+    header_heating = dict() #Dictionary containing the headers of the exported heating files
+    header_cooling = dict() #Dictionary containing the headers of the exported cooling files
+
+    files = call('read_files', dsc.read_files, version,date,sample_input, header_heating, header_cooling)  #creates a dictionary which contains all filenames used by the script
+    params = call('read_params', dsc.read_params, sample_input, header_heating, header_cooling) #reads from the input files the parameters necessary to analyse the data, from the masses to the definiton of the temperature ranges
+    Path(os.path.join(params['Folder'],'Output')).mkdir(parents=True, exist_ok=True)  #creates the output file directory.
+    formats = dsc_export.export_formats(params) #text files and/or binary files, optional key Export.
+    data, dataraw, data_uncut = call('extract_data', dsc.extract_data, files, params, header_heating, header_cooling) #creates an array which contains all the data values within the ROIs and already binned.
+    call('check_data', dsc.check_data, data, files, params, header_heating, header_cooling) #veryfies that all input values are correct.
+    plot('raw', files, dataraw, params, sample) #plots the raw data.
+    refs = call('average_refs', dsc.average_refs, data, files) #averages the reference measurements. If the size of the reference measurements does not fit, only the longest one is considered.
+    #refs is a dictionary containing the reference measurements.
+    runs, out_c, out_norm, out_uncut, out_final = None, None, None, None, None
+    if keep is not None: #the stages write in the arrays of the runs, allocated once (see dsc_thermogram.Run).
+        import dsc_thermogram
+        runs = dsc_thermogram.allocate(files, data, data_uncut)
+        out_c = {i: runs[i].corrected for i in runs}
+        out_norm = {i: runs[i].normalized() for i in runs}
+        out_uncut = {i: runs[i].uncut_normalized() for i in runs}
+        out_final = {i: runs[i].final() for i in runs}
+    data_c = call('correction', dsc.correction, data, refs, files, params, out_c)
+    plot('corrected', files, data_c, params, sample) #plots the raw data corrected for empty cell and buffer, if reference files are provided.
+
+    if dsc.lean(params): #cut and uncut data normalized in one pass.
+        data_norm, data_uncut_norm = call('normalize_runs', dsc.normalize_runs, files, [data_c, data_uncut], params, None if runs is None else [out_norm, out_uncut])
+    else:
+        data_norm = call('normalize_sampleruns', dsc.normalize_sampleruns, files, data_c, params, out_norm)
+        data_uncut_norm = call('normalize_uncut', dsc.normalize_sampleruns, files, data_uncut, params, out_uncut)
+    plot('uncut', files, data_uncut_norm, params, sample)
+    if 'text' in formats:
+        call('export_uncut_data', dsc.export_uncut_data, files, data_uncut_norm, params, header_heating, header_cooling)
+    results = dict() #DH, peak position and Delta Cp of each run
+    sweeps = dict() #DH maps of the runs whose peak region is swept, optional keys ROP_sweep_h and ROP_sweep_c
+    data_final = call('baseline', dsc.baseline, data_norm, params, files,header_heating, header_cooling, results, sweeps, out_final)
+    plot('baseline', files, data_final, params, sample)
+    plot('final', files, data_final, params, sample)
+    plot('alpha', files, data_final, params, sample)
+
+    if 'text' in formats:
+        call('export_final_data', dsc.export_final_data, files, data_final, params, header_heating, header_cooling)
+        if sweeps:
+            call('export_sweeps', dsc.export_sweeps, files, sweeps, params)
+    call('export_binary', dsc_export.export_binary, sample, files, data_final, data_uncut_norm, params, header_heating, header_cooling)
+    if profile:
+        path = dsc_profile.write(records, os.path.join(params['Folder'], 'Output'), sample)
+        log('Profile of the analysis written in {}.json and .csv'.format(path))
+    if keep is not None:
+        keep.update(files=files, params=params, refs=refs, runs=runs, header_heating=header_heating, header_cooling=header_cooling, results=results, sweeps=sweeps)
+    rows = [dict(sample=sample, run=str(run), folder=params['Folder'], **results[run]) for run in results]
+    return plots, records, rows
+
+
+def _run_captured(sample, sample_input, version, date, defer=False, profile=False):
+    ''' Runs process_sample in a worker process. Returns the name of the sample, its console output, the error message (None if successful),
+    the deferred plots, the profile records and the results of the runs.'''
+    log = io.StringIO()
+    error = None
+    plots, records, rows = [], [], []
+    with contextlib.redirect_stdout(log):
+        try:
+            plots, records, rows = process_sample(sample, sample_input, version, date, defer, profile)
+        except (Exception, SystemExit):
+            error = traceback.format_exc()
+    return sample, log.getvalue(), error, plots, records, rows
+
+
+def _run_plot(sample, name, args, profile=False):
+    ''' Makes a deferred plot, in a worker process or at the end of the batch. Returns the name of the sample and of the plot, the error message (None if successful)
+    and the profile records of the plot.'''
+    error = None
+    records = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            if profile:
+                dsc_profile.record(records, sample, 'plot_' + name, make_plot, name, args)
+            else:
+                make_plot(name, args)
+        except Exception:
+            error = traceback.format_exc()
+    return sample, name, error, records
+
+
+def _init_worker():
+    ''' Plots are only saved to file in the worker processes, the non-interactive Agg backend is used.
+    The backend is set through the environment, matplotlib is only imported by the workers which make plots.'''
+    os.environ['MPLBACKEND'] = 'Agg'
+
+
+def run_batch(samples, version, date, workers=1, plots='inline', plot_workers=1, profile=False, results=None, incremental=False):
+    ''' Treats all samples of the dictionary samples. If workers is larger than 1, the samples are treated in parallel by workers processes;
+    if workers is 0 or None, one process per available CPU is used. plots is one of PLOT_MODES, plot_workers is the number of processes
+    making the plots in the modes 'parallel' and 'end'. If profile is True, the stages are profiled and summarized at the end.
+    The results of all runs are written in results.csv and results.npz (not written if results is None).
+    If incremental is True, only the samples which changed since their last analysis are treated (see dsc_build), the results of the others are taken from their manifest.
+    Returns a dictionary with the error message of the samples (or plots) which failed.'''
+    if plots not in PLOT_MODES:
+        raise Exception('Unknown plot mode {}. Available modes are: {}'.format(plots, ', '.join(PLOT_MODES)))
+    if workers is None or int(workers) < 1:
+        workers = os.cpu_count() or 1
+    if plot_workers is None or int(plot_workers) < 1:
+        plot_workers = os.cpu_count() or 1
+    defer = plots != 'inline'
+    failed = {}
+    records = {} #profile records of each sample
+    rows = {} #results of the runs of each sample
+    states = {} #hash of each sample, in the incremental mode
+    todo = samples
+    if incremental:
+        for sample in samples:
+            states[sample] = dsc_build.sample_state(sample, samples[sample], version, {'plots': plots != 'none'})
+            entry = dsc_build.up_to_date(sample, samples[sample], states[sample])
+            if entry is not None:
+                rows[sample], records[sample] = entry['rows'], []
+        todo = {sample: samples[sample] for sample in samples if sample not in rows}
+        print(15*'*', 'Incremental batch: {} of {} samples unchanged and skipped'.format(len(samples) - len(todo), len(samples)), 15*'*')
+    workers = min(int(workers), max(len(todo), 1))
+    def done(sample):
+        if incremental:
+            dsc_build.record(sample, samples[sample], states[sample], rows[sample])
+
+    plot_pool = None
+    if plots == 'parallel' or (plots == 'end' and int(plot_workers) > 1):
+        plot_pool = ProcessPoolExecutor(max_workers=int(plot_workers), initializer=_init_worker)
+    plot_jobs = [] #deferred plots: futures in the plot pool, or (sample, name, args) made at the end in this process.
+    def plot_later(sample, deferred):
+        if plots == 'none':
+            return None
+        for name, args in deferred:
+            if plots == 'parallel':
+                plot_jobs.append(plot_pool.submit(_run_plot, sample, name, args, profile))
+            else:
+                plot_jobs.append((sample, name, args, profile))
+
+    try:
+        if workers == 1:
+            for sample in todo:
+                try:
+                    deferred, records[sample], rows[sample] = process_sample(sample, samples[sample], version, date, defer, profile)
+                except (Exception, SystemExit): #reported as in the process pool, the next samples are treated.
+                    failed[sample], records[sample] = traceback.format_exc(), []
+                    print(failed[sample])
+                    print(5*'*', 'Sample {} failed.'.format(sample), 5*'*')
+                    continue
+                done(sample)
+                plot_later(sample, deferred)
+        else:
+            print(15*'*', 'Batch of {} samples on {} processes'.format(len(todo), workers), 15*'*')
+            paths = {sample: dsc_build.output_paths(sample, samples[sample]) for sample in todo}
+            waiting = list(todo)
+            running = {} #future -> sample
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                while waiting or running:
+                    busy = set().union(*(paths[running[job]] for job in running))
+                    for sample in list(waiting): #a sample sharing output files with a running sample waits, their files would be mixed.
+                        if len(running) >= workers:
+                            break
+                        if paths[sample].isdisjoint(busy):
+                            waiting.remove(sample)
+                            busy |= paths[sample]
+                            running[pool.submit(_run_captured, sample, samples[sample], version, date, defer, profile)] = sample
+                    job = next(iter(wait(running, return_when=FIRST_COMPLETED)[0]))
+                    del running[job]
+                    sample, log, error, deferred, records[sample], rows[sample] = job.result()
+                    print('\n', 15*'=', 'Sample {}'.format(sample), 15*'=')
+                    print(log)
+                    if error is not None:
+                        failed[sample] = error
+                        print(error)
+                        print(5*'*', 'Sample {} failed.'.format(sample), 5*'*')
+                    else:
+                        done(sample)
+                        plot_later(sample, deferred) #the plots of a failed sample are skipped, those of the other samples are still made.
+
+        if plot_jobs:
+            print('\n', 15*'*', 'Plotting {} figures'.format(len(plot_jobs)), 15*'*')
+        if plots == 'end' and plot_pool is not None:
+            plot_jobs = [plot_pool.submit(_run_plot, *job) for job in plot_jobs]
+        plotted = set()
+        for job in plot_jobs:
+            sample, name, error, plot_records = job.result() if plot_pool is not None else _run_plot(*job)
+            records[sample] += plot_records
+            plotted.add(sample)
+            if error is not None:
+                failed['{} ({} plot)'.format(sample, name)] = error
+                if incremental: #analysed again in the next run.
+                    dsc_build.forget(sample, samples[sample])
+                print(error)
+                print(5*'*', 'Plot {} of sample {} failed.'.format(name, sample), 5*'*')
+        if profile: #the profiles are written again with the deferred plots.
+            for sample in plotted:
+                dsc_profile.write(records[sample], os.path.join(samples[sample]['Folder'], 'Output'), sample)
+    finally:
+        if plot_pool is not None:
+            plot_pool.shutdown()
+        table = [row for sample in samples if sample in rows for row in rows[sample]] #in the order of the samples, also written if the batch is interrupted.
+        if results and table:
+            dsc_export.write_results(table, results)
+            print('\n', 15*'*', 'Results of {} runs written in {}.csv and .npz'.format(len(table), results), 15*'*')
+
+    if profile:
+        print('\n', 15*'*', 'Profile of the batch', 15*'*')
+        print(dsc_profile.summary([r for sample in records for r in records[sample]]))
+
+    n_failed = len([sample for sample in failed if sample in samples])
+    print('\n', 15*'*', 'Batch finished: {} samples treated, {} failed.'.format(len(todo)-n_failed, n_failed), 15*'*')
+    for sample in failed:
+        print('Sample {} failed: {}'.format(sample, failed[sample].strip().splitlines()[-1]))
+    return failed
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental analysis of a batch (incremental = True in dsc_input), working like make: a sample is analysed again only if its definition,
+the content of its raw data files or the version of pyDSC changed since its last successful analysis, or if its exported files are missing or changed.
+The hash of each sample is stored, with the results of its runs, in the manifest Output/pyDSC_manifest.json of its data folder,
+so that the state survives the end of the process and the results of the skipped samples are still written in the results table.
+The content of a raw data file is hashed again only if its size or modification time changed since it was last hashed.
+The modification time of each exported file is recorded too: a sample whose files were overwritten since its analysis (e.g. by another
+sample using the same raw data files) is analysed again.
+The plots are not checked: a sample whose plots were deleted is not analysed again.
+"""
+import hashlib
+import json
+import os
+import dsc_export
+
+MANIFEST = 'pyDSC_manifest.json'
+MANIFEST_VERSION = 4 #to be increased when the content of the manifest or the outputs of a sample change.
+RUN_KEYS = ('Heating_runs', 'Cooling_runs', 'Empty_cell_heat_runs', 'Empty_cell_cool_runs', 'Buffer_heat_runs', 'Buffer_cool_runs')
+BLOCK_SIZE = 1024**2 #bytes read at once when hashing a file
+
+
+def manifest_path(sample_input):
+    ''' Path of the manifest of the data folder of the sample.'''
+    return os.path.join(sample_input['Folder'], 'Output', MANIFEST)
+
+
+def read_manifest(path):
+    ''' Returns the content of the manifest path: a dictionary sample -> entry. Empty if the manifest does not exist or is not readable.'''
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('samples', {})
+
+
+def write_manifest(path, entries):
+    ''' Writes the manifest path under a temporary name, then renamed, so that an interrupted run never leaves an incomplete manifest.'''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    part = '{}.{}.part'.format(path, os.getpid())
+    with open(part, 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'samples': entries}, f, indent=1)
+    os.replace(part, path)
+
+
+def file_digest(path, known=None):
+    ''' Returns size, modification time and sha256 of the content of the file path. The digest of known (the entry of the previous run)
+    is reused if the size and the modification time of the file did not change.'''
+    stat = os.stat(path)
+    if known and known.get('size') == stat.st_size and known.get('mtime_ns') == stat.st_mtime_ns:
+        return known
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            h.update(block)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': h.hexdigest()}
+
+
+def sample_state(sample, sample_input, version, options=None):
+    ''' Hash of the sample: its definition, the content of its raw data files, the version of pyDSC and the batch options
+    which change its outputs (e.g. whether plots are made). Returns a dictionary with the hash and the digest of each file.'''
+    known = read_manifest(manifest_path(sample_input)).get(sample, {}).get('files', {})
+    h = hashlib.sha256()
+    h.update(json.dumps([MANIFEST_VERSION, version, options, sample_input], sort_keys=True, default=repr).encode('utf-8'))
+    files = {}
+    for key in RUN_KEYS:
+        for j in sample_input.get(key, []):
+            if not j or str(j) in files:
+                continue
+            path = os.path.join(sample_input['Folder'], str(j))
+            try:
+                files[str(j)] = file_digest(path, known.get(str(j)))
+            except OSError: #missing file: the sample is analysed, and fails with the usual message.
+                files[str(j)] = {'sha256': None}
+            h.update('{}:{}'.format(j, files[str(j)]['sha256']).encode('utf-8'))
+    return {'hash': h.hexdigest(), 'files': files}
+
+
+def outputs(sample, sample_input):
+    ''' Names of the files exported for the sample in its Output folder: exp- and raw_norm- files of the sample runs, sweep- files
+    of the runs whose peak region is swept and binary files.'''
+    formats = dsc_export.export_formats(sample_input)
+    names = []
+    if 'text' in formats:
+        runs = [str(j) for key in ('Heating_runs', 'Cooling_runs') for j in sample_input.get(key, []) if j]
+        names += ['exp-' + j for j in runs] + ['raw_norm-' + j for j in runs]
+        for key, sweep in (('Heating_runs', 'ROP_sweep_h'), ('Cooling_runs', 'ROP_sweep_c')):
+            if sample_input.get(sweep):
+                names += ['sweep-' + str(j) for j in sample_input.get(key, []) if j]
+    names += ['pyDSC-{}{}'.format(sample, dsc_export.FORMATS[f]) for f in formats if dsc_export.FORMATS[f]]
+    return names
+
+
+def output_paths(sample, sample_input):
+    ''' Paths of the files exported for the sample (see outputs). Two samples with common paths overwrite each other's files.'''
+    folder = os.path.abspath(os.path.join(sample_input['Folder'], 'Output'))
+    return {os.path.join(folder, name) for name in outputs(sample, sample_input)}
+
+
+def up_to_date(sample, sample_input, state):
+    ''' Returns the manifest entry of the sample if its hash did not change and all its exported files exist, unchanged since its analysis
+    (not rewritten by another sample), otherwise None.'''
+    entry = read_manifest(manifest_path(sample_input)).get(sample)
+    if entry is None or entry.get('hash') != state['hash']:
+        return None
+    folder = os.path.join(sample_input['Folder'], 'Output')
+    for name, mtime_ns in entry.get('outputs', {}).items():
+        try:
+            if os.stat(os.path.join(folder, name)).st_mtime_ns != mtime_ns:
+                return None
+        except OSError: #deleted
+            return None
+    return entry
+
+
+def record(sample, sample_input, state, rows):
+    ''' Stores in the manifest the state of the sample, analysed successfully, with the results of its runs and the modification time of its exported files.'''
+    path = manifest_path(sample_input)
+    entries = read_manifest(path)
+    folder = os.path.join(sample_input['Folder'], 'Output')
+    written = {}
+    for name in outputs(sample, sample_input):
+        try:
+            written[name] = os.stat(os.path.join(folder, name)).st_mtime_ns
+        except OSError: #not written: the sample is analysed again in the next run.
+            written[name] = None
+    entries[sample] = dict(state, outputs=written, rows=rows)
+    write_manifest(path, entries)
+
+
+def forget(sample, sample_input):
+    ''' Removes the sample from the manifest, so that it is analysed again in the next run (e.g. after a failed plot).'''
+    path = manifest_path(sample_input)
+    entries = read_manifest(path)
+    if entries.pop(sample, None) is not None:
+        write_manifest(path, entries)
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of the parsed raw data files.
+The array (time, temperature, heatflow) read from a raw data file is stored as .npy file in the folder Cache, created next to the Output folder,
+and is memory-mapped back in the following runs, as long as the raw data file and the reading settings did not change.
+The cache is controlled by the optional key 'Cache' of the sample definition: True uses the cache, False (default) bypasses it
+and 'clear' deletes all cached files before reading. The cache folder holds copies of the raw data, at most CACHE_MAX_SIZE bytes.
+Reference runs (empty cell and buffer) are usually shared by many samples: once cut, converted and binned, they are kept in memory
+for the following samples of the batch (shared) and, if the cache is enabled, stored in the cache folder for the following runs (load_reference).
+At most MEMORY_MAX_ITEMS of them are kept in memory, the least recently used are dropped first, so that long-running processes (watch mode) do not grow.
+"""
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+import dsc_read
+
+CACHE_FOLDER = 'Cache'
+CACHE_MAX_SIZE = 2*1024**3 #maximum size of the cache folder in bytes. When exceeded, the least recently used files are deleted.
+CACHE_VERSION = 1 #to be increased when the content of the cached arrays changes.
+KEY_PARAMS = ('Dataformat', 'Header_length', 'unit_time', 'unit_temp', 'unit_power') #parameters which define how a file is read
+REFERENCE_PARAMS = ('bins', 'Bin_step', 'Input', 'Output', 'Stream', 'Lean', 'Plots') #parameters which, with the region of interest, define how a reference run is binned (Stream and Lean can keep only binned data)
+MEMORY_MAX_ITEMS = 64 #maximum number of reference runs and curves kept in memory. When exceeded, the least recently used are dropped.
+_memory = collections.OrderedDict() #reference runs and curves shared by the samples analysed in this process, least recently used first
+_lock = threading.Lock() #guards _memory, used by the threads of DSC1.extract_data
+
+
+def cache_dir(params):
+    ''' Returns the folder of the cache for the data folder of the sample.'''
+    return os.path.join(params['Folder'], CACHE_FOLDER)
+
+
+def cache_mode(params):
+    ''' Returns the cache setting of the sample: True, False (default) or 'clear'.'''
+    mode = params.get('Cache', False) #opt-in: the cache writes copies of the raw data in the data folder.
+    if isinstance(mode, str):
+        mode = mode.lower()
+        if mode in ('false', 'no', 'off'): return False
+        if mode == 'clear': return 'clear'
+        return True
+    return bool(mode)
+
+
+def file_key(path, params):
+    ''' Key of the cached array: path, size and modification time of the file and the parameters used to read it.'''
+    stat = os.stat(path)
+    items = [CACHE_VERSION, os.path.abspath(path), stat.st_size, stat.st_mtime_ns, dsc_read.FORMATS.get(params['Dataformat']), dsc_read.FOOTER_LENGTH]
+    items += [params.get(p) for p in KEY_PARAMS]
+    return hashlib.sha1(repr(items).encode('utf-8')).hexdigest()
+
+
+def clear(folder, log=print):
+    ''' Deletes all files stored in the cache folder and the reference runs kept in memory. Messages are passed to log.'''
+    with _lock:
+        _memory.clear()
+    if not os.path.isdir(folder):
+        return None
+    for name in os.listdir(folder):
+        if name.endswith('.npy') or name.endswith('.json'):
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                None
+    log('Cache {} cleared.'.format(folder))
+
+
+def group(key):
+    ''' Returns the group of the cached array key: the reference run for its parts (ref-<hash>-binned, -raw, -uncut), the key itself otherwise.
+    The arrays of a group are used together, and evicted together.'''
+    return key.rsplit('-', 1)[0] if key.startswith('ref-') else key
+
+
+def evict(folder, max_size=CACHE_MAX_SIZE, keep=()):
+    ''' Deletes the least recently used groups of arrays until the size of the cache is below max_size. The groups in keep (e.g. the array
+    just stored) are never deleted, even if they alone exceed max_size.'''
+    groups = {} #group -> [last use, size, keys]
+    for name in os.listdir(folder):
+        if name.endswith('.npy'):
+            try:
+                stat = os.stat(os.path.join(folder, name))
+            except OSError: #deleted in the meantime by another process.
+                continue
+            entry = groups.setdefault(group(name[:-4]), [0.0, 0, []])
+            entry[0] = max(entry[0], stat.st_mtime)
+            entry[1] += stat.st_size
+            entry[2].append(name[:-4])
+    total = sum(entry[1] for entry in groups.values())
+    for name, (_, size, keys) in sorted(groups.items(), key=lambda item: item[1][0]):
+        if total <= max_size:
+            break
+        if name in keep:
+            continue
+        for key in keys:
+            for ext in ('.npy', '.json'):
+                try:
+                    os.remove(os.path.join(folder, key + ext))
+                except OSError:
+                    None
+        total -= size
+
+
+def store(folder, key, tmp, info):
+    ''' Saves the array tmp and the information dictionary info in the cache. Files are written under a temporary name and then renamed,
+    so that other processes never see incomplete files.'''
+    os.makedirs(folder, exist_ok=True)
+    name = os.path.join(folder, key)
+    part = '{}.{}.{}.part'.format(name, os.getpid(), threading.get_ident())
+    with open(part, 'wb') as f:
+        np.save(f, np.ascontiguousarray(tmp))
+    os.replace(part, name + '.npy')
+    with open(part, 'w') as f:
+        json.dump(info, f)
+    os.replace(part, name + '.json')
+    evict(folder, keep=(group(key),)) #the array just stored, and the other parts of its reference run, are kept.
+
+
+def fetch(folder, key):
+    ''' Returns the memory-mapped array and the information stored with key, or None if key is not in the cache.'''
+    name = os.path.join(folder, key)
+    try:
+        with open(name + '.json', 'r') as f:
+            info = json.load(f)
+        tmp = np.asarray(np.load(name + '.npy', mmap_mode='r')) #plain array view on the mapped file
+    except (OSError, ValueError):
+        return None
+    now = time.time()
+    try:
+        os.utime(name + '.npy', (now, now)) #marks the array as recently used.
+    except OSError:
+        None
+    return tmp, info
+
+
+def load(path, params, log=print, read=dsc_read.load):
+    ''' Reads the raw data file path with read (dsc_read.load or dsc_read.load_chunked), through the cache if enabled. 
+    Returns the array (3, N) containing time, temperature and heatflow and the encoding of the file. Messages are passed to log.'''
+    mode = cache_mode(params)
+    if mode is False:
+        return read(path, params)
+    folder = cache_dir(params)
+    key = file_key(path, params)
+    cached = fetch(folder, key)
+    if cached is not None:
+        tmp, info = cached
+        log('File {} loaded from cache.'.format(path))
+        return tmp, info['encoding']
+    tmp, code = read(path, params)
+    try:
+        store(folder, key, tmp, {'file': os.path.abspath(path), 'encoding': code})
+    except OSError as e:
+        log('File {} could not be stored in the cache: {}'.format(path, e))
+    return tmp, code
+
+
+def recall(key):
+    ''' Returns the object stored in memory with key (None if not stored), marked as the most recently used.'''
+    with _lock:
+        if key not in _memory:
+            return None
+        _memory.move_to_end(key)
+        return _memory[key]
+
+
+def remember(key, value, max_items=MEMORY_MAX_ITEMS):
+    ''' Stores value in memory with key, dropping the least recently used objects beyond max_items. Returns value.'''
+    with _lock:
+        _memory[key] = value
+        _memory.move_to_end(key)
+        while len(_memory) > max_items:
+            _memory.popitem(last=False)
+    return value
+
+
+def shared(key, build):
+    ''' Returns the object stored in memory with key, built by build() the first time it is requested in this process (or after it was dropped).'''
+    value = recall(key)
+    return value if value is not None else remember(key, build())
+
+
+def array_key(*arrays):
+    ''' Key of the content of the arrays, used to share the objects calculated from them.'''
+    h = hashlib.sha1()
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        h.update(repr((a.shape, a.dtype.str)).encode('utf-8'))
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+
+def reference_key(path, key, params):
+    ''' Key of a reference run: the key of the raw data file, the group of files (e.g. EC_heating), its region of interest and the binning.'''
+    roi = params['ROI_h'] if 'heating' in key else params['ROI_c']
+    items = [file_key(path, params), key, [float(t) for t in roi]] + [params.get(p) for p in REFERENCE_PARAMS]
+    return 'ref-' + hashlib.sha1(repr(items).encode('utf-8')).hexdigest()
+
+
+def load_reference(path, key, params, read, log=print):
+    ''' Returns the binned data, the cut data, the binned uncut data and the encoding of the reference run path of the group key,
+    as returned by read() (DSC1.read_run). The result is shared with the following samples using the same reference run, in memory
+    and, if the cache is enabled, on disk. The arrays are read-only.'''
+    rkey = reference_key(path, key, params)
+    result = recall(rkey)
+    if result is not None:
+        log('Reference file {} shared with a previous sample.'.format(path))
+        return result
+    folder = cache_dir(params)
+    parts = ('binned', 'raw', 'uncut')
+    if cache_mode(params) is not False:
+        cached = [fetch(folder, '{}-{}'.format(rkey, part)) for part in parts]
+        if all(c is not None for c in cached):
+            log('Reference file {} loaded binned from cache.'.format(path))
+            return remember(rkey, tuple(c[0] for c in cached) + (cached[0][1]['encoding'],))
+    result = read()
+    for a in result[:3]:
+        a.setflags(write=False)
+    if cache_mode(params) is not False:
+        try:
+            for part, a in zip(parts, result[:3]):
+                store(folder, '{}-{}'.format(rkey, part), a, {'file': os.path.abspath(path), 'encoding': result[3]})
+        except OSError as e:
+            log('Reference file {} could not be stored in the cache: {}'.format(path, e))
+    return remember(rkey, result)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Command line of pyDSC: the samples are read from a manifest file (TOML, JSON or CSV) instead of dsc_input.py.
+
+    python3 pyDSC_v1.2.3.py samples.toml --samples 'P85*' --workers 4 --stages export results --set bins=5 --set P85:Lean=true
+
+The manifest has the same keys as the samples dictionary of dsc_input:
+- TOML and JSON: a table 'samples' (sample name -> definition, or a list of definitions with the key 'sample'), an optional table 'defaults'
+  with the keys common to all samples and an optional table 'settings' with the batch settings of dsc_input (workers, plots, plot_workers,
+  profile, results, incremental). A JSON file containing only sample definitions is also accepted.
+- CSV: one row per sample, with the column 'sample' and one column per key. Lists (runs, ROI_h, ROP_h, Plots, ...) are separated by ';',
+  empty cells take the default value. Defaults and settings can be given with --defaults, another TOML or JSON manifest.
+The values of a sample are taken, by increasing priority, from the defaults, the manifest entry, the --set KEY=VALUE options for all samples
+and the --set SAMPLE:KEY=VALUE options. The run lists which are not given are empty.
+All samples are validated before the analysis starts (keys, numbers, data formats); --check only validates the manifest.
+"""
+import argparse
+import csv
+import fnmatch
+import json
+import os
+import dsc_read
+
+RUN_KEYS = ('Heating_runs', 'Cooling_runs', 'Empty_cell_heat_runs', 'Empty_cell_cool_runs', 'Buffer_heat_runs', 'Buffer_cool_runs')
+REQUIRED = ('Folder', 'Dataformat', 'ROI_h', 'ROI_c', 'ROP_h', 'ROP_c', 'mass_s', 'mass_r', 'mass_bb', 's_wt', 'Scanrate_h', 'Scanrate_c', 'bins',
+            'Input', 'Output', 'unit_time', 'unit_temp', 'unit_power')
+NUMBERS = ('mass_s', 'mass_r', 'mass_bb', 's_wt', 'Scanrate_h', 'Scanrate_c', 'bins', 'Header_length', 'Bin_step', 'Mw', 'Baseline_tol', 'Baseline_maxiter', 'Read_workers',
+           'Uncertainty_replicates', 'Uncertainty_level', 'Uncertainty_seed')
+PAIRS = ('ROI_h', 'ROI_c', 'ROP_h', 'ROP_c')
+SWEEPS = ('ROP_sweep_h', 'ROP_sweep_c')
+LIST_KEYS = RUN_KEYS + PAIRS + SWEEPS + ('Plots', 'Export', 'Watch_h', 'Watch_c')
+CONVENTIONS = ('exo-up', 'exo-down')
+SETTINGS = {'workers': 1, 'plots': 'inline', 'plot_workers': 1, 'profile': False, 'results': 'pyDSC_results', 'incremental': False} #batch settings and defaults, as in dsc_input
+STAGES = ('export', 'plots', 'results') #optional stages, the analysis from the reading to the baseline is always run
+
+
+def parse_scalar(text):
+    ''' Converts the text of a CSV cell or of a --set option to a boolean, an integer, a float or a string.'''
+    text = text.strip()
+    lower = text.lower()
+    if lower in ('true', 'yes'): return True
+    if lower in ('false', 'no'): return False
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def parse_value(key, text):
+    ''' Converts text to the value of key: lists are separated by ';', file names are kept as strings.'''
+    if key in LIST_KEYS and (';' in text or key in RUN_KEYS or key in PAIRS):
+        items = [item.strip() for item in text.split(';') if item.strip()]
+        return items if key in RUN_KEYS else [parse_scalar(item) for item in items]
+    return parse_scalar(text)
+
+
+def read_toml(path):
+    ''' Reads the TOML file path, with tomllib (python >= 3.11) or the optional package tomli.'''
+    try:
+        import tomllib #python >= 3.11
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ImportError('Reading TOML manifests requires python 3.11 or the tomli package (pip install tomli).')
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+
+def read_csv(path):
+    ''' Returns the samples of the CSV manifest path: one row per sample, empty cells are skipped.'''
+    samples = {}
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        columns = [c.strip() for c in next(reader)]
+        if 'sample' not in columns:
+            raise ValueError('The CSV manifest {} has no column sample.'.format(path))
+        index = columns.index('sample')
+        for n, row in enumerate(reader, start=2):
+            if not row or not ''.join(row).strip():
+                continue
+            name = row[index].strip()
+            if name in samples:
+                raise ValueError('Sample {} is defined twice in {} (line {}).'.format(name, path, n))
+            samples[name] = {key: parse_value(key, text) for key, text in zip(columns, row) if key != 'sample' and text.strip()}
+    return {'samples': samples}
+
+
+def read_manifest(path):
+    ''' Reads the manifest path (.toml, .json or .csv). Returns a dictionary with the tables samples, defaults and settings.'''
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.toml':
+        content = read_toml(path)
+    elif ext == '.json':
+        with open(path, 'r', encoding='utf-8') as f:
+            content = json.load(f)
+    elif ext == '.csv':
+        content = read_csv(path)
+    else:
+        raise ValueError('Unknown manifest type {}. Manifests are .toml, .json or .csv files.'.format(ext))
+    if 'samples' not in content: #only sample definitions
+        content = {'samples': content}
+    samples = content['samples']
+    if isinstance(samples, list): #list of definitions with the key sample
+        listed = {}
+        for entry in samples:
+            entry = dict(entry)
+            name = str(entry.pop('sample', 'sample_{}'.format(len(listed) + 1)))
+            if name in listed:
+                raise ValueError('Sample {} is defined twice in {}.'.format(name, path))
+            listed[name] = entry
+        samples = listed
+    return {'samples': samples, 'defaults': content.get('defaults', {}), 'settings': content.get('settings', {})}
+
+
+def overrides(options):
+    ''' Parses the --set options: returns the values for all samples and a dictionary sample -> values.'''
+    common, per_sample = {}, {}
+    for option in options or []:
+        target, equal, text = option.partition('=')
+        if not equal:
+            raise ValueError('Option --set {} is not of the form KEY=VALUE or SAMPLE:KEY=VALUE.'.format(option))
+        sample, colon, key = target.rpartition(':')
+        values = per_sample.setdefault(sample, {}) if colon else common
+        values[key.strip()] = parse_value(key.strip(), text)
+    return common, per_sample
+
+
+def build_samples(manifest, selection=None, common=None, per_sample=None):
+    ''' Returns the dictionary of the selected samples (patterns of names, all if None) with defaults and overrides applied.'''
+    defaults = dict({key: [] for key in RUN_KEYS}, **manifest['defaults'])
+    samples = {}
+    for name, entry in manifest['samples'].items():
+        name = str(name)
+        if selection and not any(fnmatch.fnmatchcase(name, pattern) for pattern in selection):
+            continue
+        sample = dict(defaults)
+        sample.update(entry)
+        sample.update(common or {})
+        sample.update((per_sample or {}).get(name, {}))
+        samples[name] = sample
+    return samples
+
+
+def validate(samples):
+    ''' Checks the keys and values of all samples without reading the data files. Returns the list of errors.'''
+    errors = []
+    for name, sample in samples.items():
+        missing = [key for key in REQUIRED if key not in sample]
+        if missing:
+            errors.append('{}: missing keys {}'.format(name, ', '.join(missing)))
+        for key in RUN_KEYS:
+            if not isinstance(sample.get(key), list):
+                errors.append('{}: {} must be a list of file names'.format(name, key))
+        if not sample.get('Heating_runs') and not sample.get('Cooling_runs'):
+            errors.append('{}: no heating or cooling runs'.format(name))
+        if 'Dataformat' in sample and sample['Dataformat'] not in dsc_read.FORMATS:
+            errors.append('{}: unknown Dataformat {}'.format(name, sample['Dataformat']))
+        for key in ('Input', 'Output'):
+            if key in sample and str(sample[key]).lower() not in CONVENTIONS:
+                errors.append('{}: {} must be one of {}'.format(name, key, ', '.join(CONVENTIONS)))
+        for key in NUMBERS:
+            if key in sample and (isinstance(sample[key], bool) or not isinstance(sample[key], (int, float))):
+                errors.append('{}: {} must be a number, found {!r}'.format(name, key, sample[key]))
+        for key in PAIRS:
+            value = sample.get(key)
+            if key in sample and not (isinstance(value, (list, tuple)) and len(value) == 2 and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value)):
+                errors.append('{}: {} must be two temperatures, found {!r}'.format(name, key, value))
+        for key in SWEEPS:
+            value = sample.get(key)
+            if value and not (isinstance(value, (list, tuple)) and len(value) == 5 and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value) and value[4] > 0):
+                errors.append('{}: {} must be five numbers (start from, start to, end from, end to, step > 0), found {!r}'.format(name, key, value))
+    return errors
+
+
+def parser():
+    p = argparse.ArgumentParser(description='pyDSC: analysis of the samples defined in a manifest file (TOML, JSON or CSV).')
+    p.add_argument('manifest', help='manifest file with the sample definitions (.toml, .json or .csv)')
+    p.add_argument('--defaults', help='TOML or JSON file with the tables defaults and settings, e.g. for a CSV manifest')
+    p.add_argument('--samples', nargs='+', metavar='PATTERN', help='names (or patterns, e.g. P85*) of the samples to analyse (default all)')
+    p.add_argument('--set', action='append', metavar='[SAMPLE:]KEY=VALUE', help='overrides a key of all samples, or of one sample (lists separated by ;)')
+    p.add_argument('--stages', nargs='*', choices=STAGES, help='optional stages to run (default all): export of the data, plots, results table')
+    p.add_argument('--workers', type=int, help='number of samples analysed in parallel (0: all processors)')
+    p.add_argument('--plots', dest='plot_mode', choices=('inline', 'parallel', 'end', 'none'), help='when the plots are made, see dsc_batch')
+    p.add_argument('--plot-workers', type=int, help='processes making the plots in the modes parallel and end')
+    p.add_argument('--results', help='path of the results table, without extension')
+    p.add_argument('--profile', action='store_true', default=None, help='profile the stages of the analysis')
+    p.add_argument('--incremental', action='store_true', default=None, help='skip the samples which did not change since their last analysis')
+    p.add_argument('--check', action='store_true', help='only validate the manifest')
+    return p
+
+
+def main(argv, version, date):
+    ''' Runs pyDSC on the samples of the manifest given in the command line argv. Returns the exit code.'''
+    args = parser().parse_args(argv)
+    manifest = read_manifest(args.manifest)
+    if args.defaults:
+        extra = read_manifest(args.defaults)
+        manifest['defaults'] = dict(extra['defaults'], **manifest['defaults'])
+        manifest['settings'] = dict(extra['settings'], **manifest['settings'])
+    common, per_sample = overrides(args.set)
+    samples = build_samples(manifest, args.samples, common, per_sample)
+    unknown = [name for name in per_sample if name not in samples]
+    if unknown:
+        print('Options --set given for samples not selected or not in the manifest: {}'.format(', '.join(unknown)))
+        return 2
+    if not samples:
+        print('No sample selected in {}.'.format(args.manifest))
+        return 2
+    errors = validate(samples)
+    if errors:
+        print('{} errors in {}:'.format(len(errors), args.manifest))
+        print('\n'.join(errors[:50]) + ('\n...' if len(errors) > 50 else ''))
+        return 1
+    print('{} samples read from {}.'.format(len(samples), args.manifest))
+    if args.check:
+        return 0
+
+    unknown = [key for key in manifest['settings'] if key not in SETTINGS]
+    if unknown:
+        print('Unknown settings {} in {}. Available settings are: {}'.format(', '.join(unknown), args.manifest, ', '.join(SETTINGS)))
+        return 1
+    settings = dict(SETTINGS, **manifest['settings'])
+    for key, value in (('workers', args.workers), ('plots', args.plot_mode), ('plot_workers', args.plot_workers), ('results', args.results),
+                       ('profile', args.profile), ('incremental', args.incremental)):
+        if value is not None:
+            settings[key] = value
+    stages = STAGES if args.stages is None else args.stages
+    if 'export' not in stages:
+        samples = {name: dict(sample, Export=[]) for name, sample in samples.items()}
+    if 'plots' not in stages:
+        settings['plots'] = 'none'
+    if 'results' not in stages:
+        settings['results'] = None
+    import dsc_batch
+    failed = dsc_batch.run_batch(samples, version, date, **settings)
+    return 1 if failed else 0
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Binary export of the treated data, next to the exp- and raw_norm- text files written by DSC1.
+All runs of a sample are written in one file Output/pyDSC-<sample>.<ext>, with for each run the final data
+(T, Cp-baseline, Cp, baseline, error_baseline, H), the uncut normalized data (T, Cp) and the header of the text files.
+The formats are selected by the optional key Export of the sample definition (default 'text', i.e. only the text files):
+- npz:      numpy archive, one array per run and kind; np.load reads only the arrays which are accessed.
+- hdf5:     groups final and uncut with one dataset per run, the header as attribute. Requires h5py.
+- parquet:  one table with the columns run, kind and the data columns, one row group per run and kind. Requires pyarrow.
+A single run is read back with load, e.g.  data, header = dsc_export.load('rawdata/Output/pyDSC-P85.npz', 'P85_4')
+write_results writes the table of DH, peak position and Delta Cp of all runs of a batch (CSV and npz).
+"""
+import importlib.util
+import json
+import os
+import numpy as np
+
+FORMATS = {'text': None, 'npz': '.npz', 'hdf5': '.h5', 'parquet': '.parquet'}
+PACKAGES = {'hdf5': 'h5py', 'parquet': 'pyarrow'} #optional packages needed by the formats
+KINDS = ('final', 'uncut')
+
+
+def export_formats(params):
+    ''' Returns the export formats of the sample (optional key Export: a format or a list of formats, default text).'''
+    formats = params.get('Export', 'text')
+    if isinstance(formats, str):
+        formats = [f.strip() for f in formats.split(',')]
+    formats = [f.lower() for f in formats]
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown:
+        raise Exception('Unknown export formats {}. Available formats are: {}'.format(unknown, ', '.join(FORMATS)))
+    for f in formats: #checked before the analysis, not when the data are exported.
+        if f in PACKAGES and importlib.util.find_spec(PACKAGES[f]) is None:
+            raise ImportError('The {} export requires the {} package (pip install {}).'.format(f, PACKAGES[f], PACKAGES[f]))
+    return formats
+
+
+def columns(params):
+    ''' Names and units of the columns of the final and uncut data.'''
+    unit = 'mol' if 'Mw' in params else 'g'
+    return {'final': ['T [degC]', 'Cp-baseline [J/K/{}]'.format(unit), 'Cp [J/K/{}]'.format(unit), 'baseline [J/K/{}]'.format(unit),
+                      'error_baseline [J/K/{}]'.format(unit), 'H [J/{}]'.format(unit)],
+            'uncut': ['T [degC]', 'Cp [J/K/{}]'.format(unit)]}
+
+
+def export_binary(sample, files, data, data_uncut, params, header_heating, header_cooling, log=print):
+    ''' Writes the final data and the uncut normalized data of all sample runs in the binary formats selected by the key Export.
+    Returns the paths of the files written.'''
+    formats = [f for f in export_formats(params) if FORMATS[f]]
+    if not formats:
+        return []
+    log('\n', 15*'*', 'Exporting the binary data-set', 15*'*')
+    runs = [(str(i), 'heating', header_heating[i]) for i in files['S_heating']] + [(str(i), 'cooling', header_cooling[i]) for i in files['S_cooling']]
+    arrays = {'final': {str(i): np.asarray(data[i]) for i in files['S_heating'] + files['S_cooling']},
+              'uncut': {str(i): np.asarray(data_uncut[i]) for i in files['S_heating'] + files['S_cooling']}}
+    paths = []
+    for f in formats:
+        path = os.path.join(params['Folder'], 'Output', 'pyDSC-{}{}'.format(sample, FORMATS[f]))
+        {'npz': write_npz, 'hdf5': write_hdf5, 'parquet': write_parquet}[f](path, runs, arrays, columns(params))
+        log('File {} exported correctly'.format(path))
+        paths.append(path)
+    return paths
+
+
+def write_npz(path, runs, arrays, names):
+    ''' One uncompressed array per run and kind (e.g. final/P85_4), the headers as strings, the column names and the list of runs.'''
+    content = {'runs': np.array([run for run, direction, header in runs]), 'directions': np.array([direction for run, direction, header in runs])}
+    for kind in KINDS:
+        content['columns/' + kind] = np.array(names[kind])
+        for run in arrays[kind]:
+            content['{}/{}'.format(kind, run)] = arrays[kind][run]
+    for run, direction, header in runs:
+        content['header/' + run] = np.array(header)
+    np.savez(path, **content)
+
+
+def write_hdf5(path, runs, arrays, names):
+    ''' Groups final and uncut with one chunked dataset per run. Column names, direction and header of the run are attributes of the datasets.'''
+    import h5py
+    with h5py.File(path, 'w') as f:
+        for kind in KINDS:
+            group = f.create_group(kind)
+            for run, direction, header in runs:
+                dataset = group.create_dataset(run, data=arrays[kind][run], chunks=True)
+                dataset.attrs['columns'] = names[kind]
+                dataset.attrs['direction'] = direction
+                dataset.attrs['header'] = header
+
+
+def write_parquet(path, runs, arrays, names):
+    ''' One table with the columns run, kind and the final data columns (NaN for the columns missing in the uncut data).
+    Each run and kind is a row group, so that a single run is read with the filter run == name. The headers are stored in the metadata.'''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    metadata = {'pydsc_headers': json.dumps({run: header for run, direction, header in runs}),
+                'pydsc_directions': json.dumps({run: direction for run, direction, header in runs}),
+                'pydsc_columns': json.dumps(names)}
+    schema = pa.schema([('run', pa.string()), ('kind', pa.string())] + [(name, pa.float64()) for name in names['final']], metadata=metadata)
+    with pq.ParquetWriter(path, schema) as writer:
+        for kind in KINDS:
+            for run, direction, header in runs:
+                values = arrays[kind][run]
+                n = len(values)
+                table = {'run': [run]*n, 'kind': [kind]*n}
+                for k, name in enumerate(names['final']):
+                    table[name] = values[:,k] if k < values.shape[1] else np.full(n, np.nan)
+                writer.write_table(pa.table(table, schema=schema))
+
+
+def load(path, run, kind='final'):
+    ''' Reads a single run (kind final or uncut) from a file written by export_binary. Returns the data array and the header of the run.'''
+    if kind not in KINDS:
+        raise KeyError('Unknown kind {}. Available kinds are: {}'.format(kind, ', '.join(KINDS)))
+    ext = os.path.splitext(path)[1]
+    if ext == '.npz':
+        with np.load(path) as f:
+            return f['{}/{}'.format(kind, run)], str(f['header/' + run])
+    if ext == '.h5':
+        import h5py
+        with h5py.File(path, 'r') as f:
+            dataset = f[kind][run]
+            return dataset[()], dataset.attrs['header']
+    if ext == '.parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, filters=[('run', '=', run), ('kind', '=', kind)])
+        names = json.loads(table.schema.metadata[b'pydsc_columns'])[kind]
+        header = json.loads(table.schema.metadata[b'pydsc_headers'])[run]
+        return np.column_stack([table.column(name).to_numpy() for name in names]), header
+    raise ValueError('Unknown file type {}. Files written by export_binary end with {}'.format(ext, ', '.join(e for e in FORMATS.values() if e)))
+
+
+RESULT_FIELDS = ('sample', 'run', 'direction', 'DH', 'DH_err', 'DH_unit', 'T_peak', 'DCp', 'DCp_err', 'DCp_unit', 'iterations', 'residual', 'converged',
+                 'replicates', 'DH_ci_low', 'DH_ci_high', 'T_peak_ci_low', 'T_peak_ci_high', 'DCp_ci_low', 'DCp_ci_high',
+                 'DH_sweep_min', 'DH_sweep_max', 'DH_sweep_spread', 'folder')
+
+
+def write_results(rows, path):
+    ''' Writes the table of the results of all runs of the batch (one dictionary per run, see DSC1.baseline) as path.csv and path.npz.
+    The npz file contains the structured array table, with one field per column.'''
+    import csv
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path + '.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    dtype = []
+    for name in RESULT_FIELDS:
+        values = [row[name] for row in rows]
+        if all(isinstance(v, bool) for v in values): dtype.append((name, bool))
+        elif all(isinstance(v, int) and not isinstance(v, bool) for v in values): dtype.append((name, np.int64))
+        elif all(isinstance(v, float) for v in values): dtype.append((name, np.float64))
+        else: dtype.append((name, 'U{}'.format(max([len(str(v)) for v in values] + [1]))))
+    table = np.array([tuple(row[name] for name in RESULT_FIELDS) for row in rows], dtype=dtype)
+    np.savez(path + '.npz', table=table)
+    return table
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Follow mode of pyDSC: a sample run is analysed while the instrument is still writing it.
+The raw data file is polled every few seconds, only the bytes added since the last poll are decoded and converted,
+and the new rows are cut to the region of interest, converted and binned as in extract_data. After each update the binned run is corrected,
+normalized and, as soon as the regions before and after the peak (ROP_h or ROP_c) contain enough points, the baseline and DH are calculated.
+The follow mode stops when the file did not grow for timeout seconds, or with Ctrl+C.
+
+Usage, with the samples defined in dsc_input.py:  python3 dsc_follow.py <sample> <run> [interval in s]
+Cooling runs are binned starting from the first point of the run, the bins can differ slightly from those of the complete analysis.
+"""
+import codecs
+import contextlib
+import io
+import os
+import sys
+import time
+import numpy as np
+import DSC1 as dsc
+import dsc_read
+
+MIN_POINTS = 3 #minimum number of binned points before and after the peak region needed to calculate the baseline.
+
+
+def tail(path):
+    ''' Creates the dictionary describing the reading of the growing file path, used by read_lines and read_rows.'''
+    return {'path': path, 'offset': 0, 'raw': b'', 'decoder': None, 'encoding': None, 'pending': '', 'head': [], 'hl': None, 'body': []}
+
+
+def read_lines(state, final=False):
+    ''' Returns the complete lines added to the file since the last call, only the new bytes are read.
+    The encoding is detected from the first bytes of the file. The last line is kept until its end is written, unless final is True.'''
+    with open(state['path'], 'rb') as f:
+        f.seek(state['offset'])
+        raw = f.read()
+    state['offset'] += len(raw)
+    if state['decoder'] is None: #the first bytes are kept until there are enough of them to detect the encoding.
+        state['raw'] += raw
+        if len(state['raw']) < 1024 and not final:
+            return []
+        state['encoding'] = dsc_read.probe_encoding(state['raw'][:dsc_read.PREFIX_SIZE], final=final)
+        state['decoder'] = codecs.getincrementaldecoder(state['encoding'])(errors='replace')
+        raw, state['raw'] = state['raw'], b''
+    text = state['pending'] + state['decoder'].decode(raw, final=final)
+    cut = len(text) - 1 if text.endswith('\r') and not final else len(text) #a \r at the end could be followed by \n.
+    lines = dsc_read.split_lines(text[:cut])
+    state['pending'] = lines.pop() + text[cut:]
+    if final and state['pending']:
+        lines.append(state['pending'])
+        state['pending'] = ''
+    return lines
+
+
+def read_rows(state, params, final=False):
+    ''' Returns the array (3, n) with time, temperature and heatflow of the data lines added to the file since the last call.
+    Header, empty lines and comments are removed as in dsc_read; the last lines are kept back, they could be the footer of the file.'''
+    lines = read_lines(state, final)
+    if state['hl'] is None:
+        state['head'] += lines
+        try:
+            hl = dsc_read.header_length(state['head'], params['Dataformat'], params, state['path'])
+        except ValueError:
+            if len(state['head']) < 500 and not final: #the end of the header was not written yet.
+                return np.empty((3,0))
+            raise
+        if hl > len(state['head']) and not final:
+            return np.empty((3,0))
+        state['hl'] = hl
+        lines, state['head'] = state['head'][hl:], []
+    state['body'] += dsc_read.data_lines(lines, 0, skip_footer=0)
+    n = len(state['body']) - dsc_read.FOOTER_LENGTH
+    if n <= 0:
+        return np.empty((3,0))
+    rows = dsc_read.parse_columns(state['body'][:n], dsc_read.FORMATS[params['Dataformat']][1]).T
+    state['body'] = state['body'][n:]
+    return np.ascontiguousarray(rows)
+
+
+def analyse(stream, run, heating, files, refs, params):
+    ''' Correction, normalization and, if the peak region is covered, baseline of the binned run.
+    Returns the normalized data, the data with baseline (None if the baseline cannot be calculated yet) and the header of the run.'''
+    data_binned, stdev = dsc.binned_stream(stream)
+    if not heating and stream['step'] <= 0: #the run is binned from its first point, the cooling curves are flipped after binning.
+        data_binned, stdev = np.flip(data_binned, axis=1), np.flip(stdev)
+    header = {run: ''}
+    if len(data_binned[0,:]) < 2*MIN_POINTS:
+        return None, None, header
+    data = {run: dsc.binned_set(data_binned, stdev, params)}
+    data_c = dsc.correction(data, refs, files, params)
+    data_norm = dsc.normalize_sampleruns(files, data_c, params)
+    ROP = params['ROP_h'] if heating else params['ROP_c']
+    T = data_norm[run][:,0]
+    if np.count_nonzero(T < float(ROP[0])) < MIN_POINTS or np.count_nonzero(T > float(ROP[1])) < MIN_POINTS:
+        return data_norm, None, header
+    if heating:
+        data_final = dsc.baseline(data_norm, params, files, header, {})
+    else:
+        data_final = dsc.baseline(data_norm, params, files, {}, header)
+    return data_norm, data_final, header
+
+
+def follow(sample_input, run, version='', date='', interval=2.0, timeout=60.0, log=print):
+    ''' Follows the run (one of the heating or cooling runs of the sample definition sample_input) while it is written by the instrument.
+    After each update, the temperature reached and, when available, the DH are passed to log.
+    Returns the normalized data, the data with baseline (None if the peak region was never passed) and the header of the run.'''
+    if run in sample_input['Heating_runs']:
+        heating = True
+    elif run in sample_input['Cooling_runs']:
+        heating = False
+    else:
+        raise Exception('File {} is not one of the heating or cooling runs of the sample.'.format(run))
+    if sample_input['Dataformat'] not in dsc_read.FORMATS:
+        raise KeyError('Dataformat {} is not known. Available formats are: {}'.format(sample_input['Dataformat'], ', '.join(dsc_read.FORMATS)))
+    path = os.path.join(sample_input['Folder'], run)
+    start = time.time()
+    while not os.path.exists(path): #the instrument did not create the file yet.
+        if time.time() - start > timeout:
+            raise Exception("File {} does not exist. Please verify correct path and file name".format(path))
+        time.sleep(interval)
+
+    sample = dict(sample_input, Heating_runs=[run] if heating else [], Cooling_runs=[] if heating else [run])
+    with contextlib.redirect_stdout(io.StringIO()): #the references are read once, as in the complete analysis.
+        header_heating, header_cooling = dict(), dict()
+        files = dsc.read_files(version, date, sample, header_heating, header_cooling)
+        params = dsc.read_params(sample, header_heating, header_cooling)
+        references = dict(files, S_heating=[], S_cooling=[])
+        data, dataraw, data_uncut = dsc.extract_data(references, params, header_heating, header_cooling)
+        refs = dsc.average_refs(data, references)
+
+    ROI = params['ROI_h'] if heating else params['ROI_c']
+    stream = dsc.bin_stream(max(int(params['bins']), 1), step=dsc.bin_step(params))
+    state = tail(path)
+    result = (None, None, {run: ''})
+    log('Following file {}, updated every {} s. Press Ctrl+C to stop.'.format(path, interval))
+    size, changed, final = -1, time.time(), False
+    try:
+        while not final:
+            if os.path.getsize(path) != size:
+                size, changed = os.path.getsize(path), time.time()
+            elif time.time() - changed > timeout: #the file did not change for timeout seconds: the measurement is finished.
+                final = True
+            rows = read_rows(state, params, final)
+            if len(rows[0,:]):
+                rows = dsc.convert_units(rows, params)
+                dsc.add_to_bins(stream, rows[:, (float(ROI[0]) < rows[1,:]) & (float(ROI[1]) > rows[1,:])])
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = analyse(stream, run, heating, files, refs, params)
+                s = '{:.0f} s, {:.2f} degC'.format(rows[0,-1], rows[1,-1])
+                DH = [line for line in result[2][run].splitlines() if line.startswith('# DH')]
+                log(s + (': ' + DH[0][2:] if DH else ''))
+            if not final:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        log('Follow mode stopped.')
+    return result
+
+
+if __name__ == '__main__':
+    from dsc_input import samples
+    follow(samples[sys.argv[1]], sys.argv[2], interval=float(sys.argv[3]) if len(sys.argv) > 3 else 2.0)
@@ -1,3 +1,9 @@
+workers = 1 #Number of samples analysed in parallel. Use 0 to use all available processors.
+plots = 'inline' #When the plots are made: 'inline' (after each analysis step), 'parallel' (in separate processes, while the next samples are analysed), 'end' (after all samples are analysed) or 'none'.
+plot_workers = 2 #Number of processes making the plots in the modes 'parallel' and 'end'. Use 0 to use all available processors.
+profile = False #If True, wall time, CPU time, peak memory and array sizes of each stage are written in Output/profile_<sample>.json and .csv, with a summary at the end.
+results = 'pyDSC_results' #DH, peak position and Delta Cp of all runs are written at the end in pyDSC_results.csv and .npz (path relative to the folder pyDSC is run from, without extension). None to skip.
+incremental = False #If True, only the samples whose definition or raw data files changed since their last analysis (or whose exported files are missing or were rewritten by another sample) are analysed again, like make. The state is kept in Output/pyDSC_manifest.json.
 samples = {}   
 '''A dictionary which contains all the relevant information of the samples to be threated. 
 All samples defined here in will be analysed by pyDSC.
@@ -20,6 +26,7 @@ s_wt: 0.015 		#Concentration of the sample, in weight percent. 1% will be 0.01;
 Scanrate_h: 1.0		#Scanrate for the heating experiments, in K/min. If the data contain the time and temperature information, this line will be ignored. 
 Scanrate_c: 1.2 	#Scanrate for the cooling experiments, in K/min. If the data contain the time and temperature information, this line will be ignored.
 bins: 10 		#Size of the bins used to reduce the file size. i.e., a file of length N is reduced to N/bins, whereby bins number of points are averaged.
+Bin_step: 0		#[optional] If larger than 0, the points are averaged in temperature cells of Bin_step degrees instead of groups of bins points: runs measured with different sampling rates are then binned on the same temperature grid.
 ROP_h: 36.0, 85.0	#region where the peak is found in the heating scans
 ROP_c: 15.0, 42.0	#region where the peak is found in the cooling scans
 Mw: 157.21	#[optional]Provide Mw in g/mol for data in J/mol instead of J/g. 
@@ -29,6 +36,22 @@ Exo_in_plot: true	#(True or False) If True, an arrow indicating the Exo-up or Ex
 unit_time: s		#Unit in which the time is given, can be either min or s
 unit_temp: degC		#Unit in which the temperature is given, can be K or degC
 unit_power: mW		#Unit in which the heatflow is given, can be uW (microWatt), mW (milliWatt), or W (Watt)
+Baseline_tol: 1e-9	#[optional] Convergence criterion of the iterative baseline (relative change of DH and of the degree of conversion between two iterations). With 0, Baseline_maxiter iterations are always performed.
+Baseline_maxiter: 100	#[optional] Maximum number of iterations of the baseline.
+Baseline_batch: true	#[optional] If True, the baselines of the heating (or cooling) runs of equal length are calculated together, which is faster for many runs. False treats the runs one by one.
+Uncertainty_replicates: 0	#[optional] If larger than 0, number of Monte-Carlo replicates of each run: the noise around the baseline fits is resampled and the fits, the baseline and DH of all replicates are calculated, giving confidence intervals of DH, peak position and Delta Cp.
+Uncertainty_level: 0.95	#[optional] Confidence level of the Monte-Carlo intervals.
+Uncertainty_seed: 0	#[optional] Seed of the random numbers of the Monte-Carlo replicates, for reproducible intervals.
+ROP_sweep_h: [20,30,40,50,0.5]	#[optional] Sweep of the peak region of the heating runs: start from, start to, end from, end to, step in degC. DH is calculated for every peak region of the sweep and written in Output/sweep-<file>, with its spread in the header and in the results table.
+ROP_sweep_c: [20,30,40,50,0.5]	#[optional] Sweep of the peak region of the cooling runs, as ROP_sweep_h.
+Plots: raw, corrected, uncut, baseline, final, alpha	#[optional] Plots made for the sample (default all of them), False for none.
+Stream: false		#[optional] If True (or a number of lines per chunk), the datafiles are read in chunks and only the binned data are kept, for files too large for the memory. The files are then read twice and not cached.
+Read_workers: 4	#[optional] Number of threads reading the datafiles of the sample in parallel (default 4, 1 in the lean mode). 1 reads them one after the other.
+Cache: false		#[optional] (True, False or 'clear', default False) If True, the parsed raw data files are stored as .npy copies in the folder Cache of the data folder, next to the Output folder, and reused in the following runs. The folder is limited to 2 GB (dsc_cache.CACHE_MAX_SIZE), the least recently used files are deleted first. 'clear' deletes the cache before reading.
+Export: text, npz	#[optional] Formats of the exported data (default text): text writes the exp- and raw_norm- files, npz, hdf5 (needs h5py) and parquet (needs pyarrow) write all runs of the sample in one binary file Output/pyDSC-<sample>, see dsc_export.
+Lean: false		#[optional] If True, the analysis keeps fewer copies of the data: the files are parsed in chunks and read one at a time, cut and uncut data are views of one array, cut and uncut runs are normalized in one pass and the raw data are kept only for the raw plot. Same results, lower peak memory.
+Watch_h: P85_*.txt	#[optional] Pattern of the file names of new heating runs, for the watch mode (dsc_watch.py): each new file of Folder matching it is analysed alone with the parameters and references of this sample.
+Watch_c: 		#[optional] Same as Watch_h, for the cooling runs.
 '''
 
 
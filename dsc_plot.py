@@ -13,10 +13,10 @@ import os
 
 plt.rcParams['text.usetex'] = False
 
-def plot_raw_data(files, data, params, filename):
+def plot_raw_data(files, data, params, filename, log=print):
     ''' Plots the raw_data'''
     
-    print('\n', 15*'*', 'Plotting the raw data', 15*'*')
+    log('\n', 15*'*', 'Plotting the raw data', 15*'*')
     # print(params)
     def applyPlotStyle(title, idx):
         if params['unit_temp'] == 'degC':
@@ -88,9 +88,9 @@ def plot_raw_data(files, data, params, filename):
     
     
     
-def plot_corrected_data(files, data, params, filename):
+def plot_corrected_data(files, data, params, filename, log=print):
     ''' Plots the corrected data'''
-    print('\n', 15*'*', 'Plots the corrected data', 15*'*')
+    log('\n', 15*'*', 'Plots the corrected data', 15*'*')
     
     def applyPlotStyle(title, idx, Mw = True):
         ax.set_xlabel('Temperature / °C')
@@ -122,9 +122,9 @@ def plot_corrected_data(files, data, params, filename):
     plt.close(fig)
 
     
-def plot_final_data(files, data, params, filename):
+def plot_final_data(files, data, params, filename, log=print):
     ''' Plots the final data'''
-    print('\n', 15*'*', 'Plots the final data', 15*'*')
+    log('\n', 15*'*', 'Plots the final data', 15*'*')
     
     def applyPlotStyle(title, idx, kJ, Mw = True):
         ax.set_xlabel('Temperature / °C')
@@ -189,7 +189,7 @@ def plot_final_data(files, data, params, filename):
     plt.savefig(filename)
     plt.close(fig)
     
-def plot_uncut_data(files, data, params, sample):
+def plot_uncut_data(files, data, params, sample, log=print):
     
     def applyPlotStyle(title, ax1, ax2, Mw = True):
         ax1.set_xlabel('Temperature / °C')
@@ -225,9 +225,9 @@ def plot_uncut_data(files, data, params, sample):
     plt.close(fig)
     
     
-def plot_baseline_data(files, data, params, filename):
+def plot_baseline_data(files, data, params, filename, log=print):
     ''' Plots the baseline corrected data'''
-    print('\n', 15*'*', 'Plots the baseline corrected data', 15*'*')
+    log('\n', 15*'*', 'Plots the baseline corrected data', 15*'*')
     
     def applyPlotStyle(title, idx, Mw = True):
         ax.set_xlabel('Temperature / °C')
@@ -274,9 +274,9 @@ def plot_baseline_data(files, data, params, filename):
     plt.close(fig)
     
     
-def plot_alpha(files, data, params, filename):
+def plot_alpha(files, data, params, filename, log=print):
     ''' Plots the degree of conversion for all data'''
-    print('\n', 15*'*', 'Plots the degree of conversion for all data', 15*'*')
+    log('\n', 15*'*', 'Plots the degree of conversion for all data', 15*'*')
     
     
         #ax.legend(loc='upper left')
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Optional profiling of the analysis (profile = True in dsc_input).
+Each stage called by dsc_batch.process_sample (extract_data, check_data, correction, normalize_sampleruns, baseline, exports and plots)
+is run through record, which stores wall time, CPU time, peak resident memory (RSS) of the process and the size of the arrays returned.
+The stages returning one array per datafile also give one line per file with its array size; extract_data gives the reading time of each file.
+The profile of a sample is written as profile_<sample>.json and .csv in its Output folder, and a summary of the slowest stages
+is printed at the end of the batch. The peak RSS is the high-water mark of the process: it only grows, and is not available on Windows.
+"""
+import csv
+import json
+import os
+import sys
+import time
+import numpy as np
+try:
+    import resource
+except ImportError: #not available on Windows
+    resource = None
+
+FIELDS = ('sample', 'stage', 'file', 'wall_s', 'cpu_s', 'peak_rss_mb', 'rss_increase_mb', 'array_mb', 'shape')
+
+
+def peak_rss():
+    ''' Peak resident memory of the process, in MB (None if not available).'''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/1024**2 if sys.platform == 'darwin' else peak/1024 #bytes on macOS, kB on linux
+
+
+def array_sizes(result):
+    ''' Size of the arrays in result (an array, a dictionary of arrays indexed by the datafiles, or a tuple of them).
+    Returns the total size in bytes and a dictionary file -> (size in bytes, shape).'''
+    files = {}
+    def walk(item):
+        if isinstance(item, np.ndarray):
+            return item.nbytes
+        if isinstance(item, dict):
+            total = 0
+            for key, value in item.items():
+                size = walk(value)
+                if isinstance(value, np.ndarray):
+                    old = files.get(key, (0, ''))
+                    files[key] = (old[0] + size, '{}{}'.format(old[1] + ' ' if old[1] else '', 'x'.join(str(n) for n in value.shape)))
+                total += size
+            return total
+        if isinstance(item, (tuple, list)):
+            return sum(walk(value) for value in item)
+        return 0
+    return walk(result), files
+
+
+def record(records, sample, name, function, *args, **kwargs):
+    ''' Calls function(*args, **kwargs) and appends to records the profile of the stage name of the sample. Returns the result of the function.
+    For extract_data, the reading time of each file is collected through its keyword times.'''
+    times = {}
+    if name == 'extract_data':
+        kwargs = dict(kwargs, times=times)
+    rss0 = peak_rss()
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    result = function(*args, **kwargs)
+    wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+    rss = peak_rss()
+    total, files = array_sizes(result)
+    records.append({'sample': sample, 'stage': name, 'file': '', 'wall_s': round(wall, 6), 'cpu_s': round(cpu, 6),
+                    'peak_rss_mb': None if rss is None else round(rss, 1), 'rss_increase_mb': None if rss is None else round(rss - rss0, 1),
+                    'array_mb': round(total/1024**2, 3), 'shape': ''})
+    for file in sorted(set(files) | set(times), key=str):
+        size, shape = files.get(file, (0, ''))
+        records.append({'sample': sample, 'stage': name, 'file': str(file), 'wall_s': round(times[file], 6) if file in times else None, 'cpu_s': None,
+                        'peak_rss_mb': None, 'rss_increase_mb': None, 'array_mb': round(size/1024**2, 3), 'shape': shape})
+    return result
+
+
+def write(records, folder, sample):
+    ''' Writes the profile of the sample as profile_<sample>.json and profile_<sample>.csv in the folder.'''
+    path = os.path.join(folder, 'profile_{}'.format(sample))
+    with open(path + '.json', 'w') as f:
+        json.dump(records, f, indent=1)
+    with open(path + '.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+    return path
+
+
+def summary(records, top=10):
+    ''' Returns the summary of the profiles: wall time, CPU time and largest peak RSS of each stage, summed over the samples, slowest first.'''
+    stages = {}
+    for r in records:
+        if r['file']:
+            continue
+        s = stages.setdefault(r['stage'], {'wall_s': 0.0, 'cpu_s': 0.0, 'peak_rss_mb': None, 'calls': 0})
+        s['wall_s'] += r['wall_s']
+        s['cpu_s'] += r['cpu_s']
+        s['calls'] += 1
+        if r['peak_rss_mb'] is not None:
+            s['peak_rss_mb'] = max(s['peak_rss_mb'] or 0, r['peak_rss_mb'])
+    total = sum(s['wall_s'] for s in stages.values()) or 1.0
+    lines = ['{:24s} {:>6s} {:>10s} {:>6s} {:>10s} {:>12s}'.format('Stage', 'calls', 'wall (s)', '%', 'CPU (s)', 'peak RSS (MB)')]
+    for name, s in sorted(stages.items(), key=lambda item: -item[1]['wall_s'])[:top]:
+        lines.append('{:24s} {:6d} {:10.3f} {:6.1f} {:10.3f} {:>12s}'.format(name, s['calls'], s['wall_s'], 100*s['wall_s']/total, s['cpu_s'],
+                     '-' if s['peak_rss_mb'] is None else '{:.1f}'.format(s['peak_rss_mb'])))
+    return '\n'.join(lines)
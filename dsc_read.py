@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Fast reader for the raw DSC data files, used by extract_data in DSC1.py.
+The files are read once, the header and the footer are removed in memory and only the needed columns are converted to floats.
+The result is identical to the one obtained with np.genfromtxt(..., skip_footer=2, unpack=True, usecols=...):
+fields which cannot be converted (e.g. a second header line) are set to nan.
+"""
+import codecs
+import itertools
+import os
+import re
+import numpy as np
+
+#Definition of the supported data formats: (how the header length is found, columns read as time, temperature, heatflow)
+#'Furnace' -> the header ends one line after the line containing the word Furnace (Setaram files)
+#'Header_length' -> the header length is given by params['Header_length']
+#an integer -> fixed header length
+FORMATS = {'Setaram3': ('Furnace', (0,1,2)),
+           'Setaram3temptime': ('Furnace', (1,0,2)),
+           'Setaram4': ('Furnace', (1,2,3)),
+           '3cols': (1, (0,1,2)),
+           '3cols_variable_header': ('Header_length', (0,1,2)),
+           '3cols_variable_header_temp_power_time': ('Header_length', (2,0,1)),
+           '4cols_variable_header': ('Header_length', (1,2,3)),
+           'TA_temp_power_time': (1, (2,0,1))}
+
+ENCODINGS = ['utf-8', 'utf-16', 'latin1', 'cp1252'] #encodings tried, in this order, when the file has no byte order mark.
+PREFIX_SIZE = 65536 #number of bytes at the beginning of the file used to detect the encoding.
+_BOMS = [(codecs.BOM_UTF8, 'utf-8-sig'),
+         (codecs.BOM_UTF16_LE, 'utf-16'),
+         (codecs.BOM_UTF16_BE, 'utf-16')]
+_detected = {} #encodings already detected, indexed by the path of the file: path -> (size, modification time, encoding)
+
+FOOTER_LENGTH = 2 #number of (non empty) lines at the end of the files which are discarded.
+CHUNK_LINES = 1000000 #default number of data lines converted at once by read_chunks.
+
+_bad_row = re.compile(r'at row (\d+)') #used to locate the lines which np.loadtxt cannot convert.
+
+
+def probe_encoding(prefix, final=False):
+    ''' Detects the encoding of a file from the first bytes prefix. The byte order mark is checked first, then the encodings
+    in ENCODINGS are tried on the prefix. If final is False, the prefix may end in the middle of a character.'''
+    for bom, code in _BOMS:
+        if prefix.startswith(bom):
+            return code
+    if b'\x00' in prefix: #utf-16 without byte order mark, the position of the zero bytes gives the byte order.
+        return 'utf-16-le' if prefix[1::2].count(0) > prefix[0::2].count(0) else 'utf-16-be'
+    for code in ENCODINGS:
+        if code.startswith('utf-16'):
+            continue
+        try:
+            codecs.getincrementaldecoder(code)().decode(prefix, final=final)
+            return code
+        except UnicodeDecodeError:
+            None
+    raise ValueError('The encoding of the file could not be detected. Tried encodings: {}'.format(', '.join(ENCODINGS)))
+
+
+def detect_encoding(path):
+    ''' Returns the encoding of the file path, detected from its first PREFIX_SIZE bytes.
+    The result is remembered, files which did not change since the last call are not read again.'''
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    if key in _detected and _detected[key][:2] == (stat.st_size, stat.st_mtime_ns):
+        return _detected[key][2]
+    with open(path, 'rb') as f:
+        prefix = f.read(PREFIX_SIZE)
+    code = probe_encoding(prefix, final=len(prefix) < PREFIX_SIZE)
+    _detected[key] = (stat.st_size, stat.st_mtime_ns, code)
+    return code
+
+
+def probe_file(path, block=16*PREFIX_SIZE):
+    ''' Detects the encoding on the whole content of the file path, read in blocks of block bytes, and remembers it for detect_encoding.
+    Used when the encoding detected from the first bytes fails later in the file and the file is too large to be decoded at once.'''
+    stat = os.stat(path)
+    with open(path, 'rb') as f:
+        prefix = f.read(PREFIX_SIZE)
+    code = probe_encoding(prefix, final=len(prefix) < PREFIX_SIZE)
+    if code == 'utf-8-sig' or code.startswith('utf-16'): #byte order mark or zero bytes found.
+        None
+    else: #one of the 8 bit encodings, verified on the whole file.
+        for code in [c for c in ENCODINGS if not c.startswith('utf-16')]:
+            decoder = codecs.getincrementaldecoder(code)()
+            try:
+                with open(path, 'rb') as f:
+                    for raw in iter(lambda: f.read(block), b''):
+                        decoder.decode(raw)
+                decoder.decode(b'', final=True)
+                break
+            except UnicodeDecodeError:
+                None
+        else:
+            raise ValueError('The encoding of the file could not be detected. Tried encodings: {}'.format(', '.join(ENCODINGS)))
+    _detected[os.path.abspath(path)] = (stat.st_size, stat.st_mtime_ns, code)
+    return code
+
+
+def split_lines(text):
+    ''' Splits the text in lines, as done by python when reading the file with universal newlines (\\r\\n, \\r and \\n). '''
+    return text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+
+
+def header_length(lines, fmt, params, filename=''):
+    ''' Returns the number of lines to be skipped at the beginning of the file for the dataformat fmt.'''
+    rule = FORMATS[fmt][0]
+    if rule == 'Furnace':
+        for hl, line in enumerate(lines[:500], start=1):
+            if 'Furnace' in line.split():
+                return hl + 1
+        raise ValueError('Cannot import datafile {} correctly. The word Furnace was not found in the first 500 lines of the file.'.format(filename))
+    if rule == 'Header_length':
+        return int(params['Header_length'])
+    return rule
+
+
+def data_lines(lines, hl, skip_footer=FOOTER_LENGTH):
+    ''' Returns the lines containing data: the header, empty lines, comments and the last skip_footer lines are removed.'''
+    body = lines[hl:]
+    if any('#' in line for line in body):
+        body = [line for line in body if line.split('#', 1)[0].strip()]
+    else:
+        body = [line for line in body if line.strip()]
+    if skip_footer > 0:
+        body = body[:-skip_footer]
+    return body
+
+
+def _parse_tolerant(lines, usecols):
+    ''' Slow path: converts line by line, fields which are not numbers are set to nan (as np.genfromtxt does).'''
+    out = np.empty((len(lines), len(usecols)))
+    for k, line in enumerate(lines):
+        values = line.split('#', 1)[0].split()
+        for c, col in enumerate(usecols):
+            try:
+                out[k, c] = float(values[col])
+            except ValueError:
+                out[k, c] = np.nan
+            except IndexError:
+                raise ValueError('Line {} has {} columns, at least {} are needed.'.format(k, len(values), max(usecols)+1))
+    return out
+
+
+def parse_columns(lines, usecols):
+    ''' Converts the columns usecols of the data lines in an array of shape (len(lines), len(usecols)).
+    The fast C parser of numpy is used, only the lines which cannot be converted are treated one by one.'''
+    parts = []
+    start = 0
+    while start < len(lines):
+        try:
+            parts.append(np.loadtxt(lines[start:], usecols=usecols, ndmin=2, comments='#'))
+            break
+        except ValueError as e:
+            row = _bad_row.search(str(e))
+            if row is None: #older numpy versions do not report the row, everything is converted line by line.
+                parts.append(_parse_tolerant(lines[start:], usecols))
+                break
+            row = int(row.group(1))
+            if row > 0:
+                parts.append(np.loadtxt(lines[start:start+row], usecols=usecols, ndmin=2, comments='#'))
+            parts.append(_parse_tolerant(lines[start+row:start+row+1], usecols))
+            start += row + 1
+    if not parts:
+        return np.empty((0, len(usecols)))
+    return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+
+def read_text(text, params, filename=''):
+    ''' Converts the content of a raw data file in an array of shape (3, N) containing time, temperature and heatflow.'''
+    fmt = params['Dataformat']
+    if fmt not in FORMATS:
+        raise KeyError('Dataformat {} is not known. Available formats are: {}'.format(fmt, ', '.join(FORMATS)))
+    lines = split_lines(text)
+    hl = header_length(lines, fmt, params, filename)
+    body = data_lines(lines, hl)
+    return np.ascontiguousarray(parse_columns(body, FORMATS[fmt][1]).T)
+
+
+def read_file(path, params, encoding):
+    ''' Reads the raw data file path in a single pass and returns an array of shape (3, N) containing time, temperature and heatflow.'''
+    with open(path, 'rb') as f:
+        raw = f.read()
+    return read_text(raw.decode(encoding), params, path)
+
+
+def read_chunks(path, params, encoding, chunk_lines=CHUNK_LINES, columns=(0,1,2)):
+    ''' Reads the raw data file path in chunks of chunk_lines data lines, without loading the whole file in memory.
+    Yields arrays of shape (len(columns), n) with the requested columns (0: time, 1: temperature, 2: heatflow).
+    Header, footer, empty lines and comments are removed as in read_text, so that the chunks put together give the array returned by read_file.'''
+    fmt = params['Dataformat']
+    if fmt not in FORMATS:
+        raise KeyError('Dataformat {} is not known. Available formats are: {}'.format(fmt, ', '.join(FORMATS)))
+    usecols = tuple(FORMATS[fmt][1][c] for c in columns)
+    chunk_lines = max(int(chunk_lines), 1)
+    with open(path, 'r', encoding=encoding) as f: #universal newlines, as split_lines
+        head = list(itertools.islice(f, 500))
+        hl = header_length(head, fmt, params, path)
+        if hl > len(head): #header longer than the lines read so far
+            for _ in itertools.islice(f, hl - len(head)): None
+        lines = itertools.chain(head[hl:], f)
+        body = []
+        while True:
+            batch = list(itertools.islice(lines, chunk_lines))
+            if not batch:
+                break
+            body += data_lines(batch, 0, skip_footer=0)
+            while len(body) >= chunk_lines + FOOTER_LENGTH:
+                yield np.ascontiguousarray(parse_columns(body[:chunk_lines], usecols).T)
+                body = body[chunk_lines:] #the last lines are kept until the end of the file is reached, they could be the footer.
+        if FOOTER_LENGTH > 0:
+            body = body[:-FOOTER_LENGTH]
+        if body:
+            yield np.ascontiguousarray(parse_columns(body, usecols).T)
+
+
+def load(path, params):
+    ''' Reads the raw data file path with the detected encoding. Returns the array (3, N) containing time, temperature and heatflow
+    and the encoding used. If the detection from the first bytes was wrong, the encoding is detected again on the whole file content.'''
+    code = detect_encoding(path)
+    with open(path, 'rb') as f:
+        raw = f.read()
+    try:
+        text = raw.decode(code)
+    except UnicodeDecodeError:
+        code = probe_encoding(raw, final=True)
+        key = os.path.abspath(path)
+        _detected[key] = _detected[key][:2] + (code,)
+        text = raw.decode(code)
+    return read_text(text, params, path), code
+
+
+def load_chunked(path, params, chunk_lines=100000):
+    ''' Same as load, but the file is decoded and parsed in chunks of chunk_lines lines (see read_chunks) which are then put together,
+    so that the memory needed for the text of the file does not grow with its length. Used by the lean mode of DSC1.'''
+    code = detect_encoding(path)
+    try:
+        chunks = list(read_chunks(path, params, code, chunk_lines))
+    except UnicodeDecodeError: #the encoding detected from the first bytes does not fit the rest of the file.
+        code = probe_file(path)
+        chunks = list(read_chunks(path, params, code, chunk_lines))
+    if not chunks:
+        raise ValueError('No data found in file {} with the format {}'.format(path, params['Dataformat']))
+    tmp = chunks[0] if len(chunks) == 1 else np.concatenate(chunks, axis=1)
+    return tmp, code
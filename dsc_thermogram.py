@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Object model and library API of pyDSC, to use the analysis from other programs (e.g. a LIMS) without dsc_input and the main script.
+analyse runs the complete analysis of one sample definition (the same dictionary as in dsc_input) and returns a Thermogram:
+the runs of the sample, each a Run holding its data in one contiguous array allocated once, with one row per named column (ROWS):
+the corrected binned data (CORRECTED_COLUMNS) followed by the final data (COLUMNS). The stages of DSC1 (correction, normalization,
+baseline) write in this array (keyword out) instead of allocating their own arrays, and each named column (run['Cp'],
+run.corrected_column('heatflow')) is a contiguous view of it. The normalized data on the full temperature range, which has
+its own temperature points, is a second contiguous array of the run (UNCUT_COLUMNS).
+
+    import dsc_thermogram
+    thermogram = dsc_thermogram.analyse(sample_definition, 'P85')
+    for run in thermogram:
+        print(run.name, run.direction, run.DH, run.T_peak)
+        T, Cp = run['T'], run['Cp_baseline']
+
+The stages can also be run on a single Run: run.correct, run.normalize and run.subtract_baseline.
+Nothing is written to disk unless export (the formats of the key Export) or plots are requested, apart from the Output folder which is
+created if missing, and the cache of the raw data files if the key Cache of the definition is True (see dsc_cache).
+The console output of the analysis is passed to log (default: discarded).
+"""
+import io
+import numpy as np
+import dsc_batch
+
+CORRECTED_COLUMNS = ('time', 'T', 'heatflow', 'stdev', 'heatrate') #binned data corrected for empty cell and buffer
+COLUMNS = ('T', 'Cp_baseline', 'Cp', 'baseline', 'error_baseline', 'H') #final data
+ROWS = CORRECTED_COLUMNS + COLUMNS #rows of the array of a run
+FINAL = len(CORRECTED_COLUMNS) #first row of the final data
+UNCUT_COLUMNS = ('T', 'Cp') #normalized data on the full temperature range
+
+
+class Run:
+    ''' One heating or cooling run of a sample, with points binned points (uncut_points on the full temperature range).
+    array (ROWS, points) holds the corrected binned data and the final data, uncut (UNCUT_COLUMNS, uncut_points) the normalized data
+    on the full temperature range. Both are allocated once; the stages write in them through the views corrected, normalized and final,
+    which have the layout of the arrays of DSC1. header is the header of the exported file, results the results of the baseline
+    (see DSC1.run_results), sweep the sweep of the peak region (see DSC1.rop_sweep, None if not requested).'''
+    __slots__ = ('name', 'direction', 'array', 'uncut', 'header', 'results', 'sweep')
+
+    def __init__(self, name, direction, points, uncut_points=0, header=''):
+        self.name = name
+        self.direction = direction
+        self.array = np.zeros((len(ROWS), points))
+        self.uncut = np.zeros((len(UNCUT_COLUMNS), uncut_points))
+        self.header = header
+        self.results = {}
+        self.sweep = None
+
+    def __getitem__(self, column):
+        return self.array[FINAL + COLUMNS.index(column)]
+
+    def __len__(self):
+        return self.array.shape[1]
+
+    def __repr__(self):
+        return 'Run({!r}, {}, {} points, DH={})'.format(self.name, self.direction, len(self), self.results.get('DH'))
+
+    def corrected_column(self, column):
+        ''' Column of the corrected binned data (time, T, heatflow, stdev or heatrate), a contiguous view.'''
+        return self.array[CORRECTED_COLUMNS.index(column)]
+
+    def uncut_column(self, column):
+        ''' Column of the uncut normalized data (T or Cp), a contiguous view.'''
+        return self.uncut[UNCUT_COLUMNS.index(column)]
+
+    @property
+    def corrected(self):
+        ''' Corrected binned data, (5, points), in the layout of DSC1.correction. A view.'''
+        return self.array[:FINAL]
+
+    def normalized(self):
+        ''' Normalized data (T, Cp), (points, 2), in the layout of DSC1.normalize_runs. A view of the rows T and Cp of the final data.'''
+        return self.array[FINAL:FINAL + 3:2].T
+
+    def uncut_normalized(self):
+        ''' Uncut normalized data, (uncut_points, 2), in the layout of DSC1.normalize_runs. A view.'''
+        return self.uncut.T
+
+    def final(self):
+        ''' Final data in the layout of DSC1.baseline and of the exported files, (points, 6). A view.'''
+        return self.array[FINAL:].T
+
+    def files(self):
+        ''' Dictionary of the sample runs, as built by DSC1.read_files, containing only this run.'''
+        return {'S_heating': [self.name] if self.direction == 'heating' else [], 'S_cooling': [self.name] if self.direction == 'cooling' else []}
+
+    def correct(self, binned, references, params):
+        ''' Stage DSC1.correction: corrects the binned data (5, points) of the run for the references (see Thermogram.references), in the array of the run.'''
+        import DSC1 as dsc
+        dsc.correction({self.name: binned}, references, self.files(), params, {self.name: self.corrected})
+
+    def normalize(self, params, uncut=None):
+        ''' Stage DSC1.normalize_runs: normalizes the corrected data and, if given, the binned data on the full temperature range uncut (5, uncut_points).'''
+        import DSC1 as dsc
+        datasets, out = [{self.name: self.corrected}], [{self.name: self.normalized()}]
+        if uncut is not None:
+            datasets.append({self.name: uncut})
+            out.append({self.name: self.uncut_normalized()})
+        dsc.normalize_runs(self.files(), datasets, params, out)
+
+    def subtract_baseline(self, params):
+        ''' Stage DSC1.baseline: iterative baseline of the normalized data, written in the final data. Updates header, results and sweep.'''
+        import DSC1 as dsc
+        headers = {self.name: self.header}
+        results, sweeps = {}, {}
+        dsc.baseline({self.name: self.normalized()}, params, self.files(), headers if self.direction == 'heating' else {},
+                     headers if self.direction == 'cooling' else {}, results, sweeps, {self.name: self.final()})
+        self.header, self.results, self.sweep = headers[self.name], results[self.name], sweeps.get(self.name)
+
+    def sweep_rop(self, lows, highs, tol=1e-9, maxiter=100):
+        ''' DH of the run for every peak region (low, high) of the arrays lows and highs, calculated from the final data
+        without reading or plotting anything again. Returns the dictionary of DSC1.rop_sweep.'''
+        import DSC1 as dsc
+        return dsc.rop_sweep(self['T'], self['Cp'], lows, highs, self.DH, tol, maxiter)
+
+    @property
+    def DH(self):
+        return self.results.get('DH')
+
+    @property
+    def DH_err(self):
+        return self.results.get('DH_err')
+
+    @property
+    def T_peak(self):
+        return self.results.get('T_peak')
+
+    @property
+    def DCp(self):
+        return self.results.get('DCp')
+
+    @property
+    def converged(self):
+        return self.results.get('converged')
+
+
+class Thermogram:
+    ''' All runs of a sample, in the order of the heating and then of the cooling runs of the definition.
+    Iterating gives the runs, thermogram[name] the run of the datafile name. params are the parameters read by DSC1.read_params,
+    references the averaged reference runs (EC_heating, B_heating, EC_cooling, B_cooling, empty arrays if not measured).'''
+    __slots__ = ('sample', 'params', 'runs', 'references')
+
+    def __init__(self, sample, params, runs=(), references=None):
+        self.sample = sample
+        self.params = params
+        self.runs = {str(run.name): run for run in runs}
+        self.references = references or {}
+
+    def __getitem__(self, name):
+        return self.runs[str(name)]
+
+    def __iter__(self):
+        return iter(self.runs.values())
+
+    def __len__(self):
+        return len(self.runs)
+
+    def __repr__(self):
+        return 'Thermogram({!r}, {} heating and {} cooling runs)'.format(self.sample, len(self.heating), len(self.cooling))
+
+    @property
+    def heating(self):
+        return [run for run in self if run.direction == 'heating']
+
+    @property
+    def cooling(self):
+        return [run for run in self if run.direction == 'cooling']
+
+    def rows(self):
+        ''' Results of the runs, one dictionary per run, as in the results table of the batch (dsc_export.write_results).'''
+        return [dict(sample=self.sample, run=run.name, folder=self.params.get('Folder'), **run.results) for run in self]
+
+
+def allocate(files, data, data_uncut):
+    ''' Returns a dictionary name -> Run with the arrays of the sample runs of files, sized after their binned data (data and data_uncut, see DSC1.extract_data).'''
+    runs = {}
+    for key, direction in (('S_heating', 'heating'), ('S_cooling', 'cooling')):
+        for i in files[key]:
+            runs[i] = Run(str(i), direction, np.shape(data[i])[1], np.shape(data_uncut[i])[1])
+    return runs
+
+
+def from_analysis(sample, state):
+    ''' Builds the Thermogram of the sample from the dictionary state filled by dsc_batch.process_sample (keyword keep), whose stages
+    were written in the arrays of the runs.'''
+    files = state['files']
+    runs = []
+    for key, headers in (('S_heating', state['header_heating']), ('S_cooling', state['header_cooling'])):
+        for i in files[key]:
+            run = state['runs'][i]
+            run.header, run.results, run.sweep = headers[i], state['results'].get(i, {}), state['sweeps'].get(i)
+            runs.append(run)
+    return Thermogram(sample, state['params'], runs, state['refs'])
+
+
+def analyse(sample_input, sample='sample', version='', date='', export=False, plots=False, log=None):
+    ''' Runs the complete analysis of the sample definition sample_input (a dictionary as the samples of dsc_input) and returns its Thermogram.
+    If export is True, the files selected by the key Export (default the text files) are written in the Output folder; if plots is True,
+    the plots selected by the key Plots are made. The console output of the analysis is passed to log, if given.
+    The errors which stop the main script (sys.exit in DSC1, e.g. a wrong Dataformat) are raised as RuntimeError, with the same message.'''
+    sample_input = dict(sample_input, Plots=sample_input.get('Plots', True) if plots else False, Export=sample_input.get('Export', 'text') if export else [])
+    state = {}
+    output = io.StringIO()
+    def capture(*args, **kwargs): #messages written in output, sys.stdout is left untouched (analyses may run in other threads).
+        print(*args, file=output, **kwargs)
+    try:
+        dsc_batch.process_sample(sample, sample_input, version, date, keep=state, log=capture)
+    except SystemExit as e: #an embedding program must not be stopped by the analysis of one sample.
+        raise RuntimeError('Analysis of sample {} failed: {}'.format(sample, e.code)) from None
+    finally:
+        if log is not None:
+            log(output.getvalue())
+    return from_analysis(sample, state)
+
+
+def analyse_all(samples, version='', date='', export=False, plots=False, log=None):
+    ''' Runs analyse for every sample of the dictionary samples. Returns a dictionary sample -> Thermogram.'''
+    return {sample: analyse(samples[sample], sample, version, date, export, plots, log) for sample in samples}
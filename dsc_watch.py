@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Watch mode of pyDSC: the data folders of the samples are watched for new or changed raw data files, which are analysed as soon as
+the instrument has finished writing them. A sample definition of dsc_input is watched if it has the optional key Watch_h and/or Watch_c,
+a filename pattern (e.g. 'P85_*.txt', or a list of patterns) of its heating or cooling runs. Each new file matching the pattern is analysed
+alone, with the references and parameters of the sample definition, as the sample <sample>_<file name without extension>.
+A file is queued when its size and modification time did not change for one polling interval. The queued files are analysed by a pool of
+workers processes, running the complete analysis of dsc_batch.process_sample; at most queue analyses are submitted at once, the other files wait.
+The analysed files are recorded in the manifest of dsc_build (Output/pyDSC_manifest.json): after a restart, the files already analysed are
+skipped, unless their content, the sample definition or the version of pyDSC changed. A file whose analysis failed is tried again when it changes.
+The watch mode stops with Ctrl+C, or after idle seconds without new files.
+
+Usage, with the samples defined in dsc_input.py:  python3 dsc_watch.py [interval in s]
+"""
+import collections
+import fnmatch
+import glob
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import dsc_batch
+import dsc_build
+import dsc_export
+
+WATCH_KEYS = (('Watch_h', 'Heating_runs'), ('Watch_c', 'Cooling_runs')) #pattern key -> runs of the analysed sample
+REFERENCE_KEYS = ('Empty_cell_heat_runs', 'Empty_cell_cool_runs', 'Buffer_heat_runs', 'Buffer_cool_runs')
+
+
+def patterns(sample_input):
+    ''' Returns the list of (pattern, runs key) of the sample definition, empty if the sample is not watched.'''
+    found = []
+    for key, runs in WATCH_KEYS:
+        pattern = sample_input.get(key)
+        if not pattern:
+            continue
+        for p in ([pattern] if isinstance(pattern, str) else pattern):
+            found.append((p, runs))
+    return found
+
+
+def candidates(samples):
+    ''' Returns the files of the data folders matching the patterns of the samples: a dictionary path -> list of (sample, runs key).
+    The reference runs of a sample are never analysed as its sample runs.'''
+    found = {}
+    listed = {} #content of each folder, listed once per poll
+    for sample, sample_input in samples.items():
+        folder = sample_input['Folder']
+        if folder not in listed:
+            try:
+                listed[folder] = sorted(entry.name for entry in os.scandir(folder) if entry.is_file())
+            except OSError: #folder not available, e.g. a network drive which is not mounted.
+                listed[folder] = []
+        references = {str(j) for key in REFERENCE_KEYS for j in sample_input.get(key, [])}
+        for name in listed[folder]:
+            if name in references:
+                continue
+            for pattern, runs in patterns(sample_input):
+                if fnmatch.fnmatch(name, pattern):
+                    found.setdefault(os.path.join(folder, name), []).append((sample, runs))
+                    break
+    return found
+
+
+def job(sample, sample_input, name, runs):
+    ''' Returns the name and the definition of the sample analysing the file name as its only heating or cooling run (runs key).'''
+    job_input = {key: value for key, value in sample_input.items() if key not in ('Watch_h', 'Watch_c')}
+    job_input.update(Heating_runs=[], Cooling_runs=[])
+    job_input[runs] = [name]
+    return '{}_{}'.format(sample, os.path.splitext(name)[0]), job_input
+
+
+def watch(samples, version, date, workers=1, interval=5.0, queue=None, idle=None, results=None, log=print):
+    ''' Watches the data folders of the samples with the keys Watch_h or Watch_c and analyses the new or changed files matching their patterns.
+    The folders are polled every interval seconds; workers processes analyse the files, at most queue (default 2*workers) at once.
+    The watch stops after idle seconds without new files (None: never) or with Ctrl+C. If results is given, the results table of all files
+    analysed, or skipped because already analysed, is written after each analysis (see dsc_export.write_results).
+    Returns a dictionary with the error message of the files which failed.'''
+    watched = {sample: samples[sample] for sample in samples if patterns(samples[sample])}
+    if not watched:
+        raise Exception('No sample is watched: add the optional key Watch_h or Watch_c (pattern of the file names) to the sample definitions.')
+    workers = max(int(workers or os.cpu_count() or 1), 1)
+    queue = max(int(queue or 2*workers), 1)
+    stats = {} #size and modification time of each file at the last poll
+    queued = {} #size and modification time of each file when it was queued
+    waiting = collections.deque() #(name, definition, state) of the files waiting for a free place in the pool
+    running = {} #future -> (name, definition, state)
+    rows = {} #results of each analysed file
+    failed = {}
+    last = time.time()
+    log('Watching {} samples in {}, polled every {} s. Press Ctrl+C to stop.'.format(len(watched), ', '.join(sorted({s['Folder'] for s in watched.values()})), interval))
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=dsc_batch._init_worker)
+    try:
+        while True:
+            for path, matches in candidates(watched).items():
+                try:
+                    stat = os.stat(path)
+                except OSError: #deleted in the meantime.
+                    continue
+                stat = (stat.st_size, stat.st_mtime_ns)
+                previous, stats[path] = stats.get(path), stat
+                if stat != previous or queued.get(path) == stat: #still written by the instrument, or already queued.
+                    continue
+                queued[path] = stat
+                last = time.time()
+                for sample, runs in matches:
+                    name, job_input = job(sample, watched[sample], os.path.basename(path), runs)
+                    state = dsc_build.sample_state(name, job_input, version, {'plots': True})
+                    entry = dsc_build.up_to_date(name, job_input, state)
+                    if entry is not None:
+                        rows[name] = entry['rows']
+                        continue
+                    waiting.append((name, job_input, state))
+                    log('File {} queued as sample {}.'.format(path, name))
+
+            busy = {running[future][0] for future in running}
+            for item in list(waiting): #a sample is never analysed twice at the same time, its outputs would be mixed.
+                if len(running) >= queue:
+                    break
+                if item[0] not in busy:
+                    waiting.remove(item)
+                    busy.add(item[0])
+                    running[pool.submit(dsc_batch._run_captured, item[0], item[1], version, date)] = item
+
+            if running:
+                finished = wait(running, timeout=interval, return_when=FIRST_COMPLETED)[0]
+            else:
+                time.sleep(interval)
+                finished = set()
+            for future in finished:
+                name, job_input, state = running.pop(future)
+                sample, output, error, plots, records, job_rows = future.result()
+                log('\n' + 15*'=' + ' Sample {} '.format(name) + 15*'=')
+                log(output)
+                if error is not None:
+                    failed[name] = error
+                    log(error)
+                    log(5*'*' + ' Sample {} failed. '.format(name) + 5*'*')
+                    continue
+                failed.pop(name, None)
+                dsc_build.record(name, job_input, state, job_rows)
+                rows[name] = job_rows
+                if results:
+                    dsc_export.write_results([row for n in sorted(rows) for row in rows[n]], results)
+            if finished:
+                last = time.time()
+            if idle is not None and not running and not waiting and time.time() - last > idle:
+                break
+    except KeyboardInterrupt:
+        log('Watch mode stopped.')
+    finally:
+        pool.shutdown(cancel_futures=True)
+    return failed
+
+
+if __name__ == '__main__':
+    import dsc_input
+    version, date = 'unknown', ''
+    for script in glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pyDSC_v*.py')): #version of the main script, part of the hash of the samples.
+        with open(script, encoding='utf-8') as f:
+            found = re.search(r"^version = '(.+)'\ndate = '(.+)'", f.read(), re.M)
+        if found:
+            version, date = found.groups()
+    results = getattr(dsc_input, 'results', None)
+    watch(dsc_input.samples, version, date, workers=getattr(dsc_input, 'workers', 1) or None, interval=float(sys.argv[1]) if len(sys.argv) > 1 else 5.0,
+          results=results + '_watch' if results else None) #the table of the batch is not overwritten.
@@ -15,44 +15,52 @@ in correction module of DSC1.py.
 2023.07.13 Leo: Small bug corrections in export function.
 2024.09.02 Leo: Small bug corrections in plot functions.
 2024.09.02 Leo: Updated cumtrapz function from scipy integrate.
+2026.10.18: Raw data files are read in a single pass by dsc_read.py instead of np.genfromtxt.
+2026.10.18: The encoding of the raw data files is detected once per file from its first bytes.
+2026.10.18: Optional cache of the parsed raw data files, as .npy copies in the folder Cache of the data folder, limited to 2 GB (key Cache, off by default).
+2026.10.18: The analysis of a sample is moved to dsc_batch.py. Samples can be treated in parallel (workers in dsc_input).
+2026.10.18: The datafiles of a sample are read in parallel threads (optional key Read_workers).
+2026.10.18: The iterative baseline stops when converged (Baseline_tol, Baseline_maxiter). linregress called with x and y for scipy>=1.14.
+2026.10.18: The baseline of heating (or cooling) runs of equal length is calculated in one batch (batch_baseline, optional key Baseline_batch).
+2026.10.18: Long datafiles can be read in chunks, only the binned data are kept in memory (optional key Stream in dsc_input).
+2026.10.18: Vectorized binning. Optional binning on a fixed temperature step (optional key Bin_step in dsc_input).
+2026.10.18: Follow mode (dsc_follow.py): a run is analysed while it is written by the instrument.
+2026.10.18: Plots can be made in parallel processes, at the end of the batch or skipped (plots, plot_workers in dsc_input, optional key Plots).
+2026.10.18: scipy subpackages and matplotlib are imported only by the stages using them. Fixed the scipy version check (string comparison).
+2026.10.18: Synthetic scans with known DH (benchmarks/synthetic.py) and scaling benchmark of the whole analysis (benchmarks/bench_pipeline.py).
+2026.10.18: Optional profile of wall time, CPU time, peak memory and array sizes of each stage (dsc_profile.py, profile in dsc_input).
+2026.10.18: Optional binary export of all runs of a sample in one npz, hdf5 or parquet file (dsc_export.py, optional key Export). Text files written in one pass.
+2026.10.18: DH, peak position and Delta Cp of all runs are returned by baseline and written in one results table (pyDSC_results.csv and .npz, results in dsc_input).
+2026.10.18: Reference runs (empty cell, buffer) are binned once and shared by the samples of a batch and, through the cache, by the following runs. Interpolants of the references are shared too.
+2026.10.18: One correction path for heating and cooling (correct_runs): references interpolated on all runs in one call. Fixed the crash of the empty cell + buffer correction (mass_s[0], s_wt[0]).
+2026.10.18: Lean mode (optional key Lean): fewer copies of the raw data, files parsed in chunks, one normalization pass for cut and uncut data. Same results, about a quarter of the peak memory.
+2026.10.18: Incremental batch (incremental in dsc_input): samples whose definition, raw data files and pyDSC version did not change are skipped, see dsc_build.
+2026.10.18: Watch mode (dsc_watch.py): new raw data files matching Watch_h or Watch_c are analysed by a pool of workers, files already analysed are skipped after a restart.
+2026.10.18: Library API (dsc_thermogram.analyse): the runs of a sample are returned as Run objects, each holding one contiguous array written in place by the stages, with one row per named column.
+2026.10.18: Command line with manifest files (TOML, JSON, CSV): python3 pyDSC_v1.2.3.py samples.toml [--samples ...] [--set ...] [--stages ...] [--workers N], see dsc_cli.
+2026.10.18: Optional Monte-Carlo uncertainty of DH, peak position and Delta Cp (Uncertainty_replicates), all replicates calculated in one batched pass.
+2026.10.18: Optional sweep of the peak region (ROP_sweep_h, ROP_sweep_c): DH map of all peak regions calculated in one batched pass, with its spread.
 """
 
 version = '1.2.3'
 date = '2024.09.02'
 
 
-import DSC1 as dsc #imports the dsc1.py script, where all used functions are stored. 
-import dsc_plot as plot
+import sys
+import dsc_batch
+import dsc_input
 from dsc_input import samples as input_data
-import os
-from pathlib import Path
-import numpy as np
 
 
-for sample in input_data:
-    header_heating = dict() #Dictionary containing the headers of the exported heating files
-    header_cooling = dict() #Dictionary containing the headers of the exported cooling files
-    
-    files = dsc.read_files(version,date,input_data[sample], header_heating, header_cooling)  #creates a dictionary which contains all filenames used by the script
-    params = dsc.read_params(input_data[sample], header_heating, header_cooling) #reads from the input files the parameters necessary to analyse the data, from the masses to the definiton of the temperature ranges 
-    Path(os.path.join(params['Folder'],'Output')).mkdir(parents=True, exist_ok=True)  #creates the output file directory.
-    data, dataraw, data_uncut = dsc.extract_data(files, params, header_heating, header_cooling) #creates an array which contains all the data values within the ROIs and already binned. 
-    # print(np.shape(data_uncut['myoglobin_cell1_scan2.txt']))
-    dsc.check_data(data, files, params, header_heating, header_cooling) #veryfies that all input values are correct. 
-    plot.plot_raw_data(files, dataraw, params, sample) #plots the raw data. 
-    refs = dsc.average_refs(data, files) #averages the reference measurements. If the size of the reference measurements does not fit, only the longest one is considered. 
-    #refs is a dictionary containing the reference measurements.
-    data_c = dsc.correction(data, refs, files, params)
-    plot.plot_corrected_data(files, data_c, params, sample) #plots the raw data corrected for empty cell and buffer, if reference files are provided. 
-    
-    data_norm = dsc.normalize_sampleruns(files, data_c, params)
-    data_uncut_norm = dsc.normalize_sampleruns(files, data_uncut, params)
-    plot.plot_uncut_data(files, data_uncut_norm, params, sample)
-    dsc.export_uncut_data(files, data_uncut_norm, params, header_heating, header_cooling)
-    data_final = dsc.baseline(data_norm, params, files,header_heating, header_cooling) 
-    plot.plot_baseline_data(files, data_final, params, sample)
-    plot.plot_final_data(files, data_final, params, sample)
-    plot.plot_alpha(files, data_final, params, sample)
-
-    dsc.export_final_data(files, data_final, params, header_heating, header_cooling)
-    
+if __name__ == '__main__':
+    if len(sys.argv) > 1: #samples read from a manifest file, see dsc_cli.
+        import dsc_cli
+        sys.exit(dsc_cli.main(sys.argv[1:], version, date))
+    workers = getattr(dsc_input, 'workers', 1) #number of samples treated in parallel, defined in dsc_input.
+    plots = getattr(dsc_input, 'plots', 'inline') #when the plots are made, see dsc_batch.
+    plot_workers = getattr(dsc_input, 'plot_workers', 1)
+    profile = getattr(dsc_input, 'profile', False) #time and memory profile of each stage, see dsc_profile.
+    results = getattr(dsc_input, 'results', 'pyDSC_results') #table of the results of all runs, written as .csv and .npz.
+    incremental = getattr(dsc_input, 'incremental', False) #only the samples which changed are analysed, see dsc_build.
+    failed = dsc_batch.run_batch(input_data, version, date, workers=workers, plots=plots, plot_workers=plot_workers, profile=profile, results=results, incremental=incremental)
+    sys.exit(1 if failed else 0) #exit code 1 if samples (or plots) failed, as with a manifest.